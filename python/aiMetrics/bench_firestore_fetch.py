@@ -0,0 +1,96 @@
+"""
+Benchmark: sequential vs pooled vs collection-group token reads (eai_cost_analysis.py).
+
+Runs against the Firestore emulator only - it seeds a synthetic dataset of
+products_new/materials parents with pn_tokens/m_tokens sub-collections:
+
+    firebase emulators:start --only firestore
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python bench_firestore_fetch.py --parents 500 --tokens 8
+
+Every strategy must produce the same per-cfName averages.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from google.cloud import firestore
+
+from eai_cost_analysis import query_parents, stream_tokens
+from firestore_fetch import FETCH_WORKERS, CostAggregator
+
+PROJECT_ID = "demo-bench"
+CF_NAMES = ["cf2", "cf3", "cf5", "apcfSupplierFinder", "apcfMPCF", "apcfSDCF"]
+CUTOFF = datetime(2025, 11, 21, 0, 0, 0, tzinfo=timezone.utc)
+
+
+def seed(db, parents, tokens, seed_value=0):
+    """Writes `parents` products and materials (a quarter before the cut-off), each with `tokens` tokens."""
+    rng = random.Random(seed_value)
+    batch, pending = db.batch(), 0
+    for collection, sub in (("products_new", "pn_tokens"), ("materials", "m_tokens")):
+        for i in range(parents):
+            created = CUTOFF + timedelta(days=rng.randint(-30, 30) if i % 4 == 0 else rng.randint(0, 30))
+            parent = db.collection(collection).document(f"bench-{i:06d}")
+            batch.set(parent, {"name": f"{collection} {i}", "createdAt": created})
+            pending += 1
+            for j in range(tokens):
+                batch.set(parent.collection(sub).document(f"t{j:03d}"), {
+                    "cfName": rng.choice(CF_NAMES),
+                    "totalCost": round(rng.uniform(0.0001, 0.5), 6),
+                    "createdAt": created + timedelta(minutes=j),
+                })
+                pending += 1
+                if pending >= 450:
+                    batch.commit()
+                    batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+
+
+def run(db, mode, workers):
+    aggregator = CostAggregator()
+    start = time.perf_counter()
+    for _, token in stream_tokens(db, query_parents(db, CUTOFF), mode, CUTOFF, workers):
+        data = token.to_dict() or {}
+        aggregator.add(data.get("cfName"), data.get("totalCost"))
+    return time.perf_counter() - start, aggregator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Firestore token fetch strategies on the emulator.")
+    parser.add_argument("--parents", type=int, default=300, help="Parents per collection")
+    parser.add_argument("--tokens", type=int, default=6, help="Tokens per parent")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--no-seed", action="store_true", help="Reuse data already in the emulator")
+    args = parser.parse_args()
+
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        print("❌ FIRESTORE_EMULATOR_HOST is not set - this benchmark only runs against the emulator.")
+        sys.exit(1)
+
+    db = firestore.Client(project=PROJECT_ID)
+    if not args.no_seed:
+        print(f"Seeding {args.parents} parents x 2 collections x {args.tokens} tokens...")
+        seed(db, args.parents, args.tokens)
+
+    results = {}
+    print(f"{'mode':<12}{'seconds':>10}{'tokens':>10}{'speed-up':>10}")
+    for mode in ("sequential", "pool", "group"):
+        elapsed, aggregator = run(db, mode, args.workers)
+        results[mode] = (elapsed, aggregator)
+        print(f"{mode:<12}{elapsed:>10.2f}{aggregator.valid:>10}{results['sequential'][0] / elapsed:>9.1f}x")
+
+    expected = results["sequential"][1].averages()
+    for mode, (_, aggregator) in results.items():
+        averages = aggregator.averages()
+        assert averages.keys() == expected.keys() and all(
+            abs(averages[k] - expected[k]) < 1e-9 for k in expected
+        ), f"{mode}: averages differ from sequential"
+    print("✅ All strategies agree.")
+
+
+if __name__ == "__main__":
+    main()
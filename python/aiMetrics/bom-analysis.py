@@ -2,11 +2,14 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 import sys
 
+from metrics_data import materials_for_product, query_docs
+
 # --- Configuration ---
 # TODO: Replace this with the actual path to your service account key file.
 SERVICE_ACCOUNT_KEY_PATH = "~/..."
 PRODUCTS_COLLECTION = "products_new"
 MATERIALS_COLLECTION = "materials"
+MATERIAL_FIELDS = ["name", "supplier_name", "supplier_address", "country_of_origin"]
 # --------------------
 
 def initialize_firebase():
@@ -41,23 +44,17 @@ def main():
     # 2. Find the product document (pDoc)
     print(f"\nSearching for product: '{uInput}'...")
     product_query = db.collection(PRODUCTS_COLLECTION).where("name", "==", uInput).limit(1)
-    pDocs = list(product_query.stream())
+    pDocs = query_docs(product_query, ["name"])
 
     if not pDocs:
         print(f"❌ Error: Product not found with name '{uInput}'.")
         return
     
-    pDoc = pDocs[0]
-    pDoc_data = pDoc.to_dict()
-    pDoc_ref = pDoc.reference # Get the document reference for the next query
+    pDoc_data = pDocs[0]
+    pDoc_ref = pDoc_data.reference # Get the document reference for the next query
 
     # 3. Find all Tier 1 materials (mDocs) linked to this product
-    materials_query = db.collection(MATERIALS_COLLECTION).where(
-        "tier", "==", 1
-    ).where(
-        "linked_product", "==", pDoc_ref
-    )
-    mDocs = list(materials_query.stream())
+    mDocs = materials_for_product(db, pDoc_ref, MATERIAL_FIELDS, tier=1)
 
     # 4. Print the results to the terminal
     print("\n" + "="*40)
@@ -68,9 +65,7 @@ def main():
     else:
         print(f"\nFound {len(mDocs)} Tier 1 material(s):")
         
-        for i, doc in enumerate(mDocs, 1):
-            data = doc.to_dict()
-            
+        for i, data in enumerate(mDocs, 1):
             # Safely get each field value, defaulting to 'N/A' if missing
             name = data.get('name', 'N/A')
             supplier = data.get('supplier_name', 'N/A')
@@ -1,3 +1,4 @@
+import argparse
 import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
@@ -7,9 +8,19 @@ from datetime import datetime, timezone
 import sys
 import os
 
+from google.api_core.exceptions import FailedPrecondition
+from firestore_fetch import (
+    FETCH_WORKERS, CostAggregator, TransferMeter, aggregate_count_sum, print_transfer_report,
+    stream_tokens_group, stream_tokens_pooled,
+)
+
 # --- Configuration ---
 SERVICE_ACCOUNT_KEY_PATH = "~/..."
 OUTPUT_FILE_PATH = "~/ecoze-firebase/cost-analysis.xlsx"
+PARENT_COLLECTIONS = [("products_new", "pn_tokens", "Product"), ("materials", "m_tokens", "Material")]
+PARENT_FIELDS = ["createdAt"]              # Projection for parents (only their ids are needed)
+TOKEN_FIELDS = ["cfName", "totalCost"]     # Projection for tokens
+AGGREGATE_LABEL = "aggregate (by token createdAt)"   # --method aggregate reports a differently dated metric
 # --------------------
 
 def initialize_firebase():
@@ -22,7 +33,111 @@ def initialize_firebase():
         print(f"Error initializing Firebase: {e}")
         sys.exit(1)
 
-def fetch_and_analyze_costs(db):
+def query_parents(db, target_date, fields=None):
+    """Yields (parent_doc, token_sub_collection, label) for products, then materials, created on/after target_date."""
+    for collection, sub_col_name, label in PARENT_COLLECTIONS:
+        # Using FieldFilter to avoid the UserWarning
+        query = db.collection(collection).where(filter=FieldFilter("createdAt", ">=", target_date))
+        if fields:
+            query = query.select(fields)
+        for doc in query.stream():
+            yield doc, sub_col_name, label
+
+def check_first_parent(parents, counter, meter=None, diagnose=True):
+    """
+    Passes parents through, counting them (and their bytes, with a meter) and
+    checking that the first one actually has the expected token sub-collection.
+    """
+    for parent_doc, expected_sub, doc_type in parents:
+        counter[doc_type] = counter.get(doc_type, 0) + 1
+        if meter is not None:
+            meter.add(parent_doc)
+        if diagnose and sum(counter.values()) == 1:
+            # --- DIAGNOSTIC: Check Sub-collections ---
+            print(f"\n--- DIAGNOSTIC: Inspecting first {doc_type} ({parent_doc.id}) ---")
+            actual_sub_cols = [c.id for c in parent_doc.reference.collections()]
+            if expected_sub not in actual_sub_cols:
+                print(f"⚠️  WARNING: Expected sub-collection '{expected_sub}' NOT found.")
+                print(f"   Actual sub-collections: {actual_sub_cols}")
+            else:
+                print(f"✅ Verified sub-collection '{expected_sub}' exists.")
+            print("----------------------------------------------------------------\n")
+        yield parent_doc, expected_sub, doc_type
+
+def stream_tokens(db, parents, mode, target_date, workers=FETCH_WORKERS, fields=None):
+    """Yields (label, token_snapshot) using the chosen fetch strategy."""
+    if mode == "sequential":
+        for parent_doc, sub_col_name, label in parents:
+            query = parent_doc.reference.collection(sub_col_name)
+            for token in (query.select(fields) if fields else query).stream():
+                yield label, token
+    elif mode == "pool":
+        yield from stream_tokens_pooled(parents, workers, fields)
+    else:
+        parent_ids = {}
+        for parent_doc, sub_col_name, label in parents:
+            parent_ids.setdefault((sub_col_name, label), set()).add(parent_doc.id)
+        for (sub_col_name, label), ids in parent_ids.items():
+            yield from stream_tokens_group(db, sub_col_name, ids, label, created_after=target_date, fields=fields)
+
+def scan_costs(db, target_date, method, mode, workers, diagnose=True):
+    """
+    Client-side scan: reads the parents and their tokens (whole documents for
+    'full', only cfName/totalCost for 'projection') into a CostAggregator.
+    """
+    meter = TransferMeter(f"{method} ({mode})")
+    fields = None if method == "full" else TOKEN_FIELDS
+    parent_counts = {}
+    parents = check_first_parent(
+        query_parents(db, target_date, None if method == "full" else PARENT_FIELDS),
+        parent_counts, meter, diagnose,
+    )
+    aggregator = CostAggregator()
+
+    for _, token in tqdm(stream_tokens(db, parents, mode, target_date, workers, fields), desc="Tokens", unit="token"):
+        meter.add(token)
+        token_data = token.to_dict() or {}
+        # We get 'cfName' from DB, but map it to 'cloudfunction' for the report
+        aggregator.add(token_data.get("cfName"), token_data.get("totalCost"))
+
+    total_parents = sum(parent_counts.values())
+    print(f"Found {total_parents} matching parent documents ({parent_counts}).")
+    return aggregator, meter.stop()
+
+def aggregate_costs(db, target_date, cf_names):
+    """
+    Server-side: one count+sum aggregation query per (token sub-collection, cfName).
+
+    This is a different metric from the scans: tokens are selected by their
+    own createdAt (collection-group query), not by their parent's. Tokens
+    without totalCost are excluded, as in the scans. Needs composite
+    collection-group indexes on (cfName, totalCost, createdAt) for pn_tokens
+    and m_tokens, and the cfName values to aggregate.
+    """
+    meter = TransferMeter(AGGREGATE_LABEL)
+    aggregator = CostAggregator()
+    for _, sub_col_name, label in PARENT_COLLECTIONS:
+        base = (db.collection_group(sub_col_name)
+                .where(filter=FieldFilter("createdAt", ">=", target_date))
+                .where(filter=FieldFilter("totalCost", "!=", None)))
+        for name in tqdm(sorted(cf_names), desc=f"{label} aggregations"):
+            count, total = aggregate_count_sum(base.where(filter=FieldFilter("cfName", "==", name)), "totalCost")
+            meter.add_aggregation()
+            aggregator.merge(name, count, total)
+    return aggregator, meter.stop()
+
+def compute_costs(db, target_date, method, mode, workers, cf_names=None, diagnose=True):
+    print(f"\nComputing costs ({AGGREGATE_LABEL if method == 'aggregate' else f'{method}, {mode} mode'})...")
+    if method == "aggregate":
+        try:
+            return aggregate_costs(db, target_date, cf_names)
+        except FailedPrecondition as e:
+            # Usually a missing collection-group index; the projection scan needs none
+            print(f"⚠️  Aggregation query failed ({e}). Falling back to a projection scan.")
+            method = "projection"
+    return scan_costs(db, target_date, method, mode, workers, diagnose)
+
+def fetch_and_analyze_costs(db, method="projection", mode="pool", workers=FETCH_WORKERS, cf_names=None, compare=False):
     try:
         print("\n--- Starting Cost Analysis (Field: cfName) ---")
         
@@ -30,92 +145,36 @@ def fetch_and_analyze_costs(db):
         target_date = datetime(2025, 11, 21, 0, 0, 0, tzinfo=timezone.utc)
         print(f"Filtering documents created on or after: {target_date} (UTC)")
 
-        products_ref = db.collection("products_new")
-        materials_ref = db.collection("materials")
-
-        # 2. Query Parents
-        print("Querying parent documents...")
-        # Using FieldFilter to avoid the UserWarning
-        p_query = products_ref.where(filter=FieldFilter("createdAt", ">=", target_date)).stream()
-        m_query = materials_ref.where(filter=FieldFilter("createdAt", ">=", target_date)).stream()
-
-        parent_tasks = []
-        
-        # Collect Products
-        for doc in p_query:
-            parent_tasks.append((doc, "pn_tokens", "Product"))
-            
-        # Collect Materials
-        for doc in m_query:
-            parent_tasks.append((doc, "m_tokens", "Material"))
-
-        total_parents = len(parent_tasks)
-        print(f"Found {total_parents} matching parent documents.")
-
-        if total_parents == 0:
-            print("No parents found matching the date criteria. Exiting.")
-            return
-
-        # --- DIAGNOSTIC: Check Sub-collections ---
-        # Checks the first document to ensure 'pn_tokens' or 'm_tokens' actually exists
-        first_doc, expected_sub, doc_type = parent_tasks[0]
-        print(f"\n--- DIAGNOSTIC: Inspecting first {doc_type} ({first_doc.id}) ---")
-        actual_sub_cols = [c.id for c in first_doc.reference.collections()]
-        
-        if expected_sub not in actual_sub_cols:
-            print(f"⚠️  WARNING: Expected sub-collection '{expected_sub}' NOT found.")
-            print(f"   Actual sub-collections: {actual_sub_cols}")
-        else:
-            print(f"✅ Verified sub-collection '{expected_sub}' exists.")
-        print("----------------------------------------------------------------\n")
-        # -----------------------------------------
-
-        all_token_data = []
-        skipped_count = 0
-        raw_token_count = 0
-
-        print("Fetching sub-collection tokens...")
-        
-        # 3. Fetch Tokens
-        for parent_doc, sub_col_name, _ in tqdm(parent_tasks, desc="Processing Parents"):
-            tokens_ref = parent_doc.reference.collection(sub_col_name)
-            tokens = tokens_ref.stream()
-
-            for token in tokens:
-                raw_token_count += 1
-                token_data = token.to_dict()
-                
-                # --- CHANGE IS HERE ---
-                # We now get 'cfName' from DB, but map it to 'cloudfunction' for the report
-                c_name = token_data.get("cfName")
-                t_cost = token_data.get("totalCost")
-
-                if c_name is not None and t_cost is not None:
-                    all_token_data.append({
-                        "cloudfunction": str(c_name), # Map 'cfName' -> 'cloudfunction' column
-                        "totalCost": float(t_cost)
-                    })
-                else:
-                    skipped_count += 1
+        # 2. Query parents and 3. fetch their tokens - or let Firestore aggregate.
+        # Every token goes straight into the aggregator instead of a list of all tokens.
+        aggregator, meter = compute_costs(db, target_date, method, mode, workers, cf_names)
+        meters = [meter]
+        if compare:
+            for other in ("full", "projection", "aggregate"):
+                # The aggregation needs the cfName values (discovering them would mean streaming every token)
+                if other != method and (other != "aggregate" or cf_names):
+                    meters.append(compute_costs(db, target_date, other, mode, workers, cf_names, diagnose=False)[1])
+            # Report against the current full-document scan
+            meters.sort(key=lambda m: not m.label.startswith("full"))
+            print_transfer_report(meters)
+
+        if method == "aggregate":
+            print(f"\n⚠️  Averages below are the {AGGREGATE_LABEL} metric: tokens are selected by their own "
+                  "createdAt, not by their parent's, so they differ from the default report.")
 
         print(f"\nDiagnostics:")
-        print(f"Total tokens scanned: {raw_token_count}")
-        print(f"Tokens skipped (missing 'cfName' or 'totalCost'): {skipped_count}")
-        print(f"Valid tokens collected: {len(all_token_data)}")
+        print(f"Total tokens scanned: {aggregator.scanned}")
+        print(f"Tokens skipped (missing 'cfName' or 'totalCost'): {aggregator.skipped}")
+        print(f"Valid tokens collected: {aggregator.valid}")
 
-        if not all_token_data:
+        if not aggregator.valid:
             print("No valid tokens found. Please check if 'cfName' and 'totalCost' fields exist.")
             return
 
-        # 4. Grouping & Averaging
-        print("Calculating averages...")
-        df = pd.DataFrame(all_token_data)
-
-        # Group by the 'cloudfunction' column (which holds cfName data)
-        grouped_df = df.groupby('cloudfunction', as_index=False)['totalCost'].mean()
-
-        # Rename 'totalCost' to 'average_cost'
-        grouped_df.rename(columns={'totalCost': 'average_cost'}, inplace=True)
+        # 4. Averages per cloud function (already grouped by the aggregator)
+        grouped_df = pd.DataFrame(
+            sorted(aggregator.averages().items()), columns=['cloudfunction', 'average_cost']
+        )
 
         # 5. Export to Excel
         output_dir = os.path.dirname(OUTPUT_FILE_PATH)
@@ -136,8 +195,24 @@ def fetch_and_analyze_costs(db):
         sys.exit(1)
 
 def main():
+    parser = argparse.ArgumentParser(description="Average AI cost per cloud function since the cut-off date.")
+    parser.add_argument("--method", choices=["aggregate", "projection", "full"], default="projection",
+                        help="aggregate: server-side count/sum per --cf-names value; a different metric, as tokens are "
+                             "filtered by their own createdAt instead of their parent's; "
+                             "projection: client scan of cfName/totalCost only; full: client scan of whole documents")
+    parser.add_argument("--mode", choices=["sequential", "pool", "group"], default="pool",
+                        help="How scans read tokens. pool: parallel sub-collection reads; group: collection-group "
+                             "queries (needs a collection-group index on createdAt); sequential: one parent at a time")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS, help="Concurrent reads in pool mode")
+    parser.add_argument("--cf-names", nargs="+", help="cfName values to aggregate (required by --method aggregate)")
+    parser.add_argument("--compare", action="store_true",
+                        help="Also run the other methods and report time and bytes against the full-document scan")
+    args = parser.parse_args()
+    if args.method == "aggregate" and not args.cf_names:
+        parser.error("--method aggregate needs --cf-names")
+
     db = initialize_firebase()
-    fetch_and_analyze_costs(db)
+    fetch_and_analyze_costs(db, args.method, args.mode, args.workers, args.cf_names, args.compare)
 
 if __name__ == "__main__":
     main()
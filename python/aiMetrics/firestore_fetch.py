@@ -0,0 +1,197 @@
+"""
+Parallel readers for the per-parent token sub-collections (pn_tokens / m_tokens).
+
+Reading each parent's sub-collection one after another costs one sequential
+round trip per parent. Two faster strategies, both yielding token snapshots
+as they arrive so callers can aggregate on the fly:
+
+  - stream_tokens_pooled(): a bounded thread pool reads the sub-collections
+    of many parents at once, starting as soon as each parent is streamed.
+  - stream_tokens_group(): one collection-group query per sub-collection name
+    (filtered on createdAt), keeping only tokens whose parent matched.
+    Needs a collection-group scoped index on createdAt for pn_tokens/m_tokens
+    (Firestore console -> Indexes -> Single field -> Add exemption).
+
+Both accept `fields` to project tokens down to the fields actually used
+(e.g. ["cfName", "totalCost"]) instead of downloading whole documents.
+
+CostAggregator is an incremental groupby (count/sum per key), so no list of
+every token is ever built. aggregate_count_sum() computes a count and sum
+server-side with one aggregation query, and TransferMeter estimates how many
+bytes each approach pulls down, so they can be compared.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+# --- CONFIGURATION ---
+FETCH_WORKERS = 32          # Sub-collection reads in flight at once
+MAX_PENDING = 4 * FETCH_WORKERS  # Parents queued ahead of the pool
+
+
+def _read_subcollection(parent_ref, sub_col_name, fields=None):
+    query = parent_ref.collection(sub_col_name)
+    if fields:
+        query = query.select(fields)
+    return list(query.stream())
+
+
+def _drain(pending, keep):
+    """Yields (label, token) from finished reads until at most `keep` are still pending."""
+    while len(pending) > keep:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            label = pending.pop(future)
+            for token in future.result():
+                yield label, token
+
+
+def stream_tokens_pooled(parents, workers=FETCH_WORKERS, fields=None):
+    """
+    parents: iterable of (parent_snapshot_or_ref, sub_col_name, label).
+    Yields (label, token_snapshot) for every token, reading up to `workers`
+    sub-collections concurrently. At most MAX_PENDING parents are queued, so
+    a huge parent stream is not pulled into memory ahead of the reads.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for parent, sub_col_name, label in parents:
+            ref = getattr(parent, "reference", parent)
+            pending[executor.submit(_read_subcollection, ref, sub_col_name, fields)] = label
+            yield from _drain(pending, MAX_PENDING - 1)
+        yield from _drain(pending, 0)
+
+
+def stream_tokens_group(db, sub_col_name, parent_ids, label, created_after=None, fields=None):
+    """
+    Yields (label, token_snapshot) for every `sub_col_name` document whose
+    parent id is in parent_ids, using one collection-group query. With
+    created_after, tokens are also filtered server-side (a token is never
+    older than its parent, so this only prunes non-matching parents).
+    """
+    query = db.collection_group(sub_col_name)
+    if created_after is not None:
+        query = query.where(filter=FieldFilter("createdAt", ">=", created_after))
+    if fields:
+        query = query.select(fields)
+    for token in query.stream():
+        if token.reference.parent.parent.id in parent_ids:
+            yield label, token
+
+
+class CostAggregator:
+    """Incremental groupby: count and sum of a value per key, plus scan diagnostics."""
+
+    def __init__(self):
+        self.count = {}
+        self.total = {}
+        self.scanned = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def add(self, key, value):
+        """Counts one scanned record; records missing key or value are skipped."""
+        with self._lock:
+            self.scanned += 1
+            if key is None or value is None:
+                self.skipped += 1
+                return
+            key = str(key)
+            self.count[key] = self.count.get(key, 0) + 1
+            self.total[key] = self.total.get(key, 0.0) + float(value)
+
+    @property
+    def valid(self):
+        return self.scanned - self.skipped
+
+    def averages(self):
+        """{key: mean value}."""
+        return {key: self.total[key] / self.count[key] for key in self.count}
+
+    def merge(self, key, count, total):
+        """Adds a pre-aggregated (count, sum) for one key, e.g. from an aggregation query."""
+        if not count:
+            return
+        with self._lock:
+            self.scanned += count
+            key = str(key)
+            self.count[key] = self.count.get(key, 0) + count
+            self.total[key] = self.total.get(key, 0.0) + float(total)
+
+
+def aggregate_count_sum(query, field):
+    """(count, sum of field) over query, computed server-side in one round trip. Documents without field add 0 to the sum."""
+    results = query.count(alias="count").sum(field, alias="total").get()
+    values = {result.alias: result.value for result in results[0]}
+    return int(values.get("count") or 0), float(values.get("total") or 0)
+
+
+# --- Transfer accounting ---
+
+def estimated_bytes(value):
+    """Approximate wire size of a Firestore value, following Firestore's storage size rules."""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimated_bytes(k) + estimated_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimated_bytes(v) for v in value)
+    if hasattr(value, "path"):      # DocumentReference
+        return len(value.path.encode("utf-8")) + 1
+    return 16                       # GeoPoint and anything else
+
+
+def document_bytes(snapshot):
+    """Approximate bytes transferred for one document snapshot (name + returned fields)."""
+    return len(snapshot.reference.path.encode("utf-8")) + 16 + estimated_bytes(snapshot.to_dict() or {})
+
+
+class TransferMeter:
+    """Counts documents, estimated bytes and wall-clock time for one way of computing a metric."""
+
+    def __init__(self, label):
+        self.label = label
+        self.docs = 0
+        self.bytes = 0
+        self.queries = 0
+        self.started = time.perf_counter()
+        self.seconds = None
+        self._lock = threading.Lock()
+
+    def add(self, snapshot):
+        size = document_bytes(snapshot)
+        with self._lock:
+            self.docs += 1
+            self.bytes += size
+
+    def add_aggregation(self, values=2):
+        """One aggregation query returning `values` numbers."""
+        with self._lock:
+            self.queries += 1
+            self.bytes += 8 * values
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+
+def print_transfer_report(meters):
+    """Prints documents, estimated bytes and time per method, relative to the first (baseline) meter."""
+    if not meters:
+        return
+    base = meters[0]
+    print("\n--- Transfer Report ---")
+    print(f"{'method':<24}{'seconds':>10}{'documents':>11}{'agg queries':>13}{'est. KB':>12}{'bytes vs base':>15}")
+    for meter in meters:
+        ratio = f"{meter.bytes / base.bytes:.1%}" if base.bytes else "-"
+        print(f"{meter.label:<24}{meter.seconds:>10.2f}{meter.docs:>11}{meter.queries:>13}"
+              f"{meter.bytes / 1024:>12.1f}{ratio:>15}")
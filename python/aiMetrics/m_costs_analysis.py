@@ -1,19 +1,54 @@
+import argparse
 import firebase_admin
 from firebase_admin import credentials, firestore
 import sys
 from datetime import datetime, timezone
 from tqdm import tqdm
 
+from firestore_fetch import TransferMeter, aggregate_count_sum, print_transfer_report
+
 # --- Configuration ---
 # TODO: Replace this with the actual path to your Firebase service account key file.
 SERVICE_ACCOUNT_KEY_PATH = "~/..."
 MATERIALS_COLLECTION = "materials"
+COST_FIELD = "totalCost"
 # --------------------
 
+def average_cost(query, method):
+    """
+    (count, sum of totalCost, TransferMeter) for the query.
+    aggregate: one server-side count+sum query; projection: streams only totalCost;
+    full: streams whole documents.
+    """
+    meter = TransferMeter(method)
+    if method == "aggregate":
+        count, total = aggregate_count_sum(query, COST_FIELD)
+        meter.add_aggregation()
+        return count, total, meter.stop()
+
+    count, total = 0, 0.0
+    stream = (query.select([COST_FIELD]) if method == "projection" else query).stream()
+    # Use tqdm for a progress bar
+    for doc in tqdm(stream, desc=f"Calculating costs ({method})", unit="doc"):
+        meter.add(doc)
+        # Use .get() to safely access the field, defaulting to 0 if it's missing
+        count += 1
+        total += doc.to_dict().get(COST_FIELD, 0) or 0
+    return count, total, meter.stop()
+
+
 def main():
     """
     Main function to initialize Firebase and run the calculation.
     """
+    parser = argparse.ArgumentParser(description="Average totalCost of unfinished materials.")
+    parser.add_argument("--method", choices=["aggregate", "projection", "full"], default="projection",
+                        help="projection: stream only totalCost; full: stream whole documents; "
+                             "aggregate (opt-in): server-side count/sum, where Firestore's sum ignores non-numeric totalCost values")
+    parser.add_argument("--compare", action="store_true",
+                        help="Run all three methods and report time and bytes against the full-document scan")
+    args = parser.parse_args()
+
     print("Initializing Firebase...")
     try:
         # Initialize the Firebase Admin SDK
@@ -42,30 +77,31 @@ def main():
         "apcfMaterials2_done", "!=", True
     )
 
-    # Execute the query and convert to a list to show progress
-    mDocs = list(mDocs_query.stream())
+    # 2. Count materials and sum their 'totalCost' (only that field is read by default)
+    methods = ["full", "projection", "aggregate"] if args.compare else [args.method]
+    results = {}
+    meters = []
+    for method in methods:
+        count, total, meter = average_cost(mDocs_query, method)
+        results[method] = (count, total)
+        meters.append(meter)
+    count, total = results[args.method]
 
-    if not mDocs:
+    if not count:
         print("⚠️ No matching materials found. Exiting.")
         sys.exit(0)
 
-    print(f"Found {len(mDocs)} matching materials.")
-
-    # 2. Calculate the average of the 'totalCost' field
-    costs = []
-    # Use tqdm for a progress bar
-    for doc in tqdm(mDocs, desc="Calculating costs"):
-        # Use .get() to safely access the field, defaulting to 0 if it's missing
-        cost = doc.to_dict().get("totalCost", 0)
-        costs.append(cost)
+    print(f"Found {count} matching materials.")
 
-    # Calculate the average, handling the case of an empty list
-    averageCost = sum(costs) / len(costs) if costs else 0
+    # Calculate the average (materials without 'totalCost' count as 0)
+    averageCost = total / count
 
     # 3. Print the final result
     print("\n--- Calculation Complete ---")
     # The :.4f formats the number to 4 decimal places
     print(f"Average Material Cost: $ {averageCost:.4f}")
+    if args.compare:
+        print_transfer_report(meters)
 
 
 if __name__ == "__main__":
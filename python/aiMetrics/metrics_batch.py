@@ -0,0 +1,221 @@
+"""
+Batch runner for the aiMetrics product reports.
+
+Runs the per-product reports of pcf_analysis.py, pcf_analysis_full.py,
+bom-analysis.py, pcf-stats.py and pm_data.py for a whole portfolio in one
+process, with one Firestore client, and writes a single Excel workbook:
+
+    python metrics_batch.py products.txt --reports pcf stats bom -o portfolio.xlsx
+
+products.txt holds one product ID or name per line (blank lines and lines
+starting with # are ignored). With --by auto, each line is first tried as an
+ID and the rest are looked up by name.
+
+Products are fetched with one batched get_all(), materials with 'in' queries
+of 30 products each, and the per-product sub-collection reads (reasoning,
+pn_data / m_data) run concurrently across products.
+
+Sheets: products, materials (pcf / pcf-full), bom, stats, pn_data, m_data,
+and not_found for input lines that matched no product.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+import pandas as pd
+from tqdm import tqdm
+
+from metrics_data import (
+    PRODUCTS_COLLECTION, TRANSPORT_WORKERS, fetch_reasonings, get_docs, materials_for_products,
+    product_stats, products_by_name, query_docs, sort_by, transport_counts_fanout,
+)
+from pcf_analysis_full import MATERIAL_REASONING_FUNCTION, REASONING_FUNCTIONS, trim_reasoning
+
+# --- Configuration ---
+# TODO: Replace this with the actual path to your Firebase service account key file.
+SERVICE_ACCOUNT_KEY_PATH = "~/..."
+OUTPUT_FILE_PATH = "~/aimetrics-batch.xlsx"
+PRODUCT_WORKERS = 8     # Products whose sub-collections are read at once
+
+REPORTS = ["pcf", "pcf-full", "bom", "stats", "pm-data"]
+PRODUCT_FIELDS = ["name", "estimated_cf", "cf_full", "transport_cf", "cf_processing"]
+REPORT_MATERIAL_FIELDS = {
+    "pcf": ["name", "tier", "estimated_cf", "cf_full"],
+    "pcf-full": ["name", "tier", "estimated_cf", "cf_full"],
+    "bom": ["name", "tier", "supplier_name", "supplier_address", "country_of_origin"],
+    "stats": ["supplier_name", "supplier_address", "estimated_cf"],
+    "pm-data": ["name"],
+}
+DATA_FIELDS = ["type", "url"]
+# --------------------
+
+def initialize_firebase():
+    """Initializes the Firebase Admin SDK once for the whole batch."""
+    print("Initializing Firebase...")
+    try:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(SERVICE_ACCOUNT_KEY_PATH)
+            firebase_admin.initialize_app(cred)
+        db = firestore.client()
+        print("✅ Firebase initialized successfully.")
+        return db
+    except Exception as e:
+        print(f"❌ Error initializing Firebase: {e}")
+        print(f"Please check your service account key path: '{SERVICE_ACCOUNT_KEY_PATH}'")
+        sys.exit(1)
+
+def read_product_list(path):
+    """Product IDs / names from a text file, in order, without duplicates."""
+    with open(os.path.expanduser(path), encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+def resolve_products(db, entries, by="auto"):
+    """Returns ({product_id: Doc} in input order, [entries not found])."""
+    found = {}
+    if by in ("id", "auto"):
+        refs = [db.collection(PRODUCTS_COLLECTION).document(entry) for entry in entries if "/" not in entry]
+        found.update(get_docs(db, refs, PRODUCT_FIELDS))
+    if by in ("name", "auto"):
+        names = [entry for entry in entries if entry not in found]
+        found.update(products_by_name(db, names, PRODUCT_FIELDS))
+
+    products, missing = {}, []
+    for entry in entries:
+        doc = found.get(entry)
+        if doc is None:
+            missing.append(entry)
+        else:
+            products.setdefault(doc.id, doc)
+    return products, missing
+
+def fetch_product_extras(pDoc, mDocs, reports):
+    """Per-product sub-collection reads: reasoning (pcf-full) and pn_data / m_data (pm-data)."""
+    extras = {}
+    if "pcf-full" in reports:
+        requests = [(func, pDoc.reference, "pn_reasoning", func) for func in REASONING_FUNCTIONS]
+        requests += [(m.reference.path, m.reference, "m_reasoning", MATERIAL_REASONING_FUNCTION) for m in mDocs]
+        extras["reasoning"] = fetch_reasonings(requests)
+    if "pm-data" in reports:
+        extras["pn_data"] = query_docs(pDoc.reference.collection("pn_data"), DATA_FIELDS)
+        extras["m_data"] = [
+            (m, query_docs(m.reference.collection("m_data"), DATA_FIELDS)) for m in mDocs
+        ]
+    return extras
+
+def build_rows(pDoc, mDocs, extras, transport_counts, reports, sheets):
+    """Appends one product's rows to each sheet."""
+    base = {"product_id": pDoc.id, "product_name": pDoc.get("name")}
+    reasoning = extras.get("reasoning", {})
+
+    if "pcf" in reports or "pcf-full" in reports:
+        row = dict(base, **{field: pDoc.get(field) for field in PRODUCT_FIELDS if field != "name"})
+        if "pcf-full" in reports:
+            for func in REASONING_FUNCTIONS:
+                row[f"reasoning_{func}"] = trim_reasoning(reasoning.get(func))
+        sheets["products"].append(row)
+
+        for rank, m in enumerate(sort_by(mDocs, "estimated_cf"), 1):
+            row = dict(base, rank=rank, material_name=m.get("name"), tier=m.get("tier"),
+                       estimated_cf=m.get("estimated_cf"), cf_full=m.get("cf_full"))
+            if "pcf-full" in reports:
+                row["reasoning"] = trim_reasoning(reasoning.get(m.reference.path))
+            sheets["materials"].append(row)
+
+    if "bom" in reports:
+        for m in mDocs:
+            if m.get("tier") == 1:
+                sheets["bom"].append(dict(
+                    base, material_name=m.get("name"), supplier_name=m.get("supplier_name"),
+                    supplier_address=m.get("supplier_address"), country_of_origin=m.get("country_of_origin"),
+                ))
+
+    if "stats" in reports:
+        sheets["stats"].append(dict(base, **product_stats(mDocs, transport_counts)))
+
+    if "pm-data" in reports:
+        for doc in extras["pn_data"]:
+            sheets["pn_data"].append(dict(base, type=doc.get("type"), url=doc.get("url")))
+        for m, docs in extras["m_data"]:
+            for doc in docs:
+                sheets["m_data"].append(dict(
+                    base, material_name=m.get("name", "Unnamed Material"), type=doc.get("type"), url=doc.get("url"),
+                ))
+
+def run_batch(db, entries, reports, by="auto", workers=PRODUCT_WORKERS):
+    """Runs the reports for every product; returns {sheet_name: [row dicts]}."""
+    timings = []
+    started = time.perf_counter()
+    products, missing = resolve_products(db, entries, by)
+    timings.append((f"products ({len(products)})", time.perf_counter() - started))
+    print(f"Found {len(products)} product(s); {len(missing)} not found.")
+
+    started = time.perf_counter()
+    fields = sorted({field for report in reports for field in REPORT_MATERIAL_FIELDS[report]})
+    p_refs = [pDoc.reference for pDoc in products.values()]
+    materials = materials_for_products(db, p_refs, fields)
+    all_materials = [m for mDocs in materials.values() for m in mDocs]
+    timings.append((f"materials ({len(all_materials)})", time.perf_counter() - started))
+
+    started = time.perf_counter()
+    transport_counts = transport_counts_fanout(all_materials, TRANSPORT_WORKERS) if "stats" in reports else {}
+    extras = {}
+    if {"pcf-full", "pm-data"} & set(reports):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(fetch_product_extras, pDoc, materials[pid], reports): pid
+                for pid, pDoc in products.items()
+            }
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Products", unit="product"):
+                extras[futures[future]] = future.result()
+    timings.append(("sub-collections", time.perf_counter() - started))
+
+    sheets = {name: [] for name in ("products", "materials", "bom", "stats", "pn_data", "m_data")}
+    for pid, pDoc in products.items():
+        build_rows(pDoc, materials[pid], extras.get(pid, {}), transport_counts, reports, sheets)
+    sheets["not_found"] = [{"input": entry} for entry in missing]
+
+    print("\n--- Timing ---")
+    for label, seconds in timings:
+        print(f"{label:<22}{seconds:>8.2f}s")
+    return sheets
+
+def write_workbook(sheets, output_path):
+    """Writes every non-empty sheet to one Excel workbook."""
+    output_path = os.path.expanduser(output_path)
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
+        for name, rows in sheets.items():
+            if rows:
+                pd.DataFrame(rows).to_excel(writer, sheet_name=name, index=False)
+    print(f"✅ Report written to {output_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the aiMetrics product reports for many products at once.")
+    parser.add_argument("product_file", help="Text file with one product ID or name per line")
+    parser.add_argument("--by", choices=["auto", "id", "name"], default="auto", help="How to match the lines")
+    parser.add_argument("--reports", nargs="+", choices=REPORTS, default=["pcf", "bom", "stats"])
+    parser.add_argument("--workers", type=int, default=PRODUCT_WORKERS, help="Products read concurrently")
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE_PATH, help="Excel workbook to write")
+    args = parser.parse_args()
+
+    entries = read_product_list(args.product_file)
+    if not entries:
+        print("Error: No product IDs or names in the input file.")
+        sys.exit(1)
+
+    db = initialize_firebase()
+    sheets = run_batch(db, entries, args.reports, args.by, args.workers)
+    if not any(rows for name, rows in sheets.items() if name != "not_found"):
+        print("⚠️ No report rows produced.")
+    write_workbook(sheets, args.output)
+
+
+if __name__ == "__main__":
+    main()
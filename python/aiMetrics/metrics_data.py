@@ -0,0 +1,241 @@
+"""
+Projected, convert-once Firestore access for the aiMetrics reports.
+
+The reports only print a handful of fields, but `stream()` downloads whole
+material documents (BoMs, reasoning, supplier research...). Here every query
+takes the list of fields it needs and is issued as a projection, and each
+snapshot is converted to a dict exactly once:
+
+    materials = materials_for_product(db, p_ref, ["name", "estimated_cf"])
+    for m in sort_by(materials, "estimated_cf"):
+        print(m.get("name"), m.get("cf_full"))   # cf_full is loaded on first use
+
+A field outside the projection is fetched on first access (one projected
+get() per document), so large fields only cost a read when a report
+actually prints them. Reasoning text lives in sub-collections: read one
+with first_reasoning(), or many at once with fetch_reasonings() (bounded
+thread pool) or reasonings_by_parent() (one collection-group query).
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+# --- CONFIGURATION ---
+PRODUCTS_COLLECTION = "products_new"
+MATERIALS_COLLECTION = "materials"
+TRANSPORT_SUBCOLL = "materials_transport"
+REASONING_FIELD = "reasoningOriginal"
+IN_QUERY_LIMIT = 30     # Max values in a Firestore 'in' filter
+REASONING_WORKERS = 16  # Reasoning queries in flight at once
+TRANSPORT_WORKERS = 32  # Transport count queries in flight at once
+
+
+class Doc:
+    """A snapshot's data, converted once. Fields outside the projection load lazily."""
+
+    __slots__ = ("id", "reference", "exists", "_data", "_fields")
+
+    def __init__(self, snapshot, fields=None):
+        self.id = snapshot.id
+        self.reference = snapshot.reference
+        self.exists = snapshot.exists
+        self._data = snapshot.to_dict() or {}
+        self._fields = set(fields) if fields is not None else None   # None: whole document loaded
+
+    @classmethod
+    def from_data(cls, reference, data):
+        """A fully loaded Doc built from already-known data (e.g. a local snapshot)."""
+        doc = cls.__new__(cls)
+        doc.id = reference.id
+        doc.reference = reference
+        doc.exists = True
+        doc._data = dict(data)
+        doc._fields = None
+        return doc
+
+    def _loaded(self, key):
+        return self._fields is None or key in self._fields or key in self._data
+
+    def load(self, *keys):
+        """Fetches the given fields (one projected read) if they are not loaded yet."""
+        missing = [key for key in keys if not self._loaded(key)]
+        if not missing:
+            return self
+        snapshot = self.reference.get(field_paths=missing)
+        self._data.update(snapshot.to_dict() or {})
+        self._fields.update(missing)
+        return self
+
+    def get(self, key, default=None):
+        self.load(key)
+        return self._data.get(key, default)
+
+    def __getitem__(self, key):
+        self.load(key)
+        return self._data[key]
+
+    def __contains__(self, key):
+        self.load(key)
+        return key in self._data
+
+    def to_dict(self):
+        """The fields loaded so far."""
+        return dict(self._data)
+
+
+def project(query, fields=None):
+    """Applies a field projection to a query (no-op for fields=None)."""
+    return query.select(list(fields)) if fields else query
+
+
+def stream_docs(query, fields=None):
+    """Yields a Doc per result of the projected query."""
+    for snapshot in project(query, fields).stream():
+        yield Doc(snapshot, fields)
+
+
+def query_docs(query, fields=None):
+    """list(stream_docs(...))."""
+    return list(stream_docs(query, fields))
+
+
+def get_doc(ref, fields=None):
+    """The document at ref (only `fields`, if given) as a Doc, or None if it does not exist."""
+    snapshot = ref.get(field_paths=list(fields)) if fields else ref.get()
+    return Doc(snapshot, fields) if snapshot.exists else None
+
+
+def get_docs(db, refs, fields=None):
+    """{doc_id: Doc} for the refs that exist, fetched with one batched get_all()."""
+    refs = list(refs)
+    if not refs:
+        return {}
+    snapshots = db.get_all(refs, field_paths=list(fields) if fields else None)
+    return {snapshot.id: Doc(snapshot, fields) for snapshot in snapshots if snapshot.exists}
+
+
+def products_by_name(db, names, fields=None):
+    """{name: Doc} (first match per name), using 'in' queries of up to IN_QUERY_LIMIT names each."""
+    names = list(dict.fromkeys(names))
+    fields = list(fields) + ["name"] if fields and "name" not in fields else fields
+    found = {}
+    for i in range(0, len(names), IN_QUERY_LIMIT):
+        query = db.collection(PRODUCTS_COLLECTION).where("name", "in", names[i:i + IN_QUERY_LIMIT])
+        for doc in stream_docs(query, fields):
+            found.setdefault(doc.get("name"), doc)
+    return found
+
+
+def materials_for_product(db, product_ref, fields=None, tier=None):
+    """Materials linked to a product (optionally only one tier), projected to `fields`."""
+    query = db.collection(MATERIALS_COLLECTION).where("linked_product", "==", product_ref)
+    if tier is not None:
+        query = query.where("tier", "==", tier)
+    return query_docs(query, fields)
+
+
+def materials_for_products(db, product_refs, fields=None):
+    """{product_id: [Doc]} for many products, using 'in' queries of up to IN_QUERY_LIMIT products each."""
+    product_refs = list(product_refs)
+    by_product = {ref.id: [] for ref in product_refs}
+    fields = list(fields) + ["linked_product"] if fields else None
+    for i in range(0, len(product_refs), IN_QUERY_LIMIT):
+        query = db.collection(MATERIALS_COLLECTION).where("linked_product", "in", product_refs[i:i + IN_QUERY_LIMIT])
+        for doc in stream_docs(query, fields):
+            by_product[doc.get("linked_product").id].append(doc)
+    return by_product
+
+
+def first_reasoning(parent_ref, sub_col_name, cloudfunction, field=REASONING_FIELD):
+    """The reasoning text of the first `sub_col_name` doc written by cloudfunction, or None."""
+    query = parent_ref.collection(sub_col_name).where("cloudfunction", "==", cloudfunction).limit(1)
+    for snapshot in query.select([field]).stream():
+        return (snapshot.to_dict() or {}).get(field, "")
+    return None
+
+
+def sort_by(docs, field, reverse=True):
+    """Docs sorted by a numeric field (missing/None as 0.0), highest first by default."""
+    return sorted(docs, key=lambda doc: doc.get(field) or 0.0, reverse=reverse)
+
+
+def fetch_reasonings(requests, workers=REASONING_WORKERS):
+    """
+    requests: iterable of (key, parent_ref, sub_col_name, cloudfunction).
+    Returns {key: text} for the requests that have a reasoning doc, running
+    up to `workers` first_reasoning() queries concurrently.
+    """
+    requests = list(requests)
+    if not requests:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(requests))) as executor:
+        texts = executor.map(lambda request: first_reasoning(*request[1:]), requests)
+        return {request[0]: text for request, text in zip(requests, texts) if text is not None}
+
+
+def reasonings_by_parent(db, sub_col_name, cloudfunction, parent_paths, field=REASONING_FIELD):
+    """
+    {parent_path: text} for the parents in parent_paths, from one collection-group
+    query on sub_col_name filtered by cloudfunction. Needs a collection-group scoped
+    index on cloudfunction, and reads that function's reasoning for every parent
+    in the database, so it pays off when parent_paths covers many of them.
+    """
+    parent_paths = set(parent_paths)
+    texts = {}
+    query = db.collection_group(sub_col_name).where("cloudfunction", "==", cloudfunction)
+    for snapshot in query.select([field]).stream():
+        parent_path = snapshot.reference.parent.parent.path
+        if parent_path in parent_paths and parent_path not in texts:
+            texts[parent_path] = (snapshot.to_dict() or {}).get(field, "")
+    return texts
+
+
+def _count_transports(m_ref):
+    """(transports, transports with emissions_kgco2e) for one material, via aggregation queries."""
+    coll = m_ref.collection(TRANSPORT_SUBCOLL)
+    total = coll.count().get()[0][0].value
+    # != None matches documents where the field exists and is not null
+    calcs = coll.where("emissions_kgco2e", "!=", None).count().get()[0][0].value if total else 0
+    return int(total), int(calcs)
+
+
+def transport_counts_fanout(materials, workers=TRANSPORT_WORKERS):
+    """{material_path: (transports, with emissions)}, counting up to `workers` materials at once."""
+    counts = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_count_transports, m.reference): m.reference.path for m in materials}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Transports", unit="material"):
+            counts[futures[future]] = future.result()
+    return counts
+
+
+def product_stats(m_snaps, transport_counts):
+    """Counters for one product's materials."""
+    t   = len(m_snaps)
+    mt  = 0    # total materials_transport docs
+    mtc = 0    # those with emissions_kgco2e
+    msn = 0    # materials with supplier_name set
+    msa = 0    # materials with supplier_address set
+    mc  = 0    # materials with estimated_cf set
+
+    for m_data in m_snaps:
+        # supplier_name
+        name = str(m_data.get("supplier_name") or "").strip()
+        if name and name.lower() != "unknown":
+            msn += 1
+
+        # supplier_address
+        addr = str(m_data.get("supplier_address") or "").strip()
+        if addr and addr.lower() != "unknown":
+            msa += 1
+
+        # estimated_cf
+        if m_data.get("estimated_cf") is not None:
+            mc += 1
+
+        # materials_transport subcollection
+        total, calcs = transport_counts.get(m_data.reference.path, (0, 0))
+        mt += total
+        mtc += calcs
+
+    return {"t": t, "mt": mt, "mtc": mtc, "msn": msn, "msa": msa, "mc": mc}
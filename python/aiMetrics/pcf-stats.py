@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """
-Compute stats for a given product’s materials and transport records,
+Compute stats for one or many products' materials and transport records,
 showing progress with tqdm.
 
-1. Prompts for a Product ID (document in /products_new/).
-2. Counts:
+1. Prompts for a Product ID (document in /products_new/), or takes many with
+   --products ID [ID ...].
+2. Counts, per product:
    - Total materials linked to that product.
    - Total materials_transport sub-docs across those materials.
    - Of those transports, how many have emissions_kgco2e set.
@@ -12,8 +13,13 @@ showing progress with tqdm.
    - Of those materials, how many have supplier_address set (not "Unknown").
    - Of those materials, how many have estimated_cf set (not null).
 3. Prints the results.
+
+Materials for all products are read with projected 'in' queries. Transports
+are never downloaded: each material gets two count() aggregation queries, run
+in parallel (--workers at once).
 """
 
+import argparse
 import sys
 from pathlib import Path
 
@@ -21,12 +27,16 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 from tqdm import tqdm
 
+from metrics_data import (
+    TRANSPORT_WORKERS, materials_for_products, product_stats, transport_counts_fanout,
+)
+from snapshot_cache import SnapshotCache
+
 # ─── Configuration ─────────────────────────────────────────────────────────────
 
 SERVICE_ACCOUNT_JSON = "/home/ecoze/..."
 PRODUCTS_COLL        = "products_new"
-MATERIALS_COLL       = "materials"
-TRANSPORT_SUBCOLL    = "materials_transport"
+MATERIAL_FIELDS      = ["supplier_name", "supplier_address", "estimated_cf"]
 
 # ─── Initialization ────────────────────────────────────────────────────────────
 
@@ -36,78 +46,67 @@ def init_firestore():
         firebase_admin.initialize_app(cred)
     return firestore.client()
 
+# ─── Output ────────────────────────────────────────────────────────────────────
+
+def print_stats(product_id, stats):
+    print(f"\n====== Stats: {product_id} ======\n")
+    print(f"Total # Materials Docs: {stats['t']}\n")
+    print("-" * 80 + "\n")
+    print(f"# Materials Transport Docs: {stats['mt']}")
+    print(f"# MT Calcs: {stats['mtc']}")
+    print(f"# MT SN: {stats['msn']}")
+    print(f"# MT SA: {stats['msa']}")
+    print(f"# MT MPCF: {stats['mc']}")
+
 # ─── Main Logic ─────────────────────────────────────────────────────────────────
 
 def main():
+    parser = argparse.ArgumentParser(description="Material and transport stats for one or many products.")
+    parser.add_argument("--products", nargs="+", metavar="ID", help="Product IDs (default: prompt for one)")
+    parser.add_argument("--workers", type=int, default=TRANSPORT_WORKERS, help="Concurrent transport count queries")
+    parser.add_argument("--cache", action="store_true", help="Serve products from the local snapshot cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Pull documents changed since the last snapshot first (implies --cache)")
+    args = parser.parse_args()
+
     db = init_firestore()
 
-    # Prompt for the product ID
-    product_id = input("Product ID: ").strip()
-    if not product_id:
-        print("ERROR: No Product ID provided.", file=sys.stderr)
-        sys.exit(1)
-    p_ref = db.collection(PRODUCTS_COLL).document(product_id)
-
-    # 1. Materials linked to this product
-    print("Querying materials linked to product...")
-    m_snaps = list(
-        db.collection(MATERIALS_COLL)
-          .where("linked_product", "==", p_ref)
-          .stream()
-    )
-    t = len(m_snaps)
-
-    # Initialize counters
-    mt  = 0    # total materials_transport docs
-    mtc = 0    # those with emissions_kgco2e
-    msn = 0    # materials with supplier_name set
-    msa = 0    # materials with supplier_address set
-    mc  = 0    # materials with estimated_cf set
-
-    # 2-6. Iterate materials with progress bar
-    for m_snap in tqdm(m_snaps, desc="Materials", unit="doc"):
-        m_data = m_snap.to_dict() or {}
-
-        # supplier_name
-        name = str(m_data.get("supplier_name") or "").strip()
-        if name and name.lower() != "unknown":
-            msn += 1
-
-        # supplier_address
-        addr = str(m_data.get("supplier_address") or "").strip()
-        if addr and addr.lower() != "unknown":
-            msa += 1
-
-        # estimated_cf
-        if m_data.get("estimated_cf") is not None:
-            mc += 1
-
-        # materials_transport subcollection
-        t_docs = list(m_snap.reference
-                          .collection(TRANSPORT_SUBCOLL)
-                          .stream())
-        mt += len(t_docs)
-
-        # Count emissions_kgco2e within transport docs, with inner progress
-        for t_snap in tqdm(
-                t_docs,
-                desc=f"Transports of {m_snap.id}",
-                unit="subdoc",
-                leave=False
-        ):
-            t_data = t_snap.to_dict() or {}
-            if t_data.get("emissions_kgco2e") is not None:
-                mtc += 1
-
-    # 7. Print results
-    print("\n====== Stats ======\n")
-    print(f"Total # Materials Docs: {t}\n")
-    print("-" * 80 + "\n")
-    print(f"# Materials Transport Docs: {mt}")
-    print(f"# MT Calcs: {mtc}")
-    print(f"# MT SN: {msn}")
-    print(f"# MT SA: {msa}")
-    print(f"# MT MPCF: {mc}")
+    product_ids = args.products
+    if not product_ids:
+        # Prompt for the product ID
+        product_id = input("Product ID: ").strip()
+        if not product_id:
+            print("ERROR: No Product ID provided.", file=sys.stderr)
+            sys.exit(1)
+        product_ids = [product_id]
+    p_refs = [db.collection(PRODUCTS_COLL).document(pid) for pid in dict.fromkeys(product_ids)]
+
+    if args.cache or args.refresh:
+        # Everything is counted from the local snapshots
+        cache = SnapshotCache()
+        try:
+            graphs = {p_ref.id: cache.product_graph(db, p_ref.id, args.refresh)
+                      for p_ref in tqdm(p_refs, desc="Snapshots", unit="product")}
+        finally:
+            cache.close()
+        for product_id, graph in graphs.items():
+            if graph is None:
+                print(f"ERROR: Product '{product_id}' not found.", file=sys.stderr)
+                continue
+            print_stats(product_id, product_stats(graph.materials, graph.transport_counts()))
+        return
+
+    # 1. Materials linked to these products (one pass)
+    print(f"Querying materials linked to {len(p_refs)} product(s)...")
+    materials = materials_for_products(db, p_refs, MATERIAL_FIELDS)
+    all_materials = [m for m_snaps in materials.values() for m in m_snaps]
+
+    # 2. Transport counts for all of those materials
+    transport_counts = transport_counts_fanout(all_materials, args.workers)
+
+    # 3. Print results
+    for p_ref in p_refs:
+        print_stats(p_ref.id, product_stats(materials[p_ref.id], transport_counts))
 
 if __name__ == "__main__":
     main()
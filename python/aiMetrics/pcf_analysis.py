@@ -1,43 +1,48 @@
+import argparse
 import firebase_admin
 from firebase_admin import credentials, firestore
 import sys
 
+from metrics_data import PRODUCTS_COLLECTION, get_doc, materials_for_product, sort_by
+from snapshot_cache import SnapshotCache
+
 # --- Configuration ---
 # TODO: Replace this with the actual path to your Firebase service account key file.
 SERVICE_ACCOUNT_KEY_PATH = "~/..."
+PRODUCT_FIELDS = ["name", "estimated_cf", "cf_full", "transport_cf", "cf_processing"]
+MATERIAL_FIELDS = ["name", "tier", "estimated_cf", "cf_full"]
 # --------------------
 
-def generate_product_report(db, product_id):
+def generate_product_report(db, product_id, cache=None, refresh=False):
     """
     Fetches a product and its materials and prints a detailed report.
 
     Args:
         db: The Firestore database client.
         product_id (str): The document ID of the product to report on.
+        cache (SnapshotCache): Serve the product graph from this local snapshot, if given.
+        refresh (bool): Sync changed documents into the snapshot first.
     """
     try:
         # --- 1. Get the Product Document (pDoc) ---
-        pDoc_ref = db.collection("products_new").document(product_id)
-        pDoc = pDoc_ref.get()
+        pDoc_ref = db.collection(PRODUCTS_COLLECTION).document(product_id)
+        if cache:
+            graph = cache.product_graph(db, product_id, refresh)
+            pDoc_data = graph.product if graph else None
+        else:
+            graph = None
+            pDoc_data = get_doc(pDoc_ref, PRODUCT_FIELDS)
 
-        if not pDoc.exists:
+        if pDoc_data is None:
             print(f"Error: Product with ID '{product_id}' not found.")
             return
 
-        pDoc_data = pDoc.to_dict()
-
         # --- 2. Find and Sort all Material Documents (mDocs) ---
-        materials_query = db.collection("materials").where(
-            "linked_product", "==", pDoc_ref
-        )
-        mDocs_snapshots = list(materials_query.stream())
-        
+        # Only the printed fields are fetched, and each snapshot is converted once
+        mDocs = graph.materials if graph else materials_for_product(db, pDoc_ref, MATERIAL_FIELDS)
+
         # Sort the materials by 'estimated_cf' from highest to lowest
-        sorted_mDocs = sorted(
-            mDocs_snapshots,
-            key=lambda doc: doc.to_dict().get("estimated_cf", 0.0) or 0.0,
-            reverse=True
-        )
+        sorted_mDocs = sort_by(mDocs, "estimated_cf")
 
         # --- 3. Print the Report ---
         
@@ -55,9 +60,7 @@ def generate_product_report(db, product_id):
         if not sorted_mDocs:
             print("No materials are linked to this product.")
         else:
-            for i, doc in enumerate(sorted_mDocs, 1):
-                mDoc_data = doc.to_dict()
-                
+            for i, mDoc_data in enumerate(sorted_mDocs, 1):
                 print(f"Material {i} Name: {mDoc_data.get('name', '(not set)')}")
                 print(f"Material {i} Tier: {mDoc_data.get('tier', '(not set)')}")
                 print(f"Material {i} Estimated CF: {mDoc_data.get('estimated_cf', '(not set)')}")
@@ -76,6 +79,12 @@ def main():
     """
     Main function to initialize Firebase and run the report generator.
     """
+    parser = argparse.ArgumentParser(description="Product CF report.")
+    parser.add_argument("--cache", action="store_true", help="Serve the product from the local snapshot cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Pull documents changed since the last snapshot first (implies --cache)")
+    args = parser.parse_args()
+
     print("Initializing Firebase...")
     try:
         if not firebase_admin._apps:
@@ -93,7 +102,12 @@ def main():
         print("Error: Product ID cannot be empty.")
         sys.exit(1)
         
-    generate_product_report(db, product_id_input)
+    cache = SnapshotCache() if args.cache or args.refresh else None
+    try:
+        generate_product_report(db, product_id_input, cache, args.refresh)
+    finally:
+        if cache:
+            cache.close()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,21 @@
+import argparse
 import firebase_admin
 from firebase_admin import credentials, firestore
 import sys
+import time
+
+from metrics_data import (
+    PRODUCTS_COLLECTION, REASONING_WORKERS, fetch_reasonings, get_doc, materials_for_product,
+    reasonings_by_parent, sort_by,
+)
 
 # --- Configuration ---
 # TODO: Replace this with the actual path to your Firebase service account key file.
 SERVICE_ACCOUNT_KEY_PATH = "~/..."
+PRODUCT_FIELDS = ["name", "estimated_cf", "cf_full", "transport_cf", "cf_processing"]
+MATERIAL_FIELDS = ["name", "tier", "estimated_cf", "cf_full"]
+REASONING_FUNCTIONS = ["apcfMPCFProcessing", "apcfMPCFFull", "apcfCFReview"]
+MATERIAL_REASONING_FUNCTION = "apcfMPCFFull"
 # --------------------
 
 def trim_reasoning(text: str) -> str:
@@ -21,48 +32,73 @@ def trim_reasoning(text: str) -> str:
     except IndexError:
         return "" # Return empty string if split fails unexpectedly
 
-def generate_product_report(db, product_id):
+def fetch_report_reasonings(db, pDoc_ref, mDocs, mode="pool", workers=REASONING_WORKERS):
+    """
+    Returns ({func: text} for the product, {material_path: text}), fetched
+    concurrently (pool) or with one collection-group query for the materials (group).
+    """
+    requests = [(func, pDoc_ref, "pn_reasoning", func) for func in REASONING_FUNCTIONS]
+    if mode == "group":
+        product_reasonings = fetch_reasonings(requests, workers)
+        material_reasonings = reasonings_by_parent(
+            db, "m_reasoning", MATERIAL_REASONING_FUNCTION, [m.reference.path for m in mDocs]
+        )
+        return product_reasonings, material_reasonings
+
+    requests += [(m.reference.path, m.reference, "m_reasoning", MATERIAL_REASONING_FUNCTION) for m in mDocs]
+    texts = fetch_reasonings(requests, workers)
+    product_reasonings = {func: texts[func] for func in REASONING_FUNCTIONS if func in texts}
+    material_reasonings = {path: text for path, text in texts.items() if path not in REASONING_FUNCTIONS}
+    return product_reasonings, material_reasonings
+
+def print_timings(timings):
+    """Prints the per-phase timing breakdown."""
+    total = sum(seconds for _, seconds in timings)
+    print("\n--- Timing ---")
+    for label, seconds in timings:
+        print(f"{label:<22}{seconds:>8.2f}s")
+    print(f"{'total':<22}{total:>8.2f}s")
+
+def generate_product_report(db, product_id, reasoning_mode="pool", workers=REASONING_WORKERS):
     """
     Fetches a product, its materials, and their reasoning docs, and prints a detailed report.
 
     Args:
         db: The Firestore database client.
         product_id (str): The document ID of the product to report on.
+        reasoning_mode (str): "pool" (concurrent queries) or "group" (collection-group query).
+        workers (int): Reasoning queries in flight at once.
     """
     try:
+        timings = []
+        started = time.perf_counter()
+
         # --- 1. Get the Product Document (pDoc) ---
-        pDoc_ref = db.collection("products_new").document(product_id)
-        pDoc = pDoc_ref.get()
+        pDoc_ref = db.collection(PRODUCTS_COLLECTION).document(product_id)
+        pDoc_data = get_doc(pDoc_ref, PRODUCT_FIELDS)
 
-        if not pDoc.exists:
+        if pDoc_data is None:
             print(f"Error: Product with ID '{product_id}' not found.")
             return
-
-        pDoc_data = pDoc.to_dict()
-
-        # --- 2. Get Product Reasoning Documents (prDocs) ---
-        pn_reasoning_ref = pDoc_ref.collection("pn_reasoning")
-        
-        reasoning_functions = ["apcfMPCFProcessing", "apcfMPCFFull", "apcfCFReview"]
-        product_reasonings = {}
-        for func in reasoning_functions:
-            query_result = list(pn_reasoning_ref.where("cloudfunction", "==", func).limit(1).stream())
-            if query_result:
-                product_reasonings[func] = query_result[0].to_dict().get("reasoningOriginal", "")
-
-        # --- 3. Find and Sort all Material Documents (mDocs) ---
-        materials_query = db.collection("materials").where(
-            "linked_product", "==", pDoc_ref
-        )
-        mDocs_snapshots = list(materials_query.stream())
-        
-        sorted_mDocs = sorted(
-            mDocs_snapshots,
-            key=lambda doc: doc.to_dict().get("estimated_cf", 0.0) or 0.0,
-            reverse=True
+        timings.append(("product", time.perf_counter() - started))
+
+        # --- 2. Find and Sort all Material Documents (mDocs) ---
+        # Only the printed fields are fetched; reasoning text is fetched below,
+        # projected to reasoningOriginal.
+        started = time.perf_counter()
+        mDocs = materials_for_product(db, pDoc_ref, MATERIAL_FIELDS)
+        sorted_mDocs = sort_by(mDocs, "estimated_cf")
+        timings.append((f"materials ({len(mDocs)})", time.perf_counter() - started))
+
+        # --- 3. Get all Reasoning Documents (prDocs / mrDocs) at once ---
+        started = time.perf_counter()
+        product_reasonings, material_reasonings = fetch_report_reasonings(
+            db, pDoc_ref, sorted_mDocs, reasoning_mode, workers
         )
+        timings.append((f"reasoning ({reasoning_mode})", time.perf_counter() - started))
 
         # --- 4. Print the Report ---
+        started = time.perf_counter()
         
         # --- Product Section ---
         print("\n")
@@ -73,7 +109,7 @@ def generate_product_report(db, product_id):
         print(f"Product Processing CF: {pDoc_data.get('cf_processing', '(not set)')}")
 
         # --- Product Reasoning Section ---
-        for func in reasoning_functions:
+        for func in REASONING_FUNCTIONS:
             if func in product_reasonings:
                 print(f"\n--- Reasoning for {func} ---")
                 print(trim_reasoning(product_reasonings[func]))
@@ -84,25 +120,24 @@ def generate_product_report(db, product_id):
         if not sorted_mDocs:
             print("No materials are linked to this product.")
         else:
-            for i, doc in enumerate(sorted_mDocs, 1):
-                mDoc_data = doc.to_dict()
-                
+            for i, mDoc_data in enumerate(sorted_mDocs, 1):
                 print(f"Material {i} Name: {mDoc_data.get('name', '(not set)')}")
                 print(f"Material {i} Tier: {mDoc_data.get('tier', '(not set)')}")
                 print(f"Material {i} Estimated CF: {mDoc_data.get('estimated_cf', '(not set)')}")
                 print(f"Material {i} CF Full: {mDoc_data.get('cf_full', '(not set)')}")
 
-                # Get and print the reasoning for this material
-                m_reasoning_ref = doc.reference.collection("m_reasoning")
-                reasoning_result = list(m_reasoning_ref.where("cloudfunction", "==", "apcfMPCFFull").limit(1).stream())
-                if reasoning_result:
-                    reasoning_text = reasoning_result[0].to_dict().get("reasoningOriginal", "")
+                # Print the reasoning for this material
+                reasoning_text = material_reasonings.get(mDoc_data.reference.path)
+                if reasoning_text is not None:
                     print("\nReasoning:")
                     print(trim_reasoning(reasoning_text))
 
                 if i < len(sorted_mDocs):
                     print("\n-----\n")
 
+        timings.append(("render", time.perf_counter() - started))
+        print_timings(timings)
+
     except Exception as e:
         print(f"\nAn error occurred: {e}")
         sys.exit(1)
@@ -112,6 +147,13 @@ def main():
     """
     Main function to initialize Firebase and run the report generator.
     """
+    parser = argparse.ArgumentParser(description="Product CF report with reasoning.")
+    parser.add_argument("--reasoning-mode", choices=["pool", "group"], default="pool",
+                        help="pool: concurrent per-document queries; group: one collection-group query "
+                             "on m_reasoning (needs a collection-group index on cloudfunction)")
+    parser.add_argument("--workers", type=int, default=REASONING_WORKERS, help="Reasoning queries in flight at once")
+    args = parser.parse_args()
+
     print("Initializing Firebase...")
     try:
         if not firebase_admin._apps:
@@ -129,7 +171,7 @@ def main():
         print("Error: Product ID cannot be empty.")
         sys.exit(1)
         
-    generate_product_report(db, product_id_input)
+    generate_product_report(db, product_id_input, args.reasoning_mode, args.workers)
 
 
 if __name__ == "__main__":
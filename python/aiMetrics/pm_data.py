@@ -1,85 +1,93 @@
+import argparse
 import firebase_admin
 from firebase_admin import credentials, firestore
 import sys
-import pandas as pd
 from tqdm import tqdm
 
+from metrics_data import stream_docs
+from row_writer import FORMATS, RowWriter
+from snapshot_cache import SnapshotCache
+
 # --- Configuration ---
 # TODO: Replace this with the actual path to your Firebase service account key file.
 SERVICE_ACCOUNT_KEY_PATH = "~/..."
 
 PRODUCT_DATA_OUTPUT_PATH = "~/product_data.xlsx"
 MATERIAL_DATA_OUTPUT_PATH = "~/materials_data.xlsx"
+DATA_FIELDS = ['type', 'url']
 # --------------------
 
-def export_pn_data(pDoc_ref):
-    """Exports the /pn_data subcollection for a given product."""
+def export_pn_data(pDoc_ref, graph=None, fmt="xlsx"):
+    """Exports the /pn_data subcollection for a given product (from the snapshot graph, if given)."""
     print(f"\nExporting data from /products_new/{pDoc_ref.id}/pn_data...")
     
-    pn_data_ref = pDoc_ref.collection("pn_data")
-    pdDocs = list(pn_data_ref.stream())
-
-    if not pdDocs:
+    if graph is not None:
+        pdDocs = graph.pn_data
+    else:
+        pdDocs = stream_docs(pDoc_ref.collection("pn_data"), DATA_FIELDS)
+
+    # Rows are written as they arrive instead of being collected first
+    with RowWriter(PRODUCT_DATA_OUTPUT_PATH, ['type', 'url'], fmt) as writer:
+        for doc in pdDocs:
+            writer.write({
+                'type': doc.get('type'),
+                'url': doc.get('url')
+            })
+
+    if not writer.count:
         print("No documents found in /pn_data subcollection. Skipping product data export.")
         return
+    print(f"✅ Success! {writer.count} rows exported to {writer.path}")
 
-    data_for_excel = []
-    for doc in pdDocs:
-        doc_data = doc.to_dict()
-        row = {
-            'type': doc_data.get('type'),
-            'url': doc_data.get('url')
-        }
-        data_for_excel.append(row)
-        
-    df = pd.DataFrame(data_for_excel, columns=['type', 'url'])
-    df.to_excel(PRODUCT_DATA_OUTPUT_PATH, index=False, engine='openpyxl')
-    print(f"✅ Success! {len(pdDocs)} rows exported to {PRODUCT_DATA_OUTPUT_PATH}")
 
-
-def export_m_data(db, pDoc_ref):
-    """Finds all linked materials and exports their /m_data subcollections."""
+def export_m_data(db, pDoc_ref, graph=None, fmt="xlsx"):
+    """Finds all linked materials and exports their /m_data subcollections (from the snapshot graph, if given)."""
     print(f"\nFinding materials linked to product {pDoc_ref.id}...")
     
-    materials_query = db.collection("materials").where("linked_product", "==", pDoc_ref)
-    mDocs = list(materials_query.stream())
-
-    if not mDocs:
+    if graph is not None:
+        mDocs = graph.materials
+    else:
+        materials_query = db.collection("materials").where("linked_product", "==", pDoc_ref)
+        mDocs = stream_docs(materials_query, ["name"])
+
+    materials_count = 0
+    with RowWriter(MATERIAL_DATA_OUTPUT_PATH, ['material_name', 'type', 'url'], fmt) as writer:
+        # Loop through each parent material document as it is streamed
+        for doc in tqdm(mDocs, desc="Processing Materials", unit="material"):
+            materials_count += 1
+            material_name = doc.get('name', 'Unnamed Material')
+            
+            # Get all documents from its 'm_data' subcollection
+            if graph is not None:
+                mdDocs = graph.m_data(doc)
+            else:
+                mdDocs = stream_docs(doc.reference.collection("m_data"), DATA_FIELDS)
+
+            for sub_doc in mdDocs:
+                writer.write({
+                    'material_name': material_name,
+                    'type': sub_doc.get('type'),
+                    'url': sub_doc.get('url')
+                })
+
+    if not materials_count:
         print("No materials found linked to this product. Skipping material data export.")
         return
-        
-    print(f"Found {len(mDocs)} linked materials. Exporting their /m_data...")
-
-    all_materials_data = []
-    # Loop through each parent material document
-    for doc in tqdm(mDocs, desc="Processing Materials"):
-        mDoc_data = doc.to_dict()
-        material_name = mDoc_data.get('name', 'Unnamed Material')
-        
-        # Get all documents from its 'm_data' subcollection
-        m_data_ref = doc.reference.collection("m_data")
-        mdDocs = list(m_data_ref.stream())
-
-        for sub_doc in mdDocs:
-            sub_doc_data = sub_doc.to_dict()
-            row = {
-                'material_name': material_name,
-                'type': sub_doc_data.get('type'),
-                'url': sub_doc_data.get('url')
-            }
-            all_materials_data.append(row)
-
-    if not all_materials_data:
-        print("No data found in any /m_data subcollections. Skipping material data export.")
+    if not writer.count:
+        print(f"No data found in the /m_data subcollections of {materials_count} materials. Skipping material data export.")
         return
-
-    df = pd.DataFrame(all_materials_data, columns=['material_name', 'type', 'url'])
-    df.to_excel(MATERIAL_DATA_OUTPUT_PATH, index=False, engine='openpyxl')
-    print(f"✅ Success! {len(all_materials_data)} rows exported to {MATERIAL_DATA_OUTPUT_PATH}")
+    print(f"✅ Success! {writer.count} rows from {materials_count} materials exported to {writer.path}")
 
 
 def main():
     """Main function to initialize Firebase and run the exports."""
+    parser = argparse.ArgumentParser(description="Export a product's pn_data and its materials' m_data.")
+    parser.add_argument("--format", choices=FORMATS, default="xlsx", help="Output format (rows are streamed)")
+    parser.add_argument("--cache", action="store_true", help="Serve the product from the local snapshot cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Pull documents changed since the last snapshot first (implies --cache)")
+    args = parser.parse_args()
+
     print("Initializing Firebase...")
     try:
         if not firebase_admin._apps:
@@ -98,13 +106,23 @@ def main():
         
     # Get product reference and check existence
     pDoc_ref = db.collection("products_new").document(product_id_input)
-    if not pDoc_ref.get().exists:
+    graph = None
+    if args.cache or args.refresh:
+        cache = SnapshotCache()
+        try:
+            graph = cache.product_graph(db, product_id_input, args.refresh)
+        finally:
+            cache.close()
+        exists = graph is not None
+    else:
+        exists = pDoc_ref.get().exists
+    if not exists:
         print(f"Error: Product with ID '{product_id_input}' not found.")
         return
         
     # Run both export functions
-    export_pn_data(pDoc_ref)
-    export_m_data(db, pDoc_ref)
+    export_pn_data(pDoc_ref, graph, args.format)
+    export_m_data(db, pDoc_ref, graph, args.format)
 
 if __name__ == "__main__":
     main()
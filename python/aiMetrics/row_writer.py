@@ -0,0 +1,201 @@
+"""
+Streaming row export to Excel, CSV or Parquet.
+
+Building a list of dicts, then a DataFrame, then an openpyxl workbook keeps
+several copies of the whole export in memory. RowWriter writes each row as
+it arrives instead, so memory stays flat however many documents are read:
+
+    with RowWriter("~/export.xlsx", columns=["name", "cf"], fmt="parquet", types={"cf": "float"}) as writer:
+        for doc in docs_stream:
+            writer.write({"name": ..., "cf": ...})
+    print(f"{writer.count} rows -> {writer.path}")
+
+  - xlsx:    openpyxl write-only workbook (rows go to a temp file, not a DOM);
+             continues on a new sheet past Excel's row limit
+  - csv:     csv.writer
+  - parquet: pyarrow ParquetWriter, one row group per CHUNK_ROWS rows. The
+             schema is fixed before the first row: columns take the type
+             given in `types` (see PARQUET_TYPES) and default to string.
+             Values are converted to their column's type; one that does not
+             convert (e.g. "n/a" in a float column) is left empty and counted
+             in `mismatched`, so a stray type never stops an export midway.
+
+The file is only created once the first row is written; `path` gets the
+extension of the chosen format.
+"""
+import csv
+import os
+from datetime import datetime, timezone
+
+# --- CONFIGURATION ---
+FORMATS = ["xlsx", "csv", "parquet"]
+CHUNK_ROWS = 5000               # Rows per Parquet row group
+EXCEL_MAX_ROWS = 1048576        # Per sheet, including the header
+PARQUET_TYPES = ["string", "float", "int", "bool", "timestamp"]
+
+
+def output_path(path, fmt):
+    """path with its extension replaced to match fmt (and ~ expanded)."""
+    root, _ = os.path.splitext(os.path.expanduser(path))
+    return f"{root}.{fmt}"
+
+
+def _cell(value):
+    """Excel/CSV-safe cell value: tz-aware datetimes as naive UTC, containers as text."""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    if isinstance(value, (list, tuple, set, dict)):
+        return str(value)
+    return value
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        return None
+    return float(value)
+
+
+def _to_int(value):
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None
+    return int(value)
+
+
+def _to_bool(value):
+    return value if isinstance(value, bool) else None
+
+
+def _to_timestamp(value):
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _to_string(value):
+    value = _cell(value)
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+# Parquet column type -> conversion of one non-null value (None or an error if it does not fit)
+_CONVERTERS = {
+    "string": _to_string,
+    "float": _to_float,
+    "int": _to_int,
+    "bool": _to_bool,
+    "timestamp": _to_timestamp,
+}
+
+
+class RowWriter:
+    """Writes dict rows to one file as they arrive."""
+
+    def __init__(self, path, columns, fmt="xlsx", sheet_name="Sheet1", chunk_rows=CHUNK_ROWS, types=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}' (expected one of {FORMATS})")
+        self.path = output_path(path, fmt)
+        self.columns = list(columns)
+        self.types = {column: (types or {}).get(column, "string") for column in self.columns}
+        unknown = set(self.types.values()) - set(PARQUET_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown column types {sorted(unknown)} (expected one of {PARQUET_TYPES})")
+        self.mismatched = {}    # parquet: column -> values left empty because they did not fit its type
+        self.fmt = fmt
+        self.sheet_name = sheet_name
+        self.chunk_rows = chunk_rows
+        self.count = 0
+        self._opened = False
+        self._buffer = []       # parquet: rows of the current row group
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        output_dir = os.path.dirname(self.path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        if self.fmt == "xlsx":
+            from openpyxl import Workbook
+            self._workbook = Workbook(write_only=True)
+            self._sheets = 0
+            self._new_sheet()
+        elif self.fmt == "csv":
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(self.columns)
+        else:
+            # Imported here so a missing pyarrow fails before any row is read
+            import pyarrow
+            import pyarrow.parquet
+            pa = pyarrow
+            arrow_types = {
+                "string": pa.string(), "float": pa.float64(), "int": pa.int64(),
+                "bool": pa.bool_(), "timestamp": pa.timestamp("us", tz="UTC"),
+            }
+            self._pa = pa
+            self._schema = pa.schema([pa.field(column, arrow_types[self.types[column]]) for column in self.columns])
+            self._parquet = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+        self._opened = True
+
+    def _new_sheet(self):
+        self._sheets += 1
+        title = self.sheet_name if self._sheets == 1 else f"{self.sheet_name} ({self._sheets})"
+        self._sheet = self._workbook.create_sheet(title=title)
+        self._sheet.append(self.columns)
+        self._sheet_rows = 1
+
+    def write(self, row):
+        """Writes one row (missing columns are left empty, extra keys ignored)."""
+        if not self._opened:
+            self._open()
+        values = [row.get(column) for column in self.columns]
+        self.count += 1
+        if self.fmt == "xlsx":
+            if self._sheet_rows >= EXCEL_MAX_ROWS:
+                self._new_sheet()
+            self._sheet.append([_cell(value) for value in values])
+            self._sheet_rows += 1
+        elif self.fmt == "csv":
+            self._csv.writerow([_cell(value) for value in values])
+        else:
+            self._buffer.append([self._convert(column, value) for column, value in zip(self.columns, values)])
+            if len(self._buffer) >= self.chunk_rows:
+                self._flush_row_group()
+
+    def _convert(self, column, value):
+        """value as the Parquet type of its column; None (and counted) if it does not fit."""
+        if value is None:
+            return None
+        try:
+            converted = _CONVERTERS[self.types[column]](value)
+        except (TypeError, ValueError, OverflowError):
+            converted = None
+        if converted is None:
+            self.mismatched[column] = self.mismatched.get(column, 0) + 1
+        return converted
+
+    def _flush_row_group(self):
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        columns = [self._pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(self._schema)]
+        self._parquet.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+
+    def close(self):
+        """Finishes the file. Nothing is written if no row was."""
+        if not self._opened:
+            return
+        self._opened = False
+        if self.fmt == "xlsx":
+            self._workbook.save(self.path)
+        elif self.fmt == "csv":
+            self._file.close()
+        else:
+            try:
+                self._flush_row_group()
+            finally:
+                self._parquet.close()
+            for column, count in self.mismatched.items():
+                print(f"⚠️  {count} '{column}' values were not {self.types[column]} and were left empty.")
@@ -0,0 +1,273 @@
+"""
+Local snapshot cache of product graphs for repeated aiMetrics reports.
+
+A product graph is the products_new document, its linked materials, each
+material's materials_transport and m_data sub-collections, and the product's
+pn_data. The first request for a product downloads the whole graph into a
+SQLite file; later requests are served from it without touching Firestore:
+
+    cache = SnapshotCache()
+    graph = cache.product_graph(db, product_id)                # cached if present
+    graph = cache.product_graph(db, product_id, refresh=True)  # sync changes first
+    for m in graph.materials:
+        print(m.get("name"), len(graph.transports(m)))
+    cache.close()
+
+refresh lists the graph with updatedAt-only projections, then downloads (with
+batched get_all) only documents whose updatedAt differs from the snapshot;
+documents that disappeared are dropped. Documents without an updatedAt field
+cannot be compared, so they are re-downloaded on every refresh.
+"""
+import base64
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from google.cloud.firestore import GeoPoint
+
+from metrics_data import MATERIALS_COLLECTION, PRODUCTS_COLLECTION, TRANSPORT_SUBCOLL, Doc
+
+# --- CONFIGURATION ---
+SNAPSHOT_CACHE_PATH = os.path.expanduser("~/.cache/ecozeai/aimetrics-snapshots.sqlite")
+SYNC_WORKERS = 16       # Sub-collection reads in flight at once
+GET_ALL_CHUNK = 300     # Documents per batched get_all()
+MATERIAL_SUBCOLLECTIONS = [TRANSPORT_SUBCOLL, "m_data"]
+PRODUCT_SUBCOLLECTIONS = ["pn_data"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    path TEXT PRIMARY KEY,
+    product_id TEXT NOT NULL,
+    kind TEXT NOT NULL,          -- product, material or a sub-collection name
+    parent TEXT,                 -- parent document path for sub-collection docs
+    updated TEXT,                -- updatedAt (ISO), NULL if the document has none
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_product ON docs (product_id);
+CREATE TABLE IF NOT EXISTS products (
+    product_id TEXT PRIMARY KEY,
+    synced TEXT NOT NULL
+);
+"""
+
+
+# --- Firestore value <-> JSON ---
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__ts__": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if hasattr(value, "path") and hasattr(value, "collection"):     # DocumentReference
+        return {"__ref__": value.path}
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):  # GeoPoint
+        return {"__geo__": [value.latitude, value.longitude]}
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+def _decoder(db):
+    def _decode(obj):
+        if len(obj) == 1:
+            key, value = next(iter(obj.items()))
+            if key == "__ts__":
+                return datetime.fromisoformat(value)
+            if key == "__ref__":
+                return db.document(value)
+            if key == "__bytes__":
+                return base64.b64decode(value)
+            if key == "__geo__":
+                return GeoPoint(*value)
+        return obj
+    return _decode
+
+
+def _updated(data):
+    value = (data or {}).get("updatedAt")
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).isoformat()
+    return str(value) if value is not None else None
+
+
+class ProductGraph:
+    """One product's cached documents as Docs."""
+
+    def __init__(self, product, materials, children):
+        self.product = product
+        self.materials = materials
+        self._children = children   # (sub-collection, parent path) -> [Doc]
+
+    def children(self, sub_col_name, parent):
+        """Docs of a sub-collection under a Doc (or document path)."""
+        path = parent if isinstance(parent, str) else parent.reference.path
+        return self._children.get((sub_col_name, path), [])
+
+    def transports(self, material):
+        return self.children(TRANSPORT_SUBCOLL, material)
+
+    def m_data(self, material):
+        return self.children("m_data", material)
+
+    @property
+    def pn_data(self):
+        return self.children("pn_data", self.product)
+
+    def transport_counts(self):
+        """{material_path: (transports, with emissions)}, as metrics_data.transport_counts_*() return."""
+        counts = {}
+        for m in self.materials:
+            transports = self.transports(m)
+            calcs = sum(1 for t in transports if t.get("emissions_kgco2e") is not None)
+            counts[m.reference.path] = (len(transports), calcs)
+        return counts
+
+
+class SnapshotCache:
+    """SQLite store of product graphs, keyed by product ID."""
+
+    def __init__(self, path=SNAPSHOT_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def synced(self, product_id):
+        """ISO time of the product's last sync, or None if it is not cached."""
+        row = self.conn.execute("SELECT synced FROM products WHERE product_id = ?", (product_id,)).fetchone()
+        return row[0] if row else None
+
+    def product_graph(self, db, product_id, refresh=False):
+        """The product's graph (None if the product does not exist), downloading or syncing it as needed."""
+        if self.synced(product_id) is None:
+            if not self._download(db, product_id):
+                return None
+        elif refresh:
+            if not self._refresh(db, product_id):
+                return None
+        return self._load(db, product_id)
+
+    # --- Reading ---
+
+    def _load(self, db, product_id):
+        decode = _decoder(db)
+        product, materials, children = None, [], {}
+        rows = self.conn.execute(
+            "SELECT path, kind, parent, data FROM docs WHERE product_id = ? ORDER BY path", (product_id,)
+        )
+        for path, kind, parent, data in rows:
+            doc = Doc.from_data(db.document(path), json.loads(data, object_hook=decode))
+            if kind == "product":
+                product = doc
+            elif kind == "material":
+                materials.append(doc)
+            else:
+                children.setdefault((kind, parent), []).append(doc)
+        return ProductGraph(product, materials, children) if product is not None else None
+
+    # --- Writing ---
+
+    def _store(self, product_id, entries):
+        """entries: iterable of (kind, parent_path, snapshot)."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO docs (path, product_id, kind, parent, updated, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (snap.reference.path, product_id, kind, parent, _updated(snap.to_dict()),
+                 json.dumps(snap.to_dict() or {}, default=_encode))
+                for kind, parent, snap in entries
+            ],
+        )
+
+    def _mark_synced(self, product_id):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO products (product_id, synced) VALUES (?, ?)",
+            (product_id, datetime.now(timezone.utc).isoformat()),
+        )
+        self.conn.commit()
+
+    def _forget(self, product_id):
+        self.conn.execute("DELETE FROM docs WHERE product_id = ?", (product_id,))
+        self.conn.execute("DELETE FROM products WHERE product_id = ?", (product_id,))
+        self.conn.commit()
+
+    # --- Syncing ---
+
+    @staticmethod
+    def _subcollection_jobs(p_ref, material_refs):
+        jobs = [(sub, p_ref) for sub in PRODUCT_SUBCOLLECTIONS]
+        jobs += [(sub, ref) for ref in material_refs for sub in MATERIAL_SUBCOLLECTIONS]
+        return jobs
+
+    @staticmethod
+    def _read_children(jobs, fields=None):
+        """[(sub-collection, parent path, snapshot)] for every job, read concurrently."""
+        def read(job):
+            sub, parent_ref = job
+            query = parent_ref.collection(sub)
+            if fields:
+                query = query.select(fields)
+            return [(sub, parent_ref.path, snap) for snap in query.stream()]
+
+        if not jobs:
+            return []
+        with ThreadPoolExecutor(max_workers=min(SYNC_WORKERS, len(jobs))) as executor:
+            return [entry for entries in executor.map(read, jobs) for entry in entries]
+
+    def _download(self, db, product_id):
+        """Full download of a product graph."""
+        p_ref = db.collection(PRODUCTS_COLLECTION).document(product_id)
+        p_snap = p_ref.get()
+        if not p_snap.exists:
+            return False
+        m_snaps = list(db.collection(MATERIALS_COLLECTION).where("linked_product", "==", p_ref).stream())
+        entries = [("product", None, p_snap)] + [("material", None, snap) for snap in m_snaps]
+        entries += self._read_children(self._subcollection_jobs(p_ref, [snap.reference for snap in m_snaps]))
+        self._forget(product_id)
+        self._store(product_id, entries)
+        self._mark_synced(product_id)
+        return True
+
+    def _refresh(self, db, product_id):
+        """Downloads only documents whose updatedAt changed; drops deleted ones."""
+        p_ref = db.collection(PRODUCTS_COLLECTION).document(product_id)
+        p_head = p_ref.get(field_paths=["updatedAt"])
+        if not p_head.exists:
+            self._forget(product_id)
+            return False
+
+        # 1. List the current graph with updatedAt-only projections
+        m_heads = list(
+            db.collection(MATERIALS_COLLECTION).where("linked_product", "==", p_ref).select(["updatedAt"]).stream()
+        )
+        listing = {p_ref.path: ("product", None, p_head)}
+        listing.update({snap.reference.path: ("material", None, snap) for snap in m_heads})
+        jobs = self._subcollection_jobs(p_ref, [snap.reference for snap in m_heads])
+        for sub, parent, snap in self._read_children(jobs, ["updatedAt"]):
+            listing[snap.reference.path] = (sub, parent, snap)
+
+        # 2. Compare with the snapshot
+        cached = dict(self.conn.execute("SELECT path, updated FROM docs WHERE product_id = ?", (product_id,)))
+        changed = [
+            path for path, (_, _, head) in listing.items()
+            if path not in cached or _updated(head.to_dict()) is None or cached[path] != _updated(head.to_dict())
+        ]
+        deleted = [path for path in cached if path not in listing]
+
+        # 3. Fetch changed documents in full
+        entries = []
+        for i in range(0, len(changed), GET_ALL_CHUNK):
+            refs = [listing[path][2].reference for path in changed[i:i + GET_ALL_CHUNK]]
+            for snap in db.get_all(refs):
+                if snap.exists:
+                    kind, parent, _ = listing[snap.reference.path]
+                    entries.append((kind, parent, snap))
+
+        self.conn.executemany("DELETE FROM docs WHERE path = ?", [(path,) for path in deleted])
+        self._store(product_id, entries)
+        self._mark_synced(product_id)
+        print(f"Snapshot of {product_id}: {len(entries)} changed, {len(deleted)} removed, "
+              f"{len(listing) - len(changed)} unchanged.")
+        return True
@@ -1,16 +1,34 @@
+import argparse
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import FailedPrecondition, InvalidArgument
 from google.cloud.firestore_v1.base_query import FieldFilter
-import pandas as pd
 from tqdm import tqdm
 from datetime import datetime, timezone
 import sys
 import os
 
+# The streaming export writer and transfer accounting are shared with the aiMetrics scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "aiMetrics"))
+from firestore_fetch import TransferMeter
+from row_writer import FORMATS, RowWriter
+
 # --- Configuration ---
 SERVICE_ACCOUNT_KEY_PATH = "~/..."
 OUTPUT_FILE_PATH = "~/ecoze-firebase/apcfSDCFReview2.xlsx"
 COLLECTION_NAME = "products_new"
+# Export column order
+COLUMNS = [
+    "name", "supplier_cf", "oscf", "socf_lifecycle_stages", 
+    "extra_information", "sdcf_standards", "sdcf_iso_aligned",
+    "supplier_cf2", "oscf2", "socf_lifecycle_stages2", 
+    "extra_information2", "sdcf_standards2", "sdcf_iso_aligned2"
+]
+# Parquet column types (other columns, e.g. sdcf_iso_aligned which may be a bool or text, are stored as text)
+COLUMN_TYPES = {"supplier_cf": "float", "oscf": "float", "supplier_cf2": "float", "oscf2": "float"}
+PLANS = ["auto", "inequality", "scan"]
+PAGE_SIZE = 1000        # Documents per page of the fallback scan
+GET_ALL_CHUNK = 300     # Documents per batched get_all() in the fallback scan
 # --------------------
 
 def initialize_firebase():
@@ -34,7 +52,90 @@ def format_list_field(value):
         return ", ".join([str(v) for v in value if v])
     return str(value) if value is not None else ""
 
+def plan_inequality(db, target_date, meter):
+    """
+    Both filters server-side: createdAt >= target_date AND supplier_cf != 0,
+    projected to the exported fields. Needs a backend with multiple-inequality
+    queries and a composite index on (createdAt, supplier_cf).
+    """
+    query = db.collection(COLLECTION_NAME)\
+        .where(filter=FieldFilter("createdAt", ">=", target_date))\
+        .where(filter=FieldFilter("supplier_cf", "!=", 0))\
+        .select(COLUMNS)
+    for doc in query.stream():
+        meter.add(doc)
+        yield doc
+
+def plan_scan(db, target_date, meter):
+    """
+    Fallback: pages through the date range reading only supplier_cf, then
+    fetches the exported fields of the non-zero documents with get_all().
+    """
+    base = db.collection(COLLECTION_NAME)\
+        .where(filter=FieldFilter("createdAt", ">=", target_date))\
+        .order_by("createdAt")\
+        .select(["createdAt", "supplier_cf"])
+    last = None
+    while True:
+        page_query = base.start_after(last) if last is not None else base
+        page = list(page_query.limit(PAGE_SIZE).stream())
+        matching = []
+        for snap in page:
+            meter.add(snap)
+            supplier_cf = (snap.to_dict() or {}).get("supplier_cf")
+            if supplier_cf is not None and supplier_cf != 0:
+                matching.append(snap.reference)
+        for i in range(0, len(matching), GET_ALL_CHUNK):
+            for doc in db.get_all(matching[i:i + GET_ALL_CHUNK], field_paths=COLUMNS):
+                meter.add(doc)
+                yield doc
+        if len(page) < PAGE_SIZE:
+            return
+        last = page[-1]
+
+def run_plan(db, target_date, plan, stats):
+    """
+    Yields the documents to export using the chosen plan. "auto" tries the
+    inequality plan and falls back to the scan if the backend rejects it
+    (missing index or no multiple-inequality support). stats gets the plan
+    used and its TransferMeter.
+    """
+    if plan in ("auto", "inequality"):
+        stats["plan"], stats["meter"] = "inequality", TransferMeter("inequality")
+        docs = plan_inequality(db, target_date, stats["meter"])
+        try:
+            # Errors surface on the first result
+            first = next(docs, None)
+        except (FailedPrecondition, InvalidArgument) as e:
+            if plan == "inequality":
+                raise
+            print(f"⚠️ Inequality query rejected ({e.message}).")
+            print("   Falling back to a paged, projected scan.")
+        else:
+            if first is not None:
+                yield first
+                yield from docs
+            return
+
+    stats["plan"], stats["meter"] = "scan", TransferMeter("scan")
+    yield from plan_scan(db, target_date, stats["meter"])
+
+def count_date_matches(db, target_date):
+    """Documents in the date range, via a count() aggregation (None if unavailable)."""
+    try:
+        query = db.collection(COLLECTION_NAME).where(filter=FieldFilter("createdAt", ">=", target_date))
+        return int(query.count().get()[0][0].value)
+    except Exception:
+        return None
+
 def main():
+    parser = argparse.ArgumentParser(description="Export products with a supplier CF for APCF/SDCF review.")
+    parser.add_argument("--format", choices=FORMATS, default="xlsx", help="Output format (rows are streamed)")
+    parser.add_argument("--plan", choices=PLANS, default="auto",
+                        help="inequality: filter supplier_cf server-side (composite index); "
+                             "scan: paged supplier_cf-only scan + get_all; auto: inequality, else scan")
+    args = parser.parse_args()
+
     print("=== APCF & SDCF Review Export ===\n")
 
     # 1. Setup
@@ -47,92 +148,81 @@ def main():
     print(f"🔍 Scanning '{COLLECTION_NAME}' collection...")
 
     # 2. Query Firestore
-    # We query by date first. We do NOT filter by supplier_cf != 0 in the query 
-    # to avoid 'Inequality on different fields' index errors.
-    docs_stream = db.collection(COLLECTION_NAME)\
-        .where(filter=FieldFilter("createdAt", ">=", target_date))\
-        .stream()
-
-    export_data = []
-    scanned_count = 0
+    # supplier_cf != 0 is filtered server-side when the backend allows two
+    # inequality fields; otherwise only supplier_cf is scanned and the
+    # exported fields are fetched for the matching documents alone.
+    stats = {}
+    docs_stream = run_plan(db, target_date, args.plan, stats)
 
-    # 3. Process Documents
-    for doc in tqdm(docs_stream, desc="Scanning Docs", unit="docs"):
-        data = doc.to_dict()
-        scanned_count += 1
+    # 3. Process Documents, writing each matching row as it arrives
+    # (the file is only created once the first row is written)
+    writer = RowWriter(OUTPUT_FILE_PATH, COLUMNS, args.format, types=COLUMN_TYPES)
+    print(f"💾 Saving to: {writer.path}...")
+    try:
+        for doc in tqdm(docs_stream, desc="Scanning Docs", unit="docs"):
+            data = doc.to_dict() or {}
         
-        # Check supplier_cf logic:
-        # Must exist AND be not equal to 0
-        supplier_cf = data.get("supplier_cf")
+            # Check supplier_cf logic (already applied by the plan; kept as a guard,
+            # since != also returns documents where supplier_cf is null):
+            # Must exist AND be not equal to 0
+            supplier_cf = data.get("supplier_cf")
         
-        if supplier_cf is None or supplier_cf == 0:
-            continue
+            if supplier_cf is None or supplier_cf == 0:
+                continue
             
-        # Extract fields for Set 1
-        name = data.get("name")
-        oscf = data.get("oscf")
-        socf_life = data.get("socf_lifecycle_stages")
-        extra_info = data.get("extra_information")
-        sdcf_stds = format_list_field(data.get("sdcf_standards"))
-        sdcf_iso = data.get("sdcf_iso_aligned")
+            # Extract fields for Set 1
+            name = data.get("name")
+            oscf = data.get("oscf")
+            socf_life = data.get("socf_lifecycle_stages")
+            extra_info = data.get("extra_information")
+            sdcf_stds = format_list_field(data.get("sdcf_standards"))
+            sdcf_iso = data.get("sdcf_iso_aligned")
         
-        # Extract fields for Set 2
-        supplier_cf2 = data.get("supplier_cf2")
-        oscf2 = data.get("oscf2")
-        socf_life2 = data.get("socf_lifecycle_stages2")
-        extra_info2 = data.get("extra_information2")
-        sdcf_stds2 = format_list_field(data.get("sdcf_standards2"))
-        sdcf_iso2 = data.get("sdcf_iso_aligned2")
-
-        # Build Row
-        row = {
-            "name": name,
-            "supplier_cf": supplier_cf,
-            "oscf": oscf,
-            "socf_lifecycle_stages": socf_life,
-            "extra_information": extra_info,
-            "sdcf_standards": sdcf_stds,
-            "sdcf_iso_aligned": sdcf_iso,
-            "supplier_cf2": supplier_cf2,
-            "oscf2": oscf2,
-            "socf_lifecycle_stages2": socf_life2,
-            "extra_information2": extra_info2,
-            "sdcf_standards2": sdcf_stds2,
-            "sdcf_iso_aligned2": sdcf_iso2
-        }
+            # Extract fields for Set 2
+            supplier_cf2 = data.get("supplier_cf2")
+            oscf2 = data.get("oscf2")
+            socf_life2 = data.get("socf_lifecycle_stages2")
+            extra_info2 = data.get("extra_information2")
+            sdcf_stds2 = format_list_field(data.get("sdcf_standards2"))
+            sdcf_iso2 = data.get("sdcf_iso_aligned2")
+
+            # Build Row
+            row = {
+                "name": name,
+                "supplier_cf": supplier_cf,
+                "oscf": oscf,
+                "socf_lifecycle_stages": socf_life,
+                "extra_information": extra_info,
+                "sdcf_standards": sdcf_stds,
+                "sdcf_iso_aligned": sdcf_iso,
+                "supplier_cf2": supplier_cf2,
+                "oscf2": oscf2,
+                "socf_lifecycle_stages2": socf_life2,
+                "extra_information2": extra_info2,
+                "sdcf_standards2": sdcf_stds2,
+                "sdcf_iso_aligned2": sdcf_iso2
+            }
         
-        export_data.append(row)
+            writer.write(row)
+    finally:
+        writer.close()
 
+    meter = stats["meter"].stop()
+    date_matches = count_date_matches(db, target_date)
     print("\n" + "-"*40)
-    print(f"Total Scanned (Date Match): {scanned_count}")
-    print(f"Total Exported (Supplier CF Match): {len(export_data)}")
+    print(f"Query plan: {stats['plan']}")
+    print(f"Total Date Match (count()): {date_matches if date_matches is not None else 'n/a'}")
+    print(f"Documents Read: {meter.docs} (~{meter.bytes / 1024:.1f} KB) in {meter.seconds:.2f}s")
+    print(f"Total Exported (Supplier CF Match): {writer.count}")
+    if date_matches:
+        print(f"Returned / Date Match: {writer.count / date_matches:.1%}")
     print("-"*40 + "\n")
 
-    # 4. Save to Excel
-    if export_data:
-        # Ensure directory exists
-        output_dir = os.path.dirname(OUTPUT_FILE_PATH)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        print(f"💾 Saving to: {OUTPUT_FILE_PATH}...")
-        df = pd.DataFrame(export_data)
-        
-        # Enforce column order as requested
-        columns_order = [
-            "name", "supplier_cf", "oscf", "socf_lifecycle_stages", 
-            "extra_information", "sdcf_standards", "sdcf_iso_aligned",
-            "supplier_cf2", "oscf2", "socf_lifecycle_stages2", 
-            "extra_information2", "sdcf_standards2", "sdcf_iso_aligned2"
-        ]
-        
-        # Reorder columns (safety check in case keys were added in different order)
-        df = df[columns_order]
-        
-        df.to_excel(OUTPUT_FILE_PATH, index=False)
+    # 4. Report
+    if writer.count:
         print("✅ Export successful.")
     else:
-        print("⚠️ No documents matched criteria. Excel file not created.")
+        print("⚠️ No documents matched criteria. Output file not created.")
 
 if __name__ == "__main__":
     main()
@@ -1,15 +1,22 @@
+import argparse
 import os
 import glob
 import base64
-import re
+import time
 import pandas as pd
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from google import genai
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from google.genai import types
 
 from dotenv import load_dotenv
 
+from genai_pool import get_client, print_connection_stats
+from rate_limiter import get_governor
+from pdf_batching import MAX_IN_FLIGHT_BYTES, ByteBudget, Job, peak_rss_mb, plan_jobs
+from document_index import DocumentIndex, index_path_for
+from response_parser import parse_records
+from telemetry import print_telemetry_summary, search_queries_of, set_product, track
+
 load_dotenv()
 
 # Retrieve the API key
@@ -21,155 +28,291 @@ if not API_KEY:
 
 # --- CONFIGURATION ---
 INPUT_DIR = "~/ecoze-firebase/ai-testing/mpcffull/documents/"
-OUTPUT_FILE = "~/ecoze-firebase/ai-testing/mpcffull/results.xlsx"
+OUTPUT_FILE = os.path.expanduser("~/ecoze-firebase/ai-testing/mpcffull/results.xlsx")
 MODEL_NAME = "aiModelPlaceholder"
 
+# Shared rate limiter / concurrency governor (sizes the thread pool too)
+GOVERNOR = get_governor()
+
+# Caps the PDF bytes held by in-flight requests across all workers
+BYTE_BUDGET = ByteBudget(MAX_IN_FLIGHT_BYTES)
+
+# --- SYSTEM INSTRUCTION ---
+SYS_MSG = """Your job is to scan a document given to you and extract information. Output your answer in the exact following format and no other text (note, a document may contain multiple configurations for the product and you must give these separately):
+
+/product_name_1 (String) = the name of the product (including brand name)
+/total_cf_kg (Double) = the official total cradle-to-grave carbon footprint of the product which has been disclosed by the manufacturer (kgCO2e)
+/materials_manufacturing_cf_percentage (Double) = the percentage of the products carbon footprint stemming from materials and manufacturing
+/transportation_cf_percentage (Double) =  the percentage of the products carbon footprint stemming from transportation
+/use_phase_cf_percentage (Double) = ...
+/end_of_life_cf_percentage (Double) = ...
+/url (String) = the url of the EPD where an AI got this information from
+/cradle_to_gate_cf = the official cradle-to-gate carbon footprint of the product (kgCO2e)
+
+[repeat for all other configurations if any]
+
+/product_name_N (String) = the name of the product (including brand name)
+/total_cf_kg (Double) = ...
+[... same fields ...]
+"""
+
 def parse_ai_response(response_text):
     """
     Parses the structured text output from the AI into a list of dictionaries.
     Each dictionary represents one product configuration (one row in Excel).
     """
-    products = []
-    current_product = {}
-    
-    # Split text into lines and process
-    lines = response_text.strip().split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Regex to find lines starting with "/" and containing "="
-        # Matches: /key (Type) = value
-        match = re.match(r'^/(\w+)(?:_\d+)?\s*(?:\(.*\))?\s*=\s*(.*)', line)
-        
-        if match:
-            raw_key = match.group(1) # e.g., product_name (removes _1, _2 suffix handling)
-            value = match.group(2).strip()
-            
-            # If we see a 'product_name' key and current_product is not empty, 
-            # it implies the start of a new product block. Push the old one.
-            if "product_name" in raw_key and current_product:
-                products.append(current_product)
-                current_product = {}
-            
-            # clean key: remove suffixes like _1, _2 if regex didn't catch specific numbering patterns
-            # The regex `(\w+)` combined with `(?:_\d+)?` attempts to separate "product_name" from "_1"
-            # So raw_key should be clean (e.g. "product_name")
-            
-            current_product[raw_key] = value
-
-    # Append the last product found
-    if current_product:
-        products.append(current_product)
-        
+    # /key_N (Type) = value lines; a new product starts at every /product_name_N.
+    # The _N suffix is dropped so every configuration lands in the same columns.
+    products, errors = parse_records(response_text)
+    for error in errors:
+        print(f"\n⚠️  Could not parse /{error.key} value: {error.raw[:80]}")
     return products
 
-def process_document(file_path):
+def _upload(client, path):
+    """Uploads a large PDF through the Files API (streamed from disk) and waits until it is usable."""
+    uploaded = GOVERNOR.call(
+        "files",
+        client.files.upload,
+        file=path,
+        config=types.UploadFileConfig(mime_type="application/pdf"),
+    )
+    while uploaded.state and uploaded.state.name == "PROCESSING":
+        time.sleep(2)
+        uploaded = client.files.get(name=uploaded.name)
+    return uploaded
+
+def process_job(job):
     """
-    Sends a single document to Gemini and extracts data.
+    Sends one job (an uploaded document, or one or more inline documents)
+    to Gemini and extracts data.
+    Returns (rows, bytes_sent) where bytes_sent maps file name -> bytes;
+    rows is None if the request failed.
     """
+    names = job.names
+    uploaded = None
+    BYTE_BUDGET.acquire(job.total_bytes)
     try:
-        # Initialize Client
-        client = genai.Client(api_key=API_KEY)
+        # Shared pooled client (one connection pool for the whole run)
+        client = get_client(API_KEY)
 
-        # Read file bytes
-        with open(file_path, "rb") as f:
-            file_bytes = f.read()
+        parts = []
+        if job.mode == "upload":
+            uploaded = _upload(client, job.paths[0])
+            parts.append(types.Part.from_uri(file_uri=uploaded.uri, mime_type="application/pdf"))
+        else:
+            for path, name in zip(job.paths, names):
+                if len(names) > 1:
+                    parts.append(types.Part.from_text(text=f"Document file name: {name}"))
+                with open(path, "rb") as f:
+                    parts.append(types.Part.from_bytes(mime_type="application/pdf", data=f.read()))
+
+        if len(names) > 1:
+            prompt = (
+                f"Extract the carbon footprint data for all configurations in each of these {len(names)} documents. "
+                "Directly after every /product_name line, add a line '/source_file (String) = <document file name>' "
+                "naming the document it came from."
+            )
+        else:
+            prompt = "Extract the carbon footprint data for all configurations in this document."
+        parts.append(types.Part.from_text(text=prompt))
 
         # Define the Prompt (System instructions + few-shot example included in config below)
         # Note: We structure the user prompt to mimic the requested example structure
-        
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_bytes(
-                        mime_type="application/pdf",
-                        data=file_bytes 
-                    ),
-                    types.Part.from_text(text="Extract the carbon footprint data for all configurations in this document."),
-                ],
-            ),
-        ]
+        contents = [types.Content(role="user", parts=parts)]
 
         # Use the specific system instruction provided in your prompt
         generate_content_config = types.GenerateContentConfig(
             thinking_config=types.ThinkingConfig(
                 thinking_level="HIGH",
             ),
-            system_instruction=[
-                types.Part.from_text(text="""Your job is to scan a document given to you and extract information. Output your answer in the exact following format and no other text (note, a document may contain multiple configurations for the product and you must give these separately):
-
-/product_name_1 (String) = the name of the product (including brand name)
-/total_cf_kg (Double) = the official total cradle-to-grave carbon footprint of the product which has been disclosed by the manufacturer (kgCO2e)
-/materials_manufacturing_cf_percentage (Double) = the percentage of the products carbon footprint stemming from materials and manufacturing
-/transportation_cf_percentage (Double) =  the percentage of the products carbon footprint stemming from transportation
-/use_phase_cf_percentage (Double) = ...
-/end_of_life_cf_percentage (Double) = ...
-/url (String) = the url of the EPD where an AI got this information from
-/cradle_to_gate_cf = the official cradle-to-gate carbon footprint of the product (kgCO2e)
-
-[repeat for all other configurations if any]
-
-/product_name_N (String) = the name of the product (including brand name)
-/total_cf_kg (Double) = ...
-[... same fields ...]
-"""),
-            ],
+            system_instruction=[types.Part.from_text(text=SYS_MSG)],
             temperature=1 # Low temperature for more deterministic data extraction
         )
 
         # Non-streaming call is easier for data extraction tasks
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=contents,
-            config=generate_content_config,
-        )
+        # PDFs are billed at ~258 tokens per page; use file size as a rough proxy
+        set_product(", ".join(names))
+        call = track(MODEL_NAME, f"extraction_{job.mode}" if len(names) == 1 else "extraction_packed")
+        try:
+            response = GOVERNOR.call(
+                MODEL_NAME,
+                call.wrap(client.models.generate_content),
+                model=MODEL_NAME,
+                contents=contents,
+                config=generate_content_config,
+                est_tokens=job.total_bytes // 100,
+            )
+        except Exception:
+            call.finish(ok=False)
+            raise
+        call.finish(usage=response.usage_metadata, search_queries=search_queries_of(response))
+        del contents, parts
 
         # Extract text from response (concatenating parts if necessary)
-        if response.text:
-            return parse_ai_response(response.text)
-        else:
-            return []
+        rows = parse_ai_response(response.text) if response.text else []
+
+        # Add source filename to data for traceability
+        for row in rows:
+            if len(names) == 1:
+                row['source_file'] = names[0]
+            elif row.get('source_file') not in names:
+                row['source_file'] = ", ".join(names)
+
+        return rows, {os.path.basename(path): size for path, size in job.sizes.items()}
 
     except Exception as e:
-        print(f"\nError processing {os.path.basename(file_path)}: {e}")
-        return []
+        print(f"\nError processing {', '.join(names)}: {e}")
+        return None, {}
+    finally:
+        BYTE_BUDGET.release(job.total_bytes)
+        if uploaded is not None:
+            try:
+                get_client(API_KEY).files.delete(name=uploaded.name)
+            except Exception:
+                pass
+
+def parse_since(value, index):
+    """--since value -> epoch seconds. Accepts 'last' (start of the last completed scan) or an ISO date/datetime."""
+    if value == "last":
+        cutoff = index.last_scan()
+        if cutoff is None:
+            print("No previous scan recorded; scanning all documents.")
+        return cutoff
+    return pd.Timestamp(value).timestamp()
+
+def select_pending(files, index, force=False):
+    """
+    Hashes the documents and returns {sha256: path} for the ones that still
+    need extracting. Identical content under several names is sent once.
+    """
+    pending = {}
+    skipped = 0
+    for path in tqdm(files, unit="doc", desc="Indexing"):
+        sha = index.digest(path)
+        if sha in pending or (not force and index.is_done(sha)):
+            skipped += 1
+            continue
+        pending[sha] = path
+    return pending, skipped
+
+def rows_by_document(job, rows):
+    """
+    Splits a job's rows per document name. Returns (by_name, unattributed):
+    rows of a packed job without a matching /source_file cannot be credited
+    to any one document and are returned separately.
+    """
+    by_name = {name: [] for name in job.names}
+    unattributed = []
+    for row in rows:
+        name = job.names[0] if len(job.names) == 1 else row.get("source_file")
+        if name in by_name:
+            by_name[name].append(row)
+        else:
+            unattributed.append(row)
+    return by_name, unattributed
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract official carbon footprints from EPD PDFs.")
+    parser.add_argument("--since", help="Only consider PDFs modified after this ISO date/datetime, or 'last' for the last completed scan")
+    parser.add_argument("--force", action="store_true", help="Re-extract documents already in the index")
+    args = parser.parse_args()
+
+    index = DocumentIndex(index_path_for(OUTPUT_FILE))
+    scan_started = time.time()
+
     # 1. Find all PDF documents
-    search_pattern = os.path.join(INPUT_DIR, "*.pdf")
+    search_pattern = os.path.join(os.path.expanduser(INPUT_DIR), "*.pdf")
     files = glob.glob(search_pattern)
-    
-    if not files:
+
+    # Rows of PDFs deleted from INPUT_DIR leave the workbook
+    removed = index.prune()
+    if removed:
+        print(f"Dropping {removed} documents no longer in {INPUT_DIR} from the workbook.")
+
+    if not files and not removed:
         print(f"No PDF files found in {INPUT_DIR}")
         return
 
-    print(f"Found {len(files)} documents. Processing...")
+    if args.since:
+        cutoff = parse_since(args.since, index)
+        if cutoff is not None:
+            files = [path for path in files if os.path.getmtime(path) > cutoff]
+            print(f"{len(files)} documents modified since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(cutoff))}.")
+
+    pending, skipped = select_pending(files, index, args.force)
+    sha_by_path = {path: sha for sha, path in pending.items()}
+    if skipped:
+        print(f"Skipping {skipped} documents already extracted (or duplicated) in {index.path}.")
+    if not pending and not removed:
+        print("Nothing new to extract.")
+        index.set_last_scan(scan_started)
+        return
+
+    jobs = plan_jobs(list(pending.values()))
+    uploads = sum(1 for job in jobs if job.mode == "upload")
+    if pending:
+        print(f"Found {len(pending)} new or changed documents. Processing as {len(jobs)} requests ({uploads} via file upload)...")
 
     all_extracted_rows = []
+    failed = 0
+    rerun = 0
+    bytes_sent = {}
 
     # 2. Process in Parallel with tqdm progress bar
-    # Adjust max_workers based on your rate limits (usually 5-10 is safe for standard keys)
-    with ThreadPoolExecutor(max_workers=5) as executor:
+    # The governor adapts in-flight calls to the rate limits, so the pool can be generous
+    with ThreadPoolExecutor(max_workers=GOVERNOR.max_concurrency) as executor:
         # Submit all tasks
-        future_to_file = {executor.submit(process_document, f): f for f in files}
+        future_to_job = {executor.submit(process_job, job): job for job in jobs}
         
-        # Process as they complete
-        for future in tqdm(as_completed(future_to_file), total=len(files), unit="doc"):
-            data = future.result()
-            if data:
-                # Add source filename to data for traceability
-                file_name = os.path.basename(future_to_file[future])
-                for row in data:
-                    row['source_file'] = file_name
-                    all_extracted_rows.append(row)
+        # Process as they complete; packed documents without attributable rows are resubmitted on their own
+        with tqdm(total=len(pending), unit="doc") as progress:
+            while future_to_job:
+                done, _ = wait(future_to_job, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = future_to_job.pop(future)
+                    data, sent = future.result()
+                    bytes_sent.update(sent)
+                    if data is None:
+                        # Leave failed documents marked so the next run retries them
+                        for path, name in zip(job.paths, job.names):
+                            index.record(sha_by_path[path], name, "failed", error="request failed")
+                        failed += len(job.paths)
+                        progress.update(len(job.paths))
+                        continue
+
+                    by_name, unattributed = rows_by_document(job, data)
+                    if unattributed:
+                        # Any of the pack's documents may be missing those rows: extract each on its own
+                        print(f"\n⚠️  {len(unattributed)} rows from {', '.join(job.names)} named no known /source_file; "
+                              f"discarding this response and re-extracting its {len(job.paths)} documents one at a time.")
+                    for path, name in zip(job.paths, job.names):
+                        rows = by_name[name]
+                        if len(job.paths) > 1 and (unattributed or not rows):
+                            single = Job("inline", [path])
+                            future_to_job[executor.submit(process_job, single)] = single
+                            rerun += 1
+                        elif rows:
+                            index.record(sha_by_path[path], name, "done", rows)
+                            all_extracted_rows.extend(rows)
+                            progress.update(1)
+                        else:
+                            # Empty or unparseable response: not done, so the next run retries it
+                            index.record(sha_by_path[path], name, "failed", error="no rows extracted")
+                            failed += 1
+                            progress.update(1)
+
+    print("\n--- Ingestion Stats ---")
+    for name, size in sorted(bytes_sent.items()):
+        print(f"{name}: {size / 1024:.0f} KB sent")
+    print(f"Total sent: {sum(bytes_sent.values()) / (1024 * 1024):.1f} MB in {len(jobs) + rerun} requests ({rerun} unpacked re-runs)")
+    print(f"Peak in-flight PDF bytes: {BYTE_BUDGET.peak / (1024 * 1024):.1f} MB")
+    print(f"Peak memory (RSS): {peak_rss_mb():.0f} MB")
 
     # 3. Write to Excel
-    if all_extracted_rows:
-        df_new = pd.DataFrame(all_extracted_rows)
+    # The workbook is rebuilt from the index, so documents skipped as already
+    # extracted keep their rows from earlier runs
+    if all_extracted_rows or removed:
+        df_new = pd.DataFrame(index.done_rows())
         
         # Clean up column order if desired, or leave as is
         # Ensure numeric columns are actually numeric
@@ -182,25 +325,38 @@ def main():
             if col in df_new.columns:
                 df_new[col] = pd.to_numeric(df_new[col], errors='coerce')
 
-        # Check if Excel exists to append, otherwise create new
+        # Keep rows of an existing workbook only for documents the index has never seen
         if os.path.exists(OUTPUT_FILE):
-            print(f"Appending to existing file: {OUTPUT_FILE}")
-            # Load existing
+            print(f"Updating existing file: {OUTPUT_FILE}")
             try:
                 df_existing = pd.read_excel(OUTPUT_FILE)
+                if "source_file" in df_existing.columns:
+                    df_existing = df_existing[~df_existing["source_file"].isin(index.file_names())]
                 df_combined = pd.concat([df_existing, df_new], ignore_index=True)
             except Exception as e:
-                print(f"Could not read existing Excel file (might be corrupt or empty). Creating new. Error: {e}")
+                print(f"Could not read existing Excel file (might be corrupt or empty). Rebuilding from the index. Error: {e}")
                 df_combined = df_new
         else:
             print(f"Creating new file: {OUTPUT_FILE}")
             df_combined = df_new
             
         # Save
+        df_combined = df_combined.drop_duplicates(ignore_index=True)
         df_combined.to_excel(OUTPUT_FILE, index=False)
         print("Done successfully.")
     else:
         print("No data was extracted from any documents.")
 
+    # Only move the --since last marker forward once every document made it into the index
+    if not failed:
+        index.set_last_scan(scan_started)
+    else:
+        print(f"{failed} documents failed and will be retried on the next run.")
+    print(f"Index: {index.counts()}")
+
+    print_connection_stats()
+    GOVERNOR.print_stats()
+    print_telemetry_summary()
+
 if __name__ == "__main__":
     main()
@@ -1,14 +1,20 @@
+import argparse
 import os
 import shutil
-import re
 import pandas as pd
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from google import genai
 from google.genai import types
 
 from dotenv import load_dotenv
 
+from genai_pool import get_client, print_connection_stats
+from rate_limiter import estimate_tokens, get_governor
+from response_cache import lookup, print_cache_stats, store
+from batch_backend import BACKENDS, make_backend, run_batch
+from response_parser import parse
+from telemetry import print_telemetry_summary, search_queries_of, set_product, track
+
 load_dotenv()
 
 # Retrieve the API key
@@ -23,9 +29,15 @@ SOURCE_FILE = "~/…"
 TARGET_FILE = "~/…"
 MODEL_NAME = "..."
 
+# Shared rate limiter / concurrency governor (sizes the thread pool too)
+GOVERNOR = get_governor()
+
 # --- SYSTEM INSTRUCTION ---
 SYS_MSG = """..."""
 
+# Star fields of the answer; other "* word:" lines are part of a methodology
+EF_KEYS = {'sb_cf', 'sb_methodology_used', 'ab_cf', 'ab_methodology_used'}
+
 def parse_ai_response(text):
     """
     Parses the structured response into a dictionary for the dataframe.
@@ -33,47 +45,14 @@ def parse_ai_response(text):
     if not text:
         return {}
     
-    data = {
-        'spend_based_ef_cf': None,
-        'ai_reasoning_sef': None,
-        'activity_based_ef_cf': None,
-        'ai_resoning_aef': None
+    # Single pass over the *key: fields (methodologies may span several lines)
+    result = parse(text, numeric={'sb_cf', 'ab_cf'}, keys=EF_KEYS)
+    return {
+        'spend_based_ef_cf': result.get('sb_cf'),
+        'ai_reasoning_sef': result.get('sb_methodology_used'),
+        'activity_based_ef_cf': result.get('ab_cf'),
+        'ai_resoning_aef': result.get('ab_methodology_used'),
     }
-    
-    # Regex to find values after the keys
-    # We use re.DOTALL to capture multi-line methodology descriptions
-    
-    # 1. sb_cf (capture numbers only)
-    sb_cf_match = re.search(r'\*sb_cf:\s*([0-9.,]+)', text)
-    if sb_cf_match:
-        try:
-            # Clean number string (remove commas)
-            clean_num = sb_cf_match.group(1).replace(',', '')
-            data['spend_based_ef_cf'] = float(clean_num)
-        except ValueError:
-            pass
-
-    # 2. sb_methodology_used
-    # Capture everything until the next asterisk or end of string
-    sb_meth_match = re.search(r'\*sb_methodology_used:\s*(.*?)(?=\*ab_cf|\Z)', text, re.DOTALL)
-    if sb_meth_match:
-        data['ai_reasoning_sef'] = sb_meth_match.group(1).strip()
-
-    # 3. ab_cf
-    ab_cf_match = re.search(r'\*ab_cf:\s*([0-9.,]+)', text)
-    if ab_cf_match:
-        try:
-            clean_num = ab_cf_match.group(1).replace(',', '')
-            data['activity_based_ef_cf'] = float(clean_num)
-        except ValueError:
-            pass
-
-    # 4. ab_methodology_used
-    ab_meth_match = re.search(r'\*ab_methodology_used:\s*(.*?)(?=$|\Z)', text, re.DOTALL)
-    if ab_meth_match:
-        data['ai_resoning_aef'] = ab_meth_match.group(1).strip()
-        
-    return data
 
 def process_product(product_name):
     """
@@ -83,7 +62,7 @@ def process_product(product_name):
         return {}
 
     try:
-        client = genai.Client(api_key=API_KEY)
+        client = get_client(API_KEY)
         
         # Tools configuration
         tools = [
@@ -98,13 +77,30 @@ def process_product(product_name):
             thinking_config=types.ThinkingConfig(thinking_level="HIGH") # Using reasoning to find factors
         )
 
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[product_name],
-            config=generate_content_config,
-        )
+        # Opt-in response cache (GENAI_CACHE=1): identical requests skip the API
+        set_product(product_name)
+        call = track(MODEL_NAME, "emission_factors")
+        cache_key, cached = lookup(MODEL_NAME, [product_name], generate_content_config)
+        if cached is not None:
+            call.finish(cached=True)
+            return parse_ai_response(cached)
+
+        try:
+            response = GOVERNOR.call(
+                MODEL_NAME,
+                call.wrap(client.models.generate_content),
+                model=MODEL_NAME,
+                contents=[product_name],
+                config=generate_content_config,
+                est_tokens=estimate_tokens([SYS_MSG, product_name]),
+            )
+        except Exception:
+            call.finish(ok=False)
+            raise
+        call.finish(usage=response.usage_metadata, search_queries=search_queries_of(response))
 
         if response.text:
+            store(cache_key, MODEL_NAME, response.text)
             return parse_ai_response(response.text)
         else:
             return {}
@@ -113,29 +109,23 @@ def process_product(product_name):
         print(f"Error processing '{product_name}': {e}")
         return {}
 
-def main():
-    # 1. Duplicate File
-    if not os.path.exists(SOURCE_FILE):
-        print(f"Source file not found: {SOURCE_FILE}")
-        return
-
-    print(f"Duplicating {SOURCE_FILE} to {TARGET_FILE}...")
-    shutil.copyfile(SOURCE_FILE, TARGET_FILE)
-
-    # 2. Load the duplicated file
-    df = pd.read_excel(TARGET_FILE)
-    
-    if "product_name" not in df.columns:
-        print("Error: 'product_name' column not found in Excel file.")
-        return
+def batch_request(product_name):
+    """The process_product() request as a Batch API (REST JSON) request."""
+    return {
+        "contents": [{"role": "user", "parts": [{"text": str(product_name)}]}],
+        "systemInstruction": {"parts": [{"text": SYS_MSG}]},
+        "tools": [{"googleSearch": {}}, {"urlContext": {}}],
+        "generationConfig": {"temperature": 0.7, "thinkingConfig": {"thinkingLevel": "HIGH"}},
+    }
 
-    print(f"Processing {len(df)} rows (10 at a time)...")
+def run_interactive(df):
+    """Low-latency path: one governed call per row on a thread pool. Returns {index: data_dict}."""
+    print(f"Processing {len(df)} rows (up to {GOVERNOR.max_concurrency} at a time)...")
 
     # Storage for results {index: data_dict}
     results_map = {}
 
-    # 3. Parallel Processing
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    with ThreadPoolExecutor(max_workers=GOVERNOR.max_concurrency) as executor:
         # Submit all tasks
         future_to_index = {
             executor.submit(process_product, row['product_name']): index 
@@ -152,6 +142,47 @@ def main():
                 print(f"Thread error on index {index}: {e}")
                 results_map[index] = {}
 
+    return results_map
+
+def run_batch_mode(df, backend_name):
+    """Overnight path: every row in one batch job. Returns {index: data_dict}."""
+    requests = {
+        index: batch_request(row['product_name'])
+        for index, row in df.iterrows()
+        if row['product_name'] and not pd.isna(row['product_name'])
+    }
+    print(f"Processing {len(requests)} rows as one batch job ({backend_name} backend)...")
+    texts = run_batch(make_backend(backend_name, API_KEY), MODEL_NAME, requests, display_name="emissions-factors")
+    return {index: parse_ai_response(text) for index, text in texts.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Find spend- and activity-based emission factors per product.")
+    parser.add_argument("--mode", choices=["interactive", "batch"], default="interactive",
+                        help="interactive: parallel calls, results in minutes; batch: one Batch API job, cheaper but slower")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="gemini", help="Batch backend (batch mode only)")
+    args = parser.parse_args()
+
+    # 1. Duplicate File
+    if not os.path.exists(SOURCE_FILE):
+        print(f"Source file not found: {SOURCE_FILE}")
+        return
+
+    print(f"Duplicating {SOURCE_FILE} to {TARGET_FILE}...")
+    shutil.copyfile(SOURCE_FILE, TARGET_FILE)
+
+    # 2. Load the duplicated file
+    df = pd.read_excel(TARGET_FILE)
+    
+    if "product_name" not in df.columns:
+        print("Error: 'product_name' column not found in Excel file.")
+        return
+
+    # 3. Call the model (parallel interactive calls, or one batch job)
+    if args.mode == "batch":
+        results_map = run_batch_mode(df, args.backend)
+    else:
+        results_map = run_interactive(df)
+
     # 4. Update DataFrame
     # Initialize empty columns if they don't exist
     new_cols = ['spend_based_ef_cf', 'ai_reasoning_sef', 'activity_based_ef_cf', 'ai_resoning_aef']
@@ -171,6 +202,10 @@ def main():
     print(f"Saving results to {TARGET_FILE}...")
     df.to_excel(TARGET_FILE, index=False)
     print("Done.")
+    print_connection_stats()
+    GOVERNOR.print_stats()
+    print_cache_stats()
+    print_telemetry_summary()
 
 if __name__ == "__main__":
     main()
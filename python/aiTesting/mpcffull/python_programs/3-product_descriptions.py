@@ -1,5 +1,5 @@
+import argparse
 import pandas as pd
-import requests
 import json
 import os
 import sys
@@ -8,6 +8,12 @@ from pathlib import Path
 import concurrent.futures
 from dotenv import load_dotenv
 
+from genai_pool import BASE_URL, get_session, print_connection_stats
+from rate_limiter import THROTTLE_STATUSES, RetryableStatus, estimate_tokens, get_governor
+from checkpoint_journal import CheckpointJournal, journal_path_for
+from batch_backend import BACKENDS, make_backend, run_batch
+from telemetry import print_telemetry_summary, search_queries_of, set_product, track
+
 load_dotenv()
 
 # Retrieve the API key
@@ -19,20 +25,39 @@ if not API_KEY:
     
 INPUT_FILE = "~/ecoze-firebase/eai-testing/mpcffull/pcf_testing2.xlsx"
 MODEL_NAME = "aiModelPlaceholder" 
-BATCH_SIZE = 10
+
+# Shared rate limiter / concurrency governor (sizes the thread pool too)
+GOVERNOR = get_governor()
+
+# --- SYSTEM INSTRUCTIONS ---
+SYS_RESEARCH = """Your job is to take in a product name and research the product. You will be constructing a detailed description of what the product is and does, including what it is made from.
+
+!! You MUST use your google search and url context tools to ground your answer on the most up to date information. !!
+
+Output your answer in the exact following format and no other text:
+"
+Description: 
+[Set to "..." if the description passed. If the description didnt pass, output the complete new description here.]
+"
+"""
+
+SYS_FACT_CHECK = """Your job is to take in a product name and a description of the product. You must fact check the description and create a new description where necessary.
+
+!! You MUST use your google search and url context tools to ground your answer on the most up to date information. !!
+
+Output your answer in the exact following format and no other text:
+"
+*pass_or_fail: [Set as "Pass" and no other text if the description doesnt need changing, set as "Fail" if the description needs changing.]
+*description: [Set to "..." if the description passed. If the description didnt pass, output the complete new description here.]
+"
+"""
 
 # Endpoint
-URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent?key={API_KEY}"
+URL = f"{BASE_URL}/v1beta/models/{MODEL_NAME}:generateContent?key={API_KEY}"
 
-def call_gemini(prompt, system_instruction):
-    """
-    Calls the Gemini API with the specified parameters.
-    """
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
+def build_payload(prompt, system_instruction):
+    """generateContent request body; also used as-is for batch requests."""
+    return {
         "contents": [{
             "parts": [{"text": prompt}]
         }],
@@ -51,15 +76,40 @@ def call_gemini(prompt, system_instruction):
             # "thinkingConfig": {"include_thoughts": True} 
         }
     }
+
+def call_gemini(prompt, system_instruction, step=None):
+    """
+    Calls the Gemini API with the specified parameters.
+    Tokens, latency and cost are recorded under `step` (see telemetry.py).
+    """
+    headers = {
+        "Content-Type": "application/json"
+    }
+    
+    payload = build_payload(prompt, system_instruction)
     
+    def _post():
+        response = get_session().post(URL, headers=headers, json=payload)
+        # Let the governor back off and retry on 429/5xx
+        if response.status_code in THROTTLE_STATUSES:
+            raise RetryableStatus(response.status_code, response.text[:200])
+        return response
+
+    call = track(MODEL_NAME, step)
     try:
-        response = requests.post(URL, headers=headers, json=payload)
+        try:
+            response = GOVERNOR.call(MODEL_NAME, call.wrap(_post), est_tokens=estimate_tokens([prompt, system_instruction]))
+        except Exception:
+            call.finish(ok=False)
+            raise
         
         if response.status_code != 200:
+            call.finish(ok=False)
             print(f"   ❌ API Error ({response.status_code}): {response.text[:200]}")
             return None
             
         result = response.json()
+        call.finish(usage=result.get("usageMetadata"), search_queries=search_queries_of(result))
         
         # Extract text from the first candidate
         try:
@@ -130,21 +180,12 @@ def process_row(index, row):
         return index, None
 
     print(f"   ⏳ Processing: {product_name}...")
+    set_product(product_name)
     
     # --- Step 1: Research ---
     prompt_1 = product_name
-    sys_1 = """Your job is to take in a product name and research the product. You will be constructing a detailed description of what the product is and does, including what it is made from.
-
-!! You MUST use your google search and url context tools to ground your answer on the most up to date information. !!
-
-Output your answer in the exact following format and no other text:
-"
-Description: 
-[Set to "..." if the description passed. If the description didnt pass, output the complete new description here.]
-"
-""" 
     
-    desc_raw = call_gemini(prompt_1, sys_1)
+    desc_raw = call_gemini(prompt_1, SYS_RESEARCH, step="research")
     desc_1 = parse_step_1_output(desc_raw)
     
     if not desc_1:
@@ -152,26 +193,23 @@ Description:
         return index, None
 
     # --- Step 2: Fact Check ---
-    prompt_2 = f"""
+    check_raw = call_gemini(fact_check_prompt(product_name, desc_1), SYS_FACT_CHECK, step="fact_check")
+    status, desc_2 = parse_step_2_output(check_raw)
+    
+    return index, choose_description(product_name, desc_1, status, desc_2)
+
+def fact_check_prompt(product_name, desc_1):
+    """Step 2 user prompt for a product and its Step 1 description."""
+    return f"""
 Product Name:
 {product_name}
 
 Description given by the AI:
 {desc_1}
 """
-    sys_2 = """Your job is to take in a product name and a description of the product. You must fact check the description and create a new description where necessary.
-
-!! You MUST use your google search and url context tools to ground your answer on the most up to date information. !!
 
-Output your answer in the exact following format and no other text:
-"
-*pass_or_fail: [Set as "Pass" and no other text if the description doesnt need changing, set as "Fail" if the description needs changing.]
-*description: [Set to "..." if the description passed. If the description didnt pass, output the complete new description here.]
-"
-"""
-    check_raw = call_gemini(prompt_2, sys_2)
-    status, desc_2 = parse_step_2_output(check_raw)
-    
+def choose_description(product_name, desc_1, status, desc_2):
+    """Picks the final description from the Step 1 draft and the Step 2 verdict."""
     final_desc = ""
     
     if status == "Pass":
@@ -188,9 +226,65 @@ Output your answer in the exact following format and no other text:
         print(f"   ⚠️  [{product_name}] Unclear status '{status}'. Defaulting to original.")
         final_desc = desc_1
         
-    return index, final_desc
+    return final_desc
+
+def run_interactive(df, pending, journal):
+    """Low-latency path: both steps per row on a thread pool, journaling rows as they finish."""
+    # Submit every pending row up front; the governor decides how many run at once.
+    # Each finished row is appended to the journal instead of rewriting the workbook.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=GOVERNOR.max_concurrency) as executor:
+        futures = [executor.submit(process_row, idx, df.loc[idx]) for idx in pending]
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                res_idx, res_desc = future.result()
+                if res_desc is not None:
+                    df.at[res_idx, "product_description"] = res_desc
+                    journal.append(res_idx, {"product_description": res_desc})
+            except Exception as exc:
+                print(f"   ❌ A thread generated an exception: {exc}")
+
+def run_batch_mode(df, pending, journal, backend_name):
+    """
+    Overnight path: one batch job for every Step 1 (Research) request, then
+    one for the Step 2 (Fact Check) requests of the rows that got a draft.
+    """
+    backend = make_backend(backend_name, API_KEY)
+    names = {idx: str(df.at[idx, "product_name"]) for idx in pending}
+    names = {idx: name for idx, name in names.items() if name and name.lower() != "nan"}
+
+    # --- Step 1: Research ---
+    print(f"\n🔎 Step 1 (Research): {len(names)} rows")
+    research = run_batch(
+        backend, MODEL_NAME,
+        {idx: build_payload(name, SYS_RESEARCH) for idx, name in names.items()},
+        display_name="product-descriptions-research",
+    )
+    drafts = {idx: parse_step_1_output(text) for idx, text in research.items()}
+    drafts = {idx: desc for idx, desc in drafts.items() if desc}
+    for idx in names.keys() - drafts.keys():
+        print(f"   ⚠️  [{names[idx]}] Step 1 produced no output.")
+
+    # --- Step 2: Fact Check ---
+    print(f"\n🧐 Step 2 (Fact Check): {len(drafts)} rows")
+    checks = run_batch(
+        backend, MODEL_NAME,
+        {idx: build_payload(fact_check_prompt(names[idx], desc), SYS_FACT_CHECK) for idx, desc in drafts.items()},
+        display_name="product-descriptions-fact-check",
+    )
+    for idx, desc_1 in drafts.items():
+        status, desc_2 = parse_step_2_output(checks.get(idx))
+        final_desc = choose_description(names[idx], desc_1, status, desc_2)
+        df.at[idx, "product_description"] = final_desc
+        journal.append(idx, {"product_description": final_desc})
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate and fact-check product descriptions.")
+    parser.add_argument("--mode", choices=["interactive", "batch"], default="interactive",
+                        help="interactive: parallel calls, results in minutes; batch: two Batch API jobs, cheaper but slower")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="gemini", help="Batch backend (batch mode only)")
+    args = parser.parse_args()
+
     print(f"=== PCF Description Generator ({MODEL_NAME}) ===\n")
     
     if not os.path.exists(INPUT_FILE):
@@ -214,45 +308,27 @@ def main():
 
     total_rows = len(df)
     print(f"✅ Loaded {total_rows} rows.")
+
+    # Resume: rows described by an interrupted run are in the checkpoint journal
+    journal = CheckpointJournal(journal_path_for(INPUT_FILE))
+    done_indices = set(journal.load())
+    if done_indices:
+        journal.apply(df)
+        print(f"♻️  Resuming: {len(done_indices)} rows restored from {journal.path}.")
     
-    # Process in batches using ThreadPoolExecutor
-    # We use BATCH_SIZE workers to run them in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=BATCH_SIZE) as executor:
-        
-        # Iterate over the dataframe in chunks of BATCH_SIZE
-        for start_idx in range(0, total_rows, BATCH_SIZE):
-            end_idx = min(start_idx + BATCH_SIZE, total_rows)
-            print(f"\n🚀 Starting batch: Rows {start_idx + 1} to {end_idx}...")
-            
-            # Create a list of futures for the current batch
-            futures = []
-            
-            # We iterate by index to ensure we can update the correct row in the DF later
-            # Note: df.index might not be 0..N if filtered, but iloc works by position
-            # To be safe, we'll iterate over the actual indices in this slice
-            batch_indices = df.index[start_idx:end_idx]
-            
-            for idx in batch_indices:
-                row = df.loc[idx]
-                futures.append(executor.submit(process_row, idx, row))
-            
-            # Wait for all futures in the batch to complete
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    res_idx, res_desc = future.result()
-                    if res_desc is not None:
-                        df.at[res_idx, "product_description"] = res_desc
-                except Exception as exc:
-                    print(f"   ❌ A thread generated an exception: {exc}")
-            
-            # Save after each batch
-            print(f"   💾 Saving batch progress to {INPUT_FILE}...")
-            df.to_excel(INPUT_FILE, index=False)
+    pending = [idx for idx in df.index if idx not in done_indices]
+    if args.mode == "batch":
+        run_batch_mode(df, pending, journal, args.backend)
+    else:
+        run_interactive(df, pending, journal)
 
-    # Final Save (redundant but safe)
+    # Write the workbook once, now that every row is done
     print(f"\n💾 Saving final changes to {INPUT_FILE}...")
-    df.to_excel(INPUT_FILE, index=False)
+    journal.materialise(df, INPUT_FILE)
     print("✅ Process Complete.")
+    print_connection_stats()
+    GOVERNOR.print_stats()
+    print_telemetry_summary()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,13 +1,26 @@
+import argparse
+import asyncio
 import os
 import re
-import time
 import pandas as pd
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 
+from audit_cascade import (AUDIT_KEYS, CHEAP_STEP, CHEAP_THINKING_LEVEL, CONFIDENCE_INSTRUCTION, MAIN_STEP, confident_pass,
+                           escalation_reason, parse_rating, print_cascade_stats, record as record_audit)
+from chat_context import POLICIES, ChatContext, print_context_stats
+from genai_pool import get_client, print_connection_stats
+from prompt_cache import (PROMPT_CACHE_KINDS, enable_prompt_cache, get_prefix_cache, print_prompt_cache_stats,
+                          release_prompt_caches, stable_prefix)
+from rate_limiter import estimate_tokens, get_async_governor, get_governor, limits_for, set_limits
+from response_cache import enable_cache, lookup, print_cache_stats, store
+from checkpoint_journal import CheckpointJournal, journal_path_for
+from response_parser import parse, parse_number
+from stream_accumulator import StreamAccumulator, print_stream_stats, record
+from telemetry import print_telemetry_summary, set_product, track
+
 load_dotenv()
 
 # Retrieve the API key
@@ -23,10 +36,18 @@ API_KEY = "..."  # Hardcoded as requested
 # Model Definitions
 MODEL_GUIDANCE = "..."
 MODEL_MAIN = "..."
+MODEL_AUDITOR_CHEAP = "..."  # First tier of the auditor cascade (--audit-cascade)
 
 # Limits
 MAX_AUDIT_LOOPS = 2
-PARALLEL_WORKERS = 10  # Process 10 rows at a time
+ASYNC_MAX_IN_FLIGHT = 200  # --engine async: products in flight at once (at most; see async_max_in_flight)
+ASYNC_CALL_SECONDS = 60    # Rough duration of one streamed MODEL_MAIN call, for sizing against an RPM limit
+EARLY_STOP_AUDIT = False   # --early-stop: cut the auditor stream once it has rated the answer Pass
+CONTEXT_POLICY = "full"    # --context-policy: how much analyst chat history each turn resends (see chat_context.py)
+AUDIT_CASCADE = False      # --audit-cascade: audit with MODEL_AUDITOR_CHEAP first, escalate to MODEL_MAIN (see audit_cascade.py)
+
+# Shared rate limiter / concurrency governor (sizes the thread pool too)
+GOVERNOR = get_governor()
 
 # --- SYSTEM PROMPTS (CONSTANTS) ---
 
@@ -36,83 +57,191 @@ SYS_MSG_GUIDANCE = """..."""
 
 SYS_MSG_FLASH_AUDITOR = """..."""
 
+# The analyst's instructions as shown to the auditor: the same for every product and
+# loop, so with --prompt-cache gemini it leads the auditor prompt as its own Content
+# and is registered once with the prefix cache
+AUDITOR_PREFIX_TEXT = f"System Instructions given to the AI:\n{SYS_MSG_MPCFFULL_CORE}\n"
+AUDITOR_PREFIX = stable_prefix(AUDITOR_PREFIX_TEXT)
+AUDITOR_RETRY_LINE = "The AI has had another go. Shown below is its response.\n"
+
 # --- HELPER FUNCTIONS ---
 
-def call_gemini(client, model, contents, config):
+def call_gemini(client, model, contents, config, stop_when=None, step=None):
     """
-    Helper to call the API and aggregate stream response with up to 3 retries.
+    Helper to call the API and aggregate stream response.
+    Retries, backoff and concurrency are handled by the shared governor.
+    With the response cache on, identical requests return the stored text.
+    Fields are extracted while the stream arrives; if stop_when(fields)
+    returns True the stream is cut short (such responses are not cached).
+    Tokens, timings and cost are recorded under `step` (see telemetry.py).
+    Stable prefixes (system instruction, tools, AUDITOR_PREFIX) go through
+    the run's prompt prefix cache (see prompt_cache.py).
     """
-    max_retries = 3
-    for attempt in range(1, max_retries + 1):
-        response_text = ""
+    call = track(model, step)
+    cache_key, cached = lookup(model, contents, config)
+    if cached is not None:
+        call.finish(cached=True)
+        return cached
+    stopped = False
+    acc = None
+    est_tokens = estimate_tokens(contents)
+
+    def _stream():
+        nonlocal stopped, acc
+        acc = StreamAccumulator(numeric={'cf_value'}, keys=STREAM_KEYS)
+        # Use stream as per examples
+        stream = client.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        )
         try:
-            # Use stream as per examples
-            for chunk in client.models.generate_content_stream(
-                model=model,
-                contents=contents,
-                config=config,
-            ):
-                if chunk.text:
-                    response_text += chunk.text
-            return response_text
-        except Exception as e:
-            print(f"\n[Attempt {attempt} - Error calling {model}]: {e}")
-            if attempt < max_retries:
-                time.sleep(2)  # Short delay before retry
-            else:
-                print(f"Max retries reached for {model}. Returning None.")
-                return None
+            for chunk in stream:
+                acc.observe(chunk)
+                if acc.feed(chunk.text) and stop_when is not None and stop_when(acc.fields):
+                    stopped = True
+                    break
+        finally:
+            stream.close()
+        response_text = acc.finish(stopped)
+        record(model, acc)
+        return response_text
+
+    try:
+        contents, config = get_prefix_cache().prepare(client, model, contents, config)
+        response_text = GOVERNOR.call(model, call.wrap(_stream), est_tokens=est_tokens)
+        call.finish(usage=acc.usage, ttft=acc.first_token, search_queries=acc.search_queries)
+        if not stopped:
+            store(cache_key, model, response_text)
+        return response_text
+    except Exception as e:
+        call.finish(ok=False)
+        print(f"\n[Error calling {model}]: {e}")
+        print(f"Max retries reached for {model}. Returning None.")
+        return None
+
+async def call_gemini_async(client, model, contents, config, stop_when=None, step=None):
+    """
+    Asyncio version of call_gemini(), used by the async engine.
+    """
+    call = track(model, step)
+    cache_key, cached = lookup(model, contents, config)
+    if cached is not None:
+        call.finish(cached=True)
+        return cached
+    stopped = False
+    acc = None
+    est_tokens = estimate_tokens(contents)
+
+    async def _stream():
+        nonlocal stopped, acc
+        acc = StreamAccumulator(numeric={'cf_value'}, keys=STREAM_KEYS)
+        stream = await client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+        try:
+            async for chunk in stream:
+                acc.observe(chunk)
+                if acc.feed(chunk.text) and stop_when is not None and stop_when(acc.fields):
+                    stopped = True
+                    break
+        finally:
+            await stream.aclose()
+        response_text = acc.finish(stopped)
+        record(model, acc)
+        return response_text
+
+    try:
+        contents, config = await get_prefix_cache().prepare_async(client, model, contents, config)
+        response_text = await get_async_governor().call(model, call.wrap_async(_stream), est_tokens=est_tokens)
+        call.finish(usage=acc.usage, ttft=acc.first_token, search_queries=acc.search_queries)
+        if not stopped:
+            store(cache_key, model, response_text)
+        return response_text
+    except Exception as e:
+        call.finish(ok=False)
+        print(f"\n[Error calling {model}]: {e}")
+        print(f"Max retries reached for {model}. Returning None.")
+        return None
+
+# Fallback for answers that mention cf_value mid-line rather than as a *cf_value: field
+CF_VALUE_PATTERN = re.compile(r'(?:\*?\s*)cf_value\s*[:=]\s*([^\s\n\r]+)', re.IGNORECASE)
+# Star fields read from the responses; other "* word:" lines are free text
+STREAM_KEYS = {'cf_value'} | AUDIT_KEYS
 
 def extract_cf_value(text):
     if not text:
         return None
-    # 1. Sanitize (replace non-breaking space)
-    sanitized_txt = text.replace('\u00A0', ' ')
-    # 2. Regex Match: Handle optional asterisk and spaces more robustly
-    match = re.search(r'(?:\*?\s*)cf_value\s*[:=]\s*([^\s\n\r]+)', sanitized_txt, re.IGNORECASE)
-    if match:
-        val_str = match.group(1)
-        # Remove non-numeric chars except . e E - 
-        clean_val = re.sub(r'[^\d.eE-]', '', val_str)
-        try:
-            return float(clean_val)
-        except ValueError:
-            return None
-    return None
-
-def process_product_logic(product_name, product_description=""):
+    # 1. Single-pass field parse (also handles non-breaking spaces and **bold** keys)
+    result = parse(text, numeric={'cf_value'}, keys={'cf_value'})
+    if 'cf_value' in result:
+        return result.get('cf_value')
+    # 2. Fallback: cf_value anywhere in the text
+    match = CF_VALUE_PATTERN.search(text.replace('\u00A0', ' '))
+    return parse_number(match.group(1)) if match else None
+
+def _audit_passed(fields):
+    """stop_when for the auditor: its verdict is in and it is Pass (the reasoning is only used on Refine)."""
+    return str(fields.get('rating') or "").lower().startswith("pass")
+
+def parse_audit(text):
+    """Auditor verdict from one parse of its response: (rating, reasoning). Defaults to Pass."""
+    result = parse(text, keys=AUDIT_KEYS)
+    rating = parse_rating(text, result) or "Pass"
+    reasoning = result.get('rating_reasoning') or "No reasoning."
+    return rating, reasoning
+
+def auditor_contents(audit_body, loop_count, suffix=""):
     """
-    Replicates the 'Guidance -> Pro-Flash-Pro auditor loop' logic.
-    Tracks all reasoning history.
+    The auditor request: one user Content as it has always been sent, or the
+    cached AUDITOR_PREFIX followed by the rest when explicit prompt caching is on.
     """
-    tqdm.write(f"\n>>> Starting processing for: {product_name}")
-    client = genai.Client(api_key=API_KEY)
-    history_log = []
-    
-    # ---------------------------------------------------------
-    # STEP 0: Guidance AI (aiModelPlaceholder)
-    # ---------------------------------------------------------
-    guidance_user_msg = f"""Product Name: {product_name}
-Product Description: {product_description}
-"""
-    
-    tools_def = [
+    lead = AUDITOR_RETRY_LINE if loop_count > 1 else ""
+    if get_prefix_cache().kind == "gemini":
+        return AUDITOR_PREFIX + [types.Content(role="user", parts=[types.Part.from_text(text=lead + audit_body + suffix)])]
+    text = f"{lead}\n{AUDITOR_PREFIX_TEXT}{audit_body}{suffix}"
+    return [types.Content(role="user", parts=[types.Part.from_text(text=text)])]
+
+def _tools():
+    return [
         types.Tool(url_context=types.UrlContext()),
         types.Tool(google_search=types.GoogleSearch()),
     ]
+
+# --- PRODUCT FLOW ---
+# The Guidance -> Analyst -> Auditor logic is written once as generators that
+# yield (step, model, contents, config[, stop_when]) requests and receive the
+# response text back; step names the pipeline stage in the telemetry log.
+# _run_flow() drives them with blocking calls (thread engine), _run_flow_async()
+# with awaited calls (async engine).
+
+def _guidance_flow(product_name, product_description):
+    """STEP 0. Yields the guidance request; returns the guidance text (or None)."""
+    guidance_user_msg = f"""Product Name: {product_name}
+Product Description: {product_description}
+"""
     
     guidance_config = types.GenerateContentConfig(
         thinking_config=types.ThinkingConfig(thinking_level="HIGH"),
-        tools=tools_def,
+        tools=_tools(),
         system_instruction=[types.Part.from_text(text=SYS_MSG_GUIDANCE)],
         temperature=1,
         max_output_tokens=65535,
     )
     
-    guidance_response = call_gemini(client, MODEL_GUIDANCE, [types.Content(role="user", parts=[types.Part.from_text(text=guidance_user_msg)])], guidance_config)
+    guidance_response = yield ("guidance", MODEL_GUIDANCE, [types.Content(role="user", parts=[types.Part.from_text(text=guidance_user_msg)])], guidance_config)
+    return guidance_response
+
+def _analysis_flow(product_name, product_description, guidance_response):
+    """
+    STEPS 1-3 for a product whose guidance is known.
+    Yields model requests; returns (full_history_text, extracted_val).
+    """
     if not guidance_response: return "Error in Guidance step", None
 
-    history_log.append("--- [STEP 0: GUIDANCE] ---\n" + guidance_response)
+    history_log = ["--- [STEP 0: GUIDANCE] ---\n" + guidance_response]
 
     user_msg = f"""Product Name: {product_name}
 Product Description:
@@ -124,6 +253,7 @@ Guidance given:
     # ---------------------------------------------------------
     # STEP 1: Analyst (aiModelPlaceholder)
     # ---------------------------------------------------------
+    tools_def = _tools()
     
     pro_config = types.GenerateContentConfig(
         thinking_config=types.ThinkingConfig(thinking_level="HIGH"),
@@ -140,30 +270,30 @@ Guidance given:
         temperature=1,
         max_output_tokens=65535,
     )
+    cheap_auditor_config = auditor_config.model_copy(
+        update={"thinking_config": types.ThinkingConfig(thinking_level=CHEAP_THINKING_LEVEL)})
 
     # 1a. Initial Call
-    chat_history = [
-        types.Content(role="user", parts=[types.Part.from_text(text=user_msg)])
-    ]
+    # The analyst chat; CONTEXT_POLICY decides how much of it each turn resends
+    context = ChatContext(user_msg, CONTEXT_POLICY)
     
-    response_1 = call_gemini(client, MODEL_MAIN, chat_history, pro_config)
+    response_1 = yield ("analyst", MODEL_MAIN, context.contents("analyst"), pro_config)
     if not response_1: return "Error in Step 1a", None
     
     history_log.append("--- [STEP 1a: ANALYST INITIAL] ---\n" + response_1)
-    chat_history.append(types.Content(role="model", parts=[types.Part.from_text(text=response_1)]))
+    context.add_answer(response_1)
 
     # 1b. "Go Again" Prompt
     follow_up_prompt = '...'
     
-    chat_history.append(types.Content(role="user", parts=[types.Part.from_text(text=follow_up_prompt)]))
-    
-    response_2 = call_gemini(client, MODEL_MAIN, chat_history, pro_config)
+    response_2 = yield ("analyst_followup", MODEL_MAIN, context.ask(follow_up_prompt, "analyst_followup"), pro_config)
     if not response_2: return "Error in Step 1b", None
     
     history_log.append("--- [STEP 1b: ANALYST FOLLOW-UP] ---\n" + response_2)
-    chat_history.append(types.Content(role="model", parts=[types.Part.from_text(text=response_2)]))
+    context.add_answer(response_2)
     
     current_answer = response_2 if "cf_value" in response_2 else response_1
+    context.set_current(current_answer)
 
     # ---------------------------------------------------------
     # STEP 2: The Auditor Loop (Flash checks Analyst)
@@ -179,58 +309,262 @@ Guidance given:
         if loop_count > 1 and auditor_feedback:
             refine_prompt = f"User Feedback: {auditor_feedback}\n\n..."
             
-            chat_history.append(types.Content(role="user", parts=[types.Part.from_text(text=refine_prompt)]))
-            current_answer = call_gemini(client, MODEL_MAIN, chat_history, pro_config)
+            current_answer = yield ("refinement", MODEL_MAIN, context.ask(refine_prompt, "refinement"), pro_config)
             history_log.append(f"--- [STEP 2: ANALYST REFINEMENT LOOP {loop_count}] ---\n" + current_answer)
-            chat_history.append(types.Content(role="model", parts=[types.Part.from_text(text=current_answer)]))
-
-        auditor_user_prompt = f"""
-System Instructions given to the AI:
-{SYS_MSG_MPCFFULL_CORE}
+            context.add_answer(current_answer)
 
+        # Follows the analyst's system instructions (see auditor_contents)
+        audit_body = f"""
 User Prompt:
 {user_msg}
 
 AI's Answer:
 {current_answer}
 """
-        if loop_count > 1:
-            auditor_user_prompt = "The AI has had another go. Shown below is its response.\n" + auditor_user_prompt
-
-        auditor_contents = [types.Content(role="user", parts=[types.Part.from_text(text=auditor_user_prompt)])]
-        auditor_response = call_gemini(client, MODEL_MAIN, auditor_contents, auditor_config)
+        audit_contents = auditor_contents(audit_body, loop_count)
+        auditor_response = None
+        if AUDIT_CASCADE:
+            # Cheap tier first; only a confident Pass is kept without asking MODEL_MAIN
+            cheap_contents = auditor_contents(audit_body, loop_count, CONFIDENCE_INSTRUCTION)
+            cheap_response = yield (CHEAP_STEP, MODEL_AUDITOR_CHEAP, cheap_contents, cheap_auditor_config, confident_pass if EARLY_STOP_AUDIT else None)
+            reason = escalation_reason(cheap_response)
+            record_audit(product_name, reason)
+            if reason is None:
+                auditor_response = cheap_response
+            else:
+                history_log.append(f"--- [STEP 2: CHEAP AUDITOR LOOP {loop_count}, ESCALATED: {reason}] ---\n" + (cheap_response or "No response"))
+        if auditor_response is None:
+            auditor_response = yield (MAIN_STEP, MODEL_MAIN, audit_contents, auditor_config, _audit_passed if EARLY_STOP_AUDIT else None)
         
         history_log.append(f"--- [STEP 2: AUDITOR FEEDBACK LOOP {loop_count}] ---\n" + (auditor_response or "No response"))
 
-        rating_match = re.search(r'\*rating:\s*(Pass|Refine)', auditor_response or "", re.IGNORECASE)
-        rating = rating_match.group(1) if rating_match else "Pass"
-        
-        reasoning_match = re.search(r'\*rating_reasoning:\s*([\s\S]+)', auditor_response or "", re.IGNORECASE)
-        reasoning = reasoning_match.group(1) if reasoning_match else "No reasoning."
+        rating, reasoning = parse_audit(auditor_response)
 
         if rating.lower() == "pass":
             stop_loop = True
         else:
             auditor_feedback = reasoning
+            context.add_feedback(auditor_feedback)
 
     # ---------------------------------------------------------
     # STEP 3: Final Refinement
     # ---------------------------------------------------------
     if not stop_loop and auditor_feedback:
         final_prompt = f"AI Auditor Feedback: {auditor_feedback}\n\n..."
-        chat_history.append(types.Content(role="user", parts=[types.Part.from_text(text=final_prompt)]))
-        current_answer = call_gemini(client, MODEL_MAIN, chat_history, pro_config)
+        current_answer = yield ("final_refinement", MODEL_MAIN, context.ask(final_prompt, "final_refinement"), pro_config)
         history_log.append("--- [STEP 3: FINAL ANALYST REFINEMENT] ---\n" + current_answer)
 
     # Use the extracted_val logic on current_answer
     extracted_val = extract_cf_value(current_answer)
     
     full_history_text = "\n\n".join(history_log)
-    
+    return full_history_text, extracted_val
+
+def _run_flow(flow, client):
+    """Drives a flow generator with blocking call_gemini() calls."""
+    try:
+        request = next(flow)
+        while True:
+            step, *call = request
+            request = flow.send(call_gemini(client, *call, step=step))
+    except StopIteration as done:
+        return done.value
+
+async def _run_flow_async(flow, client):
+    """Drives a flow generator with awaited call_gemini_async() calls."""
+    try:
+        request = next(flow)
+        while True:
+            step, *call = request
+            request = flow.send(await call_gemini_async(client, *call, step=step))
+    except StopIteration as done:
+        return done.value
+
+def process_product_logic(product_name, product_description=""):
+    """
+    Replicates the 'Guidance -> Pro-Flash-Pro auditor loop' logic.
+    Tracks all reasoning history.
+    """
+    tqdm.write(f"\n>>> Starting processing for: {product_name}")
+    set_product(product_name)
+    client = get_client(API_KEY)
+
+    guidance_response = _run_flow(_guidance_flow(product_name, product_description), client)
+    full_history_text, extracted_val = _run_flow(_analysis_flow(product_name, product_description, guidance_response), client)
+
     tqdm.write(f"<<< Finished processing for: {product_name} (Extracted: {extracted_val})")
     return full_history_text, extracted_val
 
+async def guidance_step_async(product_name, product_description=""):
+    """Async STEP 0 only (used to prefetch guidance for the next batch)."""
+    set_product(product_name)
+    return await _run_flow_async(_guidance_flow(product_name, product_description), get_client(API_KEY))
+
+async def analysis_steps_async(product_name, product_description, guidance_response):
+    """Async STEPS 1-3 for a product whose guidance is already known."""
+    set_product(product_name)
+    result = await _run_flow_async(_analysis_flow(product_name, product_description, guidance_response), get_client(API_KEY))
+    tqdm.write(f"<<< Finished processing for: {product_name} (Extracted: {result[1]})")
+    return result
+
+async def process_product_logic_async(product_name, product_description=""):
+    """Asyncio version of process_product_logic()."""
+    tqdm.write(f"\n>>> Starting processing for: {product_name}")
+    guidance_response = await guidance_step_async(product_name, product_description)
+    return await analysis_steps_async(product_name, product_description, guidance_response)
+
+def _store_result(df, journal, idx, outcome):
+    """Writes a (full_text, val) result, or an exception, into the row and the checkpoint journal."""
+    if isinstance(outcome, Exception):
+        fields = {'cf_ecozeAI': f"Error: {outcome}", 'cf_value_extracted': None}
+    else:
+        full_text, val = outcome
+        fields = {'cf_ecozeAI': full_text, 'cf_value_extracted': val}
+    for col, value in fields.items():
+        df.at[idx, col] = value
+    journal.append(idx, fields)
+
+def run_threads(df, rows_to_process, journal):
+    """Thread engine: one product per worker thread."""
+    print(f"Processing {len(rows_to_process)} rows with up to {GOVERNOR.max_concurrency} threads...")
+
+    with ThreadPoolExecutor(max_workers=GOVERNOR.max_concurrency) as executor:
+        future_map = {
+            executor.submit(process_product_logic, row.get('product_name', ''), row.get('product_description', '')): idx
+            for idx, row in rows_to_process
+        }
+
+        for future in tqdm(as_completed(future_map), total=len(rows_to_process)):
+            idx = future_map[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = e
+            # Update DF and journal immediately for this row
+            _store_result(df, journal, idx, outcome)
+
+    GOVERNOR.print_stats()
+
+async def run_async(df, rows_to_process, journal, max_in_flight, pipeline_guidance=False):
+    """
+    Async engine: up to max_in_flight products at once on one event loop.
+    Model calls share one AsyncGovernor limit. With pipeline_guidance, rows
+    go in batches of max_in_flight and the next batch's guidance runs while
+    the current batch is in its analyst/auditor steps.
+    """
+    governor = get_async_governor(max_in_flight)
+    product_slots = asyncio.Semaphore(max_in_flight)
+    total_to_process = len(rows_to_process)
+    progress = tqdm(total=total_to_process)
+
+    print(f"Processing {total_to_process} rows with up to {max_in_flight} products in flight (async)...")
+
+    def finish(idx, outcome):
+        _store_result(df, journal, idx, outcome)
+        progress.update(1)
+
+    async def whole_product(idx, row):
+        try:
+            async with product_slots:
+                outcome = await process_product_logic_async(row.get('product_name', ''), row.get('product_description', ''))
+        except Exception as e:
+            outcome = e
+        finish(idx, outcome)
+
+    async def guidance_only(row):
+        tqdm.write(f"\n>>> Starting processing for: {row.get('product_name', '')}")
+        return await guidance_step_async(row.get('product_name', ''), row.get('product_description', ''))
+
+    async def analysis_only(idx, row, guidance_response):
+        if isinstance(guidance_response, Exception):
+            finish(idx, guidance_response)
+            return
+        try:
+            async with product_slots:
+                outcome = await analysis_steps_async(row.get('product_name', ''), row.get('product_description', ''), guidance_response)
+        except Exception as e:
+            outcome = e
+        finish(idx, outcome)
+
+    if not pipeline_guidance:
+        await asyncio.gather(*(whole_product(idx, row) for idx, row in rows_to_process))
+    else:
+        batches = [rows_to_process[i:i + max_in_flight] for i in range(0, total_to_process, max_in_flight)]
+        next_guidance = [asyncio.create_task(guidance_only(row)) for _, row in batches[0]]
+        for batch_num, batch in enumerate(batches):
+            guidance_results = await asyncio.gather(*next_guidance, return_exceptions=True)
+            if batch_num + 1 < len(batches):
+                # Start the next batch's guidance now; it overlaps with this batch's auditor loop
+                next_guidance = [asyncio.create_task(guidance_only(row)) for _, row in batches[batch_num + 1]]
+            await asyncio.gather(*(
+                analysis_only(idx, row, guidance_response)
+                for (idx, row), guidance_response in zip(batch, guidance_results)
+            ))
+
+    progress.close()
+    governor.print_stats()
+
+def async_max_in_flight():
+    """
+    Default --max-in-flight: ASYNC_MAX_IN_FLIGHT, or fewer when MODEL_MAIN has
+    an RPM limit. A product has one call in flight at a time, so about
+    rpm * ASYNC_CALL_SECONDS / 60 products keep the budget busy; more only
+    queue on the token bucket.
+    """
+    rpm, _ = limits_for(MODEL_MAIN)
+    if not rpm:
+        return ASYNC_MAX_IN_FLIGHT
+    return max(1, min(ASYNC_MAX_IN_FLIGHT, rpm * ASYNC_CALL_SECONDS // 60))
+
 def main():
+    parser = argparse.ArgumentParser(description="ecozeAI calculations (Guidance -> Analyst -> Auditor).")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                        help="threads: one product per worker thread; async: many products on one event loop")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help=f"Async engine: products (and model calls) in flight at once (default {ASYNC_MAX_IN_FLIGHT}, "
+                             "or fewer to match an RPM limit on MODEL_MAIN)")
+    parser.add_argument("--rpm", type=int, default=None,
+                        help="Requests per minute allowed per model (default: GENAI_RPM / GENAI_MODEL_LIMITS, else no limit)")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help="Tokens per minute allowed per model (default: GENAI_TPM / GENAI_MODEL_LIMITS, else no limit)")
+    parser.add_argument("--pipeline-guidance", action="store_true",
+                        help="Async engine: run the next batch's guidance while the current batch is auditing")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse stored responses for identical requests (same as GENAI_CACHE=1)")
+    parser.add_argument("--materialise", action="store_true",
+                        help="Only write the checkpoint journal out to OUTPUT_FILE, then exit")
+    parser.add_argument("--early-stop", action="store_true",
+                        help="Cut the auditor's stream as soon as it rates an answer Pass (its reasoning is then truncated)")
+    parser.add_argument("--prompt-cache", choices=PROMPT_CACHE_KINDS, default=None,
+                        help="Stable prompt prefixes: local (sent inline, reuse only counted) or gemini "
+                             "(explicit context caches; same as GENAI_PROMPT_CACHE=gemini)")
+    parser.add_argument("--context-policy", choices=POLICIES, default="full",
+                        help="Analyst history resent per turn: full, latest (current answer only) "
+                             "or summary (latest + condensed earlier auditor feedback)")
+    parser.add_argument("--audit-cascade", action="store_true",
+                        help="Audit with MODEL_AUDITOR_CHEAP at low thinking first; escalate to MODEL_MAIN only on "
+                             "Refine, low confidence or an unparseable verdict")
+    args = parser.parse_args()
+
+    global EARLY_STOP_AUDIT, CONTEXT_POLICY, AUDIT_CASCADE
+    EARLY_STOP_AUDIT = args.early_stop
+    CONTEXT_POLICY = args.context_policy
+    AUDIT_CASCADE = args.audit_cascade
+
+    if args.rpm or args.tpm:
+        for model in (MODEL_GUIDANCE, MODEL_MAIN, MODEL_AUDITOR_CHEAP):
+            set_limits(args.rpm, args.tpm, model=model)
+    if args.max_in_flight is None:
+        args.max_in_flight = async_max_in_flight()
+    elif args.engine == "async" and args.max_in_flight > async_max_in_flight():
+        print(f"⚠️  {args.max_in_flight} products in flight exceed what the MODEL_MAIN rate limit sustains "
+              f"(~{async_max_in_flight()}); the rest will wait on the limiter.")
+
+    if args.cache:
+        enable_cache()
+    if args.prompt_cache:
+        enable_prompt_cache(args.prompt_cache)
+
     if not os.path.exists(INPUT_FILE):
         print(f"File not found: {INPUT_FILE}")
         return
@@ -246,6 +580,17 @@ def main():
     if 'cf_value_extracted' not in df.columns:
         df['cf_value_extracted'] = None
 
+    # Resume: rows finished by an earlier (interrupted) run are in the journal
+    journal = CheckpointJournal(journal_path_for(OUTPUT_FILE))
+    restored = journal.apply(df)
+    if restored:
+        print(f"Restored {restored} rows from checkpoint journal {journal.path}.")
+
+    if args.materialise:
+        journal.materialise(df, OUTPUT_FILE, clear=False)
+        print(f"Wrote {len(df)} rows to {OUTPUT_FILE}.")
+        return
+
     # Filter rows that need processing
     rows_to_process = []
     for idx, row in df.iterrows():
@@ -260,38 +605,29 @@ def main():
 
     if not rows_to_process:
         print("All rows already processed. Nothing to do.")
+        if restored:
+            journal.materialise(df, OUTPUT_FILE)
         return
 
-    print(f"Processing {len(rows_to_process)} rows with {PARALLEL_WORKERS} threads...")
-    
-    results = {} # index -> (text, val)
-
-    with ThreadPoolExecutor(max_workers=PARALLEL_WORKERS) as executor:
-        future_map = {
-            executor.submit(process_product_logic, row.get('product_name', ''), row.get('product_description', '')): idx
-            for idx, row in rows_to_process
-        }
-
-        completed = 0
-        total_to_process = len(rows_to_process)
-        for future in tqdm(as_completed(future_map), total=total_to_process):
-            idx = future_map[future]
-            try:
-                full_text, val = future.result()
-                results[idx] = (full_text, val)
-                # Update DF immediately for this row
-                df.at[idx, 'cf_ecozeAI'] = full_text
-                df.at[idx, 'cf_value_extracted'] = val
-            except Exception as e:
-                df.at[idx, 'cf_ecozeAI'] = f"Error: {e}"
-                df.at[idx, 'cf_value_extracted'] = None
-
-            completed += 1
-            if completed % PARALLEL_WORKERS == 0 or completed == total_to_process:
-                df.to_excel(OUTPUT_FILE, index=False)
-                # print(f"\nSaved checkpoint at {completed} rows.")
+    try:
+        if args.engine == "async":
+            asyncio.run(run_async(df, rows_to_process, journal, args.max_in_flight, args.pipeline_guidance))
+        else:
+            run_threads(df, rows_to_process, journal)
+    finally:
+        # Explicit prompt caches are billed for storage until deleted
+        release_prompt_caches(get_client(API_KEY))
 
+    # Excel is written once, from the journal, instead of every few rows
+    journal.materialise(df, OUTPUT_FILE)
     print(f"Done. Final results saved to {OUTPUT_FILE}.")
+    print_connection_stats()
+    print_cache_stats()
+    print_stream_stats()
+    print_context_stats(CONTEXT_POLICY)
+    print_prompt_cache_stats()
+    print_cascade_stats(MODEL_MAIN)
+    print_telemetry_summary()
 
 if __name__ == "__main__":
     main()
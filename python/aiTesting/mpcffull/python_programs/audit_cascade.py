@@ -0,0 +1,204 @@
+"""
+Speculative model cascade for the auditor step of 4-ecozeai_calculations.py.
+
+Each audit first goes to a cheaper model at a low thinking level, asked to add
+a confidence to its verdict. Only when that verdict is not a confident Pass is
+the audit escalated to the main model at HIGH thinking, whose verdict is then
+the one used - the same primary/secondary pattern as
+runGeminiWithModelEscalation in ecozeAI-functions-v2/src/services/ai/gemini.js.
+A cheap audit is escalated when:
+
+  - no_response:     the call failed or returned nothing
+  - unparsed:        no Pass/Refine *rating field could be found
+  - refine:          it asked for a refinement (feedback drives the analyst, so
+                     it has to come from the main auditor)
+  - low_confidence:  it passed the answer with *confidence below MIN_CONFIDENCE
+
+    reason = escalation_reason(cheap_response)
+    record(product_name, reason)            # None = accepted, no escalation
+    ...
+    print_cascade_stats(MODEL_MAIN)
+
+print_cascade_stats() reads this run's telemetry log: the cost and latency of
+every audit the main model did not have to run are estimated from the main
+auditor calls that did run (or, before any has, from the cheap call's tokens
+at main-model prices), less what the cheap calls added. The per-product table
+is written next to the telemetry part files.
+"""
+import os
+import re
+import threading
+
+import pandas as pd
+
+from response_parser import parse, parse_number
+from telemetry import calculate_cost, get_log
+
+# --- CONFIGURATION ---
+CHEAP_STEP = "auditor_cheap"    # Telemetry step names of the two tiers
+MAIN_STEP = "auditor"
+CHEAP_THINKING_LEVEL = "LOW"
+MIN_CONFIDENCE = float(os.getenv("GENAI_CASCADE_MIN_CONFIDENCE", "0.8"))   # 0-1; lower Pass verdicts escalate
+CONFIDENCE_WORDS = {"high": 0.9, "medium": 0.6, "moderate": 0.6, "low": 0.3}
+
+# Appended to the cheap auditor's user prompt (the auditor system prompt is shared with the main tier)
+CONFIDENCE_INSTRUCTION = (
+    "\nAfter your rating, add one more line giving your confidence in that rating "
+    "as a number between 0 and 1, in the form:\n*confidence: 0.0"
+)
+
+_RATING = re.compile(r"(Pass|Refine)", re.IGNORECASE)
+# Fallback for answers that mention *rating: mid-line rather than as a field
+_RATING_ANYWHERE = re.compile(r"\*rating:\s*(Pass|Refine)", re.IGNORECASE)
+
+# Star fields of an auditor response (other "* word:" lines belong to the reasoning)
+AUDIT_KEYS = {"rating", "rating_reasoning", "confidence"}
+
+
+def parse_confidence(value):
+    """Confidence as 0-1 from a number (0-1 or a percentage) or a word (High/Medium/Low); None if unreadable."""
+    if value is None:
+        return None
+    if not isinstance(value, (int, float)):
+        text = str(value).strip().strip("*").strip()
+        word = text.split()[0].lower() if text.split() else ""
+        if word in CONFIDENCE_WORDS:
+            return CONFIDENCE_WORDS[word]
+        value = parse_number(text.rstrip("%"))
+        if value is None:
+            return None
+    return value / 100 if value > 1 else float(value)
+
+
+def parse_rating(text, result):
+    """"Pass"/"Refine" from the parsed *rating: field, else from a *rating: anywhere in text; None if neither."""
+    rating = _RATING.match(result.get("rating") or "") or _RATING_ANYWHERE.search((text or "").replace("\u00A0", " "))
+    return rating.group(1) if rating else None
+
+
+def escalation_reason(text, min_confidence=MIN_CONFIDENCE):
+    """Why a cheap audit must be escalated (see the module docstring), or None to accept it."""
+    if not text:
+        return "no_response"
+    result = parse(text, keys=AUDIT_KEYS)
+    rating = parse_rating(text, result)
+    if not rating:
+        return "unparsed"
+    if rating.lower() == "refine":
+        return "refine"
+    confidence = parse_confidence(result.get("confidence"))
+    if confidence is None or confidence < min_confidence:
+        return "low_confidence"
+    return None
+
+
+def confident_pass(fields, min_confidence=MIN_CONFIDENCE):
+    """stop_when for the cheap auditor: a Pass with enough confidence is in (anything else needs the full text)."""
+    return (str(fields.get("rating") or "").lower().startswith("pass")
+            and (parse_confidence(fields.get("confidence")) or 0) >= min_confidence)
+
+
+# --- Run-wide metrics ---
+
+_lock = threading.Lock()
+_audits = {}    # product -> [audits, escalations, {reason: count}]
+
+
+def record(product, reason):
+    """One cheap audit of a product; reason is None if it was accepted."""
+    with _lock:
+        entry = _audits.setdefault(product, [0, 0, {}])
+        entry[0] += 1
+        if reason is not None:
+            entry[1] += 1
+            entry[2][reason] = entry[2].get(reason, 0) + 1
+
+
+def cascade_stats():
+    """{product: (audits, escalations, {reason: count})} so far."""
+    with _lock:
+        return {product: (a, e, dict(r)) for product, (a, e, r) in _audits.items()}
+
+
+def reset_cascade_stats():
+    with _lock:
+        _audits.clear()
+
+
+def _main_audit_estimate(calls, cheap, main_model):
+    """
+    (cost, latency) of one main-tier audit: the mean of those run, else the cheap
+    calls' tokens repriced and their latency (so no latency saving is claimed).
+    """
+    main = calls[(calls["step"] == MAIN_STEP) & ~calls["cached"].astype(bool)]
+    if not main.empty:
+        return main["cost_usd"].mean(), main["latency_s"].mean()
+    if cheap.empty:
+        return 0.0, 0.0
+    repriced = cheap.apply(lambda row: calculate_cost(
+        main_model, row["input_tokens"] + row["tool_use_tokens"],
+        row["output_tokens"] + row["thinking_tokens"], row["search_queries"]), axis=1)
+    return repriced.mean(), cheap["latency_s"].mean()
+
+
+def cascade_summary(main_model):
+    """
+    Per-product DataFrame: audits, escalations, cheap and main auditor cost and
+    latency, and the estimated cost and latency saved against main-only audits.
+    """
+    stats = cascade_stats()
+    if not stats:
+        return pd.DataFrame()
+    log = get_log()
+    with log._lock:
+        calls = pd.DataFrame(log.rows)
+    if calls.empty:
+        calls = pd.DataFrame(columns=["product", "step", "cached", "cost_usd", "latency_s", "input_tokens",
+                                      "tool_use_tokens", "output_tokens", "thinking_tokens", "search_queries"])
+    cheap = calls[calls["step"] == CHEAP_STEP]
+    main_cost, main_latency = _main_audit_estimate(calls, cheap, main_model)
+
+    rows = []
+    for product, (audits, escalations, reasons) in stats.items():
+        own = calls[calls["product"] == product]
+        cheap_calls, main_calls = own[own["step"] == CHEAP_STEP], own[own["step"] == MAIN_STEP]
+        spent_cost = cheap_calls["cost_usd"].sum() + main_calls["cost_usd"].sum()
+        spent_latency = cheap_calls["latency_s"].sum() + main_calls["latency_s"].sum()
+        rows.append({
+            "product": product,
+            "audits": audits,
+            "escalations": escalations,
+            "reasons": ", ".join(f"{k}={v}" for k, v in sorted(reasons.items())),
+            "cheap_cost_usd": cheap_calls["cost_usd"].sum(),
+            "main_cost_usd": main_calls["cost_usd"].sum(),
+            "cheap_latency_s": cheap_calls["latency_s"].sum(),
+            "main_latency_s": main_calls["latency_s"].sum(),
+            "cost_saved_usd": audits * main_cost - spent_cost,
+            "latency_saved_s": audits * main_latency - spent_latency,
+        })
+    return pd.DataFrame(rows).set_index("product")
+
+
+def print_cascade_stats(main_model):
+    """Prints escalation rates and the estimated savings, and writes the per-product table."""
+    summary = cascade_summary(main_model)
+    if summary.empty:
+        return
+    audits, escalations = int(summary["audits"].sum()), int(summary["escalations"].sum())
+    reasons = {}
+    for _, _, counts in cascade_stats().values():
+        for reason, count in counts.items():
+            reasons[reason] = reasons.get(reason, 0) + count
+    print("\n--- Auditor Cascade ---")
+    print(f"Escalated {escalations} of {audits} audits ({escalations / audits:.0%}); "
+          f"{(summary['escalations'] > 0).sum()} of {len(summary)} products had at least one")
+    if reasons:
+        print("Reasons: " + ", ".join(f"{k} {v}" for k, v in sorted(reasons.items(), key=lambda kv: -kv[1])))
+    print(f"Est. saved vs main-model audits: ${summary['cost_saved_usd'].sum():.4f} "
+          f"(${summary['cost_saved_usd'].mean():.4f}/product), "
+          f"{summary['latency_saved_s'].sum():.1f} s of audit time ({summary['latency_saved_s'].mean():.1f} s/product)")
+    log = get_log()
+    os.makedirs(log.directory, exist_ok=True)
+    path = os.path.join(log.directory, f"{log.run_id}-cascade.csv")
+    summary.to_csv(path)
+    print(f"Per product: {path}")
@@ -0,0 +1,200 @@
+"""
+Batch-prediction mode for the mpcffull scripts.
+
+For overnight runs latency doesn't matter, so instead of one interactive call
+per row the pending rows are written to a single JSONL request file, submitted
+as one batch job, polled, and the results merged back by row key:
+
+    {"key": "12", "request": {"contents": [...], "systemInstruction": {...}, ...}}
+    {"key": "12", "response": {"candidates": [...]}}     <- results file
+
+Backends share one small interface (submit / poll / fetch_results):
+  - GeminiBatchBackend: the Gemini Batch API via the shared pooled client
+  - LocalBatchBackend: a file-based stand-in that keeps jobs in a directory and
+    answers each request through the ordinary generateContent endpoint, one at
+    a time (point GENAI_BASE_URL at fake_genai_server.py for tests)
+
+Usage:
+    backend = make_backend(args.backend, API_KEY)
+    texts = run_batch(backend, MODEL_NAME, {idx: request, ...}, workdir)
+    # texts: {key: response text, or None if that request failed}
+"""
+import json
+import os
+import time
+import uuid
+
+from genai_pool import BASE_URL, get_client, get_session
+from record_replay import get_archive
+
+# --- CONFIGURATION ---
+POLL_SECONDS = 30            # Batch jobs take minutes to hours; no point polling faster
+BATCH_WORKDIR = os.path.expanduser("~/.cache/ecozeai/batches")
+
+# Terminal states, normalised across backends
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+RUNNING = "running"
+
+
+def write_requests(requests, path):
+    """Writes {key: request} as a Batch API JSONL request file."""
+    with open(path, "w", encoding="utf-8") as f:
+        for key, request in requests.items():
+            f.write(json.dumps({"key": str(key), "request": request}, ensure_ascii=False) + "\n")
+    return path
+
+
+def response_text(response):
+    """Concatenated text parts of the first candidate of a generateContent response dict."""
+    try:
+        parts = response["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    text = "".join(part.get("text", "") for part in parts if not part.get("thought"))
+    return text or None
+
+
+def read_results(path):
+    """Reads a results JSONL file into {key: text or None}. Lines that fail to parse are skipped."""
+    texts = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" in entry or "response" not in entry:
+                print(f"   ❌ Batch request {entry.get('key')} failed: {str(entry.get('error'))[:200]}")
+                texts[entry.get("key")] = None
+            else:
+                texts[entry.get("key")] = response_text(entry["response"])
+    return texts
+
+
+class GeminiBatchBackend:
+    """Submits request files to the Gemini Batch API."""
+
+    def __init__(self, api_key):
+        self.client = get_client(api_key)
+
+    def submit(self, requests_path, model, display_name):
+        uploaded = self.client.files.upload(
+            file=requests_path,
+            config={"mime_type": "jsonl", "display_name": display_name},
+        )
+        job = self.client.batches.create(model=model, src=uploaded.name, config={"display_name": display_name})
+        return job.name
+
+    def poll(self, job_id):
+        state = self.client.batches.get(name=job_id).state.name
+        if state in ("JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"):
+            return SUCCEEDED
+        if state in ("JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"):
+            return FAILED
+        return RUNNING
+
+    def fetch_results(self, job_id, dest_path):
+        job = self.client.batches.get(name=job_id)
+        data = self.client.files.download(file=job.dest.file_name)
+        with open(dest_path, "wb") as f:
+            f.write(data)
+        return dest_path
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Batch API. A job is a copy of the request file
+    in `directory`; the first poll answers every request against the
+    generateContent endpoint and writes <job>.results.jsonl next to it.
+    """
+
+    def __init__(self, api_key, directory=BATCH_WORKDIR):
+        self.api_key = api_key
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.directory, f"{job_id}.{suffix}.jsonl")
+
+    def submit(self, requests_path, model, display_name):
+        job_id = f"{display_name}-{uuid.uuid4().hex[:8]}"
+        with open(requests_path, "r", encoding="utf-8") as src, open(self._path(job_id, "requests"), "w", encoding="utf-8") as dst:
+            dst.write(json.dumps({"model": model}) + "\n")
+            dst.writelines(src)
+        return job_id
+
+    def poll(self, job_id):
+        if not os.path.exists(self._path(job_id, "results")):
+            self._run(job_id)
+        return SUCCEEDED
+
+    def _run(self, job_id):
+        with open(self._path(job_id, "requests"), "r", encoding="utf-8") as f:
+            model = json.loads(f.readline())["model"]
+            entries = [json.loads(line) for line in f]
+
+        url = f"{BASE_URL}/v1beta/models/{model}:generateContent?key={self.api_key}"
+        tmp_path = self._path(job_id, "results") + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for entry in entries:
+                try:
+                    response = get_session().post(url, json=entry["request"])
+                    response.raise_for_status()
+                    result = {"key": entry["key"], "response": response.json()}
+                except Exception as e:
+                    result = {"key": entry["key"], "error": {"message": str(e)}}
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._path(job_id, "results"))
+
+    def fetch_results(self, job_id, dest_path):
+        with open(self._path(job_id, "results"), "rb") as src, open(dest_path, "wb") as dst:
+            dst.write(src.read())
+        return dest_path
+
+
+BACKENDS = {"gemini": GeminiBatchBackend, "local": LocalBatchBackend}
+
+
+def make_backend(name, api_key):
+    """Backend by name: 'gemini' (Batch API) or 'local' (file-based stand-in)."""
+    archive = get_archive()
+    if name == "gemini" and archive is not None:
+        # client.batches / files.download are not part of the fixture archive
+        raise ValueError(f"The gemini batch backend cannot be used while {archive.mode}ing model traffic; "
+                         "use --backend local")
+    return BACKENDS[name](api_key)
+
+
+def run_batch(backend, model, requests, workdir=BATCH_WORKDIR, display_name="mpcffull", poll_seconds=POLL_SECONDS):
+    """
+    Writes `requests` ({key: request dict}) to JSONL, submits it, waits for the
+    job and returns {key: response text or None}. Keys missing from the results
+    map to None as well.
+    """
+    if not requests:
+        return {}
+    os.makedirs(workdir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    requests_path = write_requests(requests, os.path.join(workdir, f"{display_name}-{stamp}.requests.jsonl"))
+
+    job_id = backend.submit(requests_path, model, display_name)
+    print(f"📤 Submitted batch {job_id} ({len(requests)} requests from {requests_path})")
+
+    started = time.monotonic()
+    while True:
+        state = backend.poll(job_id)
+        if state != RUNNING:
+            break
+        print(f"   ⏳ Batch {job_id} still running ({time.monotonic() - started:.0f}s)...")
+        time.sleep(poll_seconds)
+
+    if state == FAILED:
+        print(f"   ❌ Batch {job_id} failed.")
+        return {key: None for key in requests}
+
+    results_path = backend.fetch_results(job_id, os.path.join(workdir, f"{display_name}-{stamp}.results.jsonl"))
+    texts = read_results(results_path)
+    print(f"📥 Batch {job_id} done in {time.monotonic() - started:.0f}s: "
+          f"{sum(1 for t in texts.values() if t)} / {len(requests)} answered")
+    return {key: texts.get(str(key)) for key in requests}
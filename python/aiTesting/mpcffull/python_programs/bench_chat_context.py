@@ -0,0 +1,195 @@
+"""
+Replay benchmark: analyst context policies (chat_context.py) in 4-ecozeai_calculations.py.
+
+Drives the script's own _analysis_flow once per policy and reports the
+estimated input tokens each analyst turn would send and the extracted
+cf_value. Transcripts come from a previous run's output workbook (the
+cf_ecozeAI history column, split on its "--- [STEP ...] ---" headers) or,
+without one, are synthetic products whose auditor asks for refinement twice.
+
+    python bench_chat_context.py                                   # synthetic
+    python bench_chat_context.py --replay ~/ecozeai_output.xlsx --limit 20
+    python bench_chat_context.py --live --limit 5                  # calls the model
+
+By default every model request is answered from the transcript. Those answers
+are fixed, so the cf_value can only differ if the flow itself behaves
+differently under a policy - it says nothing about how compaction changes what
+the analyst answers. To measure that offline, record each policy's live
+answers once to a fixture archive (record_replay.py) and replay them:
+
+    python bench_chat_context.py --replay ~/ecozeai_output.xlsx --limit 20 --record ~/fixtures/context.jsonl
+    python bench_chat_context.py --replay ~/ecozeai_output.xlsx --limit 20 --fixtures ~/fixtures/context.jsonl
+
+Every policy sends its own prompts, so each one replays the answers the model
+gave to exactly those prompts. Use the same transcripts and --policies order
+for both runs.
+"""
+import argparse
+import os
+import random
+import re
+
+import chat_context
+import record_replay
+from bench_support import load_script, prose
+from chat_context import POLICIES
+
+STEP_HEADER = re.compile(r"^--- \[STEP ([^\]]+)\] ---\n", re.MULTILINE)
+ANALYST_STEPS = {"analyst", "analyst_followup", "refinement", "final_refinement"}
+
+
+# --- Transcripts: {"name", "description", "guidance", "analyst": [...], "auditor": [...], "cf_value"} ---
+
+def parse_history(text):
+    """Splits a cf_ecozeAI history into guidance, analyst answers and auditor responses (None if it is not one)."""
+    pieces = STEP_HEADER.split(text or "")
+    if len(pieces) < 3:
+        return None
+    transcript = {"guidance": None, "analyst": [], "auditor": []}
+    for header, body in zip(pieces[1::2], pieces[2::2]):
+        body = body.rstrip("\n")
+        if "GUIDANCE" in header:
+            transcript["guidance"] = body
+        elif "AUDITOR" in header:
+            transcript["auditor"].append(body)
+        else:
+            transcript["analyst"].append(body)
+    return transcript if transcript["guidance"] and transcript["analyst"] else None
+
+
+def load_transcripts(path, limit):
+    import pandas as pd
+
+    df = pd.read_excel(os.path.expanduser(path))
+    transcripts = []
+    for _, row in df.iterrows():
+        transcript = parse_history(row.get("cf_ecozeAI"))
+        if transcript is None:
+            continue
+        transcript["name"] = row.get("product_name", "")
+        transcript["description"] = row.get("product_description", "")
+        if not isinstance(transcript["description"], str):
+            transcript["description"] = ""
+        transcript["cf_value"] = row.get("cf_value_extracted")
+        transcripts.append(transcript)
+        if len(transcripts) >= limit:
+            break
+    return transcripts
+
+
+def synthetic_transcripts(n, kb, seed=0):
+    """Products where the auditor refines twice, so every analyst turn runs."""
+    rng = random.Random(seed)
+    transcripts = []
+    for i in range(n):
+        cf = [round(rng.uniform(1, 500), 2) for _ in range(5)]
+        transcripts.append({
+            "name": f"Product {i}",
+            "description": prose(rng, 300),
+            "guidance": prose(rng, kb * 1024),
+            "analyst": [f"{prose(rng, kb * 1024 // 2)}\n*cf_value: {value}" for value in cf],
+            "auditor": [f"*rating: Refine\n*rating_reasoning: {prose(rng, kb * 1024 // 4)}" for _ in range(2)],
+            "cf_value": cf[-1],
+        })
+    return transcripts
+
+
+# --- Replay ---
+
+def replay(script, transcript):
+    """Runs _analysis_flow answering from the transcript; returns the extracted cf_value."""
+    answers = {"analyst": list(transcript["analyst"]), "auditor": list(transcript["auditor"])}
+
+    def answer(step):
+        queue = answers["analyst" if step in ANALYST_STEPS else "auditor"]
+        if not queue:
+            # The flow asked for more turns than were recorded
+            return "*rating: Pass" if step == "auditor" else transcript["analyst"][-1]
+        return queue.pop(0)
+
+    flow = script._analysis_flow(transcript["name"], transcript["description"], transcript["guidance"])
+    try:
+        request = next(flow)
+        while True:
+            request = flow.send(answer(request[0]))
+    except StopIteration as done:
+        return done.value[1]
+
+
+def live(script, transcript):
+    """
+    Runs the product's analysis against the model, reusing the recorded guidance
+    (recorded to or served from the fixture archive with --record / --fixtures).
+    """
+    client = script.get_client(script.API_KEY or "replay")
+    flow = script._analysis_flow(transcript["name"], transcript["description"], transcript["guidance"])
+    return script._run_flow(flow, client)[1]
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is b
+    return abs(float(a) - float(b)) <= 1e-9 * max(abs(float(a)), 1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analyst context policies on recorded or synthetic transcripts.")
+    parser.add_argument("--replay", help="Output workbook of a previous run (cf_ecozeAI history column)")
+    parser.add_argument("--limit", type=int, default=50, help="Transcripts to use")
+    parser.add_argument("--kb", type=int, default=8, help="Synthetic transcripts: approximate guidance size in KB")
+    parser.add_argument("--policies", nargs="+", choices=POLICIES, default=POLICIES)
+    parser.add_argument("--live", action="store_true", help="Call the model instead of replaying the answers")
+    parser.add_argument("--record", metavar="PATH", help="Call the model and record each policy's answers to this fixture archive")
+    parser.add_argument("--fixtures", metavar="PATH", help="Replay each policy's answers from a --record archive (no network)")
+    args = parser.parse_args()
+    if args.record and args.fixtures:
+        parser.error("--record and --fixtures are mutually exclusive")
+
+    if args.replay:
+        transcripts = load_transcripts(args.replay, args.limit)
+        source = os.path.basename(args.replay)
+    else:
+        transcripts = synthetic_transcripts(args.limit, args.kb)
+        source = "synthetic"
+    if not transcripts:
+        print("⚠️ No analyst transcripts found.")
+        return
+
+    # Before the script creates its shared client, so every call goes through the archive
+    if args.record:
+        record_replay.start_recording(args.record)
+        mode = f"live, recording to {args.record}"
+    elif args.fixtures:
+        record_replay.start_replay(args.fixtures, speed=0)
+        mode = f"recorded live answers from {args.fixtures}"
+    else:
+        mode = "live" if args.live else "transcript answers"
+
+    script = load_script("4-ecozeai_calculations.py")
+    run = live if args.live or args.record or args.fixtures else replay
+    print(f"=== Analyst context policies: {len(transcripts)} products ({source}, {mode}) ===")
+
+    values = {}
+    for policy in args.policies:
+        script.CONTEXT_POLICY = policy
+        chat_context.reset_context_stats()
+        values[policy] = [run(script, transcript) for transcript in transcripts]
+        chat_context.print_context_stats(policy)
+    record_replay.print_archive_stats()
+
+    # cf_value per policy, against the full-history run (or the recorded value offline)
+    print("\n--- Extracted cf_value ---")
+    baseline_name = "full" if "full" in values else None
+    baseline = values["full"] if baseline_name else [t["cf_value"] for t in transcripts]
+    print(f"{'policy':<10}{'found':>8}{'same as ' + (baseline_name or 'recorded'):>20}")
+    for policy, found in values.items():
+        same = sum(1 for a, b in zip(found, baseline) if _same(a, b))
+        print(f"{policy:<10}{sum(v is not None for v in found):>8}{f'{same}/{len(found)}':>20}")
+    for policy, found in values.items():
+        for transcript, a, b in zip(transcripts, found, baseline):
+            if not _same(a, b):
+                print(f"  {policy}: {transcript['name']}: {a} (vs {b})")
+
+
+if __name__ == "__main__":
+    main()
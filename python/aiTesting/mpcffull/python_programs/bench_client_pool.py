@@ -0,0 +1,68 @@
+"""
+Benchmark: one genai.Client per call vs the shared pooled client.
+
+Starts the local fake endpoint, fires N streaming calls through a thread pool
+both ways and prints wall-clock time plus connection reuse stats.
+
+    python bench_client_pool.py --calls 200 --workers 10
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_genai_server import start_server
+
+
+def run_calls(make_client, calls, workers):
+    from google.genai import types
+
+    contents = [types.Content(role="user", parts=[types.Part.from_text(text="ping")])]
+
+    def one_call(_):
+        client = make_client()
+        return "".join(
+            chunk.text or ""
+            for chunk in client.models.generate_content_stream(model="fake-model", contents=contents)
+        )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(one_call, range(calls)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared GenAI client pool.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency)
+    # Must be set before genai_pool builds its client
+    os.environ["GENAI_BASE_URL"] = server.base_url
+
+    import genai_pool
+    from google import genai
+    from google.genai import types
+
+    def per_call_client():
+        return genai.Client(api_key="fake", http_options=types.HttpOptions(base_url=server.base_url))
+
+    print(f"=== Client pool benchmark ({args.calls} calls, {args.workers} workers) ===\n")
+
+    elapsed_fresh = run_calls(per_call_client, args.calls, args.workers)
+    print(f"Client per call: {elapsed_fresh:.2f}s ({args.calls / elapsed_fresh:.1f} calls/s)")
+
+    genai_pool.reset_connection_stats()
+    elapsed_pooled = run_calls(lambda: genai_pool.get_client("fake"), args.calls, args.workers)
+    print(f"Shared client:   {elapsed_pooled:.2f}s ({args.calls / elapsed_pooled:.1f} calls/s)")
+
+    genai_pool.print_connection_stats()
+    genai_pool.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: the shared Governor against a fake endpoint that enforces a quota.
+
+Starts fake_genai_server.py with --max-rpm, fires calls from an oversized
+thread pool and reports how many were rejected with 429, throughput and where
+the AIMD concurrency limit settled. Uses only the standard library for HTTP,
+so it runs without google-genai installed.
+
+    python bench_rate_limiter.py --calls 300 --server-rpm 600 --client-rpm 500
+"""
+import argparse
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import rate_limiter
+from fake_genai_server import start_server
+
+MODEL = "fake-model"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the adaptive rate limiter.")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--server-rpm", type=int, default=600, help="Quota enforced by the fake endpoint")
+    parser.add_argument("--client-rpm", type=int, default=500, help="RPM budget given to the governor")
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, max_rpm=args.server_rpm)
+    url = f"{server.base_url}/v1beta/models/{MODEL}:generateContent"
+
+    rate_limiter.set_limits(rpm=args.client_rpm, model=MODEL)
+    rate_limiter.BASE_BACKOFF_SECONDS = 0.5
+    governor = rate_limiter.get_governor()
+
+    def post():
+        request = urllib.request.Request(url, data=b"{}", method="POST")
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.read().decode()
+        except urllib.error.HTTPError as e:
+            raise rate_limiter.RetryableStatus(e.code, e.reason)
+
+    def one_call(_):
+        try:
+            governor.call(MODEL, post, est_tokens=10)
+            return True
+        except Exception:
+            return False
+
+    print(f"=== Rate limiter benchmark ({args.calls} calls, server quota {args.server_rpm} rpm) ===")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=governor.max_concurrency) as executor:
+        ok = sum(executor.map(one_call, range(args.calls)))
+    elapsed = time.perf_counter() - start
+
+    print(f"\nCompleted {ok}/{args.calls} calls in {elapsed:.1f}s ({ok / elapsed:.1f} calls/s)")
+    print(f"Server saw {server.request_count} requests, rejected {server.rejected_count} with 429")
+    governor.print_stats()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
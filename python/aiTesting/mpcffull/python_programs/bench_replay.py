@@ -0,0 +1,117 @@
+"""
+Offline profile of 4-ecozeai_calculations.py under replayed model traffic.
+
+Runs the script's main() on a generated sheet of --rows products with every
+model call served from a fixture archive (record_replay.py), so what is timed
+is the orchestration itself: flow driving, stream parsing, DataFrame updates,
+checkpoint journal and the final Excel write.
+
+    # Fixture from a real run (any number of products):
+    GENAI_RECORD=~/fixtures/ecozeai.jsonl python 4-ecozeai_calculations.py
+
+    # or a synthetic one recorded against fake_genai_server.py:
+    python bench_replay.py --make-fixtures ~/fixtures/fake.jsonl
+
+    python bench_replay.py --fixtures ~/fixtures/ecozeai.jsonl --rows 10000 --speed 0 --profile
+
+Rows are replayed with loose matching, so products that were never recorded
+get a recording of the same step.
+"""
+import argparse
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import rate_limiter
+import record_replay
+from bench_support import SCRIPTS_DIR, load_script
+
+SCRIPT_PATH = os.path.join(SCRIPTS_DIR, "4-ecozeai_calculations.py")
+PROFILE_TOP = 25
+FAKE_MODELS = ("fake-main", "fake-guidance")    # The script's placeholder model names are not valid requests
+
+
+def run_script(workdir, rows, engine, models=None):
+    """Runs main() on a fresh sheet of `rows` products inside workdir; returns wall seconds."""
+    input_file = os.path.join(workdir, "products.xlsx")
+    pd.DataFrame({
+        "product_name": [f"Product {i}" for i in range(rows)],
+        "product_description": [f"Description of product {i}" for i in range(rows)],
+    }).to_excel(input_file, index=False)
+
+    # Replayed calls are not the API's: keep the governor's rate limits out of the way
+    rate_limiter.DEFAULT_RPM = rate_limiter.DEFAULT_TPM = None
+    rate_limiter.MODEL_LIMITS.clear()
+    os.environ["GENAI_TELEMETRY_DIR"] = os.path.join(workdir, "telemetry")
+    script = load_script(os.path.basename(SCRIPT_PATH))
+    if models:
+        script.MODEL_MAIN, script.MODEL_GUIDANCE = models
+    script.INPUT_FILE = input_file
+    script.OUTPUT_FILE = os.path.join(workdir, "results.xlsx")
+
+    sys.argv = [SCRIPT_PATH, "--engine", engine]
+    started = time.perf_counter()
+    script.main()
+    return time.perf_counter() - started
+
+
+def make_fixtures(path, rows, engine):
+    """Records a run of the script against fake_genai_server.py."""
+    from fake_genai_server import start_server
+
+    server = start_server()
+    os.environ["GENAI_BASE_URL"] = server.base_url
+    record_replay.start_recording(path)
+    with tempfile.TemporaryDirectory() as workdir:
+        run_script(workdir, rows, engine, FAKE_MODELS)
+    server.shutdown()
+    print(f"\nRecorded {server.request_count} calls to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the ecozeAI pipeline offline on replayed model traffic.")
+    parser.add_argument("--fixtures", help="Fixture archive to replay (GENAI_RECORD output)")
+    parser.add_argument("--make-fixtures", metavar="PATH", help="Record a synthetic archive from the fake server and exit")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--speed", type=float, default=0, help="Replay speed: 1 = recorded timings, 0 = no waits")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--profile", action="store_true", help="cProfile the run and print the top functions")
+    args = parser.parse_args()
+
+    if args.make_fixtures:
+        make_fixtures(args.make_fixtures, min(args.rows, 20), args.engine)
+        return
+    if not args.fixtures:
+        parser.error("--fixtures or --make-fixtures is required")
+
+    archive = record_replay.start_replay(args.fixtures, args.speed, match="loose")
+    print(f"=== Replay: {args.rows} rows, {len(archive)} recorded calls, speed {args.speed:g}, {args.engine} engine ===")
+
+    profiler = cProfile.Profile() if args.profile else None
+    with tempfile.TemporaryDirectory() as workdir:
+        if profiler:
+            profiler.enable()
+        # Synthetic fixtures were recorded under FAKE_MODELS, real ones under the script's own names
+        models = FAKE_MODELS if FAKE_MODELS[0] in archive.models() else None
+        seconds = run_script(workdir, args.rows, args.engine, models)
+        if profiler:
+            profiler.disable()
+
+    served = archive.stats["exact"] + archive.stats["loose"]
+    print(f"\n{args.rows} rows in {seconds:.2f}s ({args.rows / seconds:.0f} rows/s), "
+          f"{served} calls replayed, {archive.stats['misses']} misses")
+    if profiler:
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out).sort_stats("cumulative")
+        stats.print_stats(PROFILE_TOP)
+        print(out.getvalue())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Micro-benchmark: response_parser against the per-field regex parsers it replaced.
+
+Builds a corpus of large synthetic responses (long multi-line methodology and
+reasoning text, several product configurations) and times:
+  - emissions factors: 4 x re.search (DOTALL) vs one parse()
+  - analyst/auditor:   cf_value + rating + rating_reasoning searches vs parse()
+  - official CFs:      line-by-line split + re.match vs parse_records()
+Results are checked for agreement before timing.
+
+    python bench_response_parser.py --responses 500 --kb 40
+"""
+import argparse
+import random
+import re
+import time
+
+from bench_support import prose
+from response_parser import parse, parse_records
+
+
+# --- Previous implementations (kept here only for comparison) ---
+
+def legacy_emissions(text):
+    data = {}
+    m = re.search(r'\*sb_cf:\s*([0-9.,]+)', text)
+    data['sb_cf'] = float(m.group(1).replace(',', '')) if m else None
+    m = re.search(r'\*sb_methodology_used:\s*(.*?)(?=\*ab_cf|\Z)', text, re.DOTALL)
+    data['sb_methodology_used'] = m.group(1).strip() if m else None
+    m = re.search(r'\*ab_cf:\s*([0-9.,]+)', text)
+    data['ab_cf'] = float(m.group(1).replace(',', '')) if m else None
+    m = re.search(r'\*ab_methodology_used:\s*(.*?)(?=$|\Z)', text, re.DOTALL)
+    data['ab_methodology_used'] = m.group(1).strip() if m else None
+    return data
+
+
+def legacy_audit(analyst, auditor):
+    m = re.search(r'(?:\*?\s*)cf_value\s*[:=]\s*([^\s\n\r]+)', analyst.replace('\u00A0', ' '), re.IGNORECASE)
+    cf_value = float(re.sub(r'[^\d.eE-]', '', m.group(1))) if m else None
+    m = re.search(r'\*rating:\s*(Pass|Refine)', auditor, re.IGNORECASE)
+    rating = m.group(1) if m else "Pass"
+    m = re.search(r'\*rating_reasoning:\s*([\s\S]+)', auditor, re.IGNORECASE)
+    reasoning = m.group(1) if m else "No reasoning."
+    return cf_value, rating, reasoning.strip()
+
+
+def legacy_records(text):
+    products, current = [], {}
+    for line in text.strip().split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        match = re.match(r'^/(\w+)(?:_\d+)?\s*(?:\(.*\))?\s*=\s*(.*)', line)
+        if match:
+            if "product_name" in match.group(1) and current:
+                products.append(current)
+                current = {}
+            current[match.group(1)] = match.group(2).strip()
+    if current:
+        products.append(current)
+    return products
+
+
+# --- Corpus ---
+
+def make_corpus(n, kb, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        body = prose(rng, kb * 1024 // 2)
+        emissions = (f"*sb_cf: {rng.uniform(0.1, 99):.3f}\n*sb_methodology_used: {body}\n"
+                     f"*ab_cf: {rng.uniform(0.1, 99):.3f}\n*ab_methodology_used: {body}")
+        analyst = f"{body}\n*cf_value: {rng.uniform(1, 500):.2f}\n{body}"
+        auditor = f"*rating: {rng.choice(['Pass', 'Refine'])}\n*rating_reasoning: {body}"
+        records = "\n".join(
+            f"/product_name_{i} (String) = Product {i}\n/total_cf_kg (Double) = {rng.uniform(1, 900):.1f}\n"
+            f"/url (String) = https://example.com/{i}.pdf\n/cradle_to_gate_cf = {rng.uniform(1, 500):.1f}"
+            for i in range(1, 6)
+        ) + "\n" + prose(rng, kb * 1024 // 4).replace("\n", "\n ")
+        corpus.append((emissions, analyst, auditor, records))
+    return corpus
+
+
+EF_KEYS = ('sb_cf', 'sb_methodology_used', 'ab_cf', 'ab_methodology_used')
+
+
+def new_emissions(text):
+    result = parse(text, numeric={'sb_cf', 'ab_cf'}, keys=EF_KEYS)
+    return {key: result.get(key) for key in EF_KEYS}
+
+
+def new_audit(analyst, auditor):
+    audit = parse(auditor, keys={'rating', 'rating_reasoning'})
+    return parse(analyst, numeric={'cf_value'}, keys={'cf_value'}).get('cf_value'), audit.get('rating'), audit.get('rating_reasoning')
+
+
+def new_records(text):
+    return parse_records(text)[0]
+
+
+def timed(fn, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(*item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared response parser.")
+    parser.add_argument("--responses", type=int, default=300)
+    parser.add_argument("--kb", type=int, default=40, help="Approximate size of each response in KB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.responses, args.kb)
+    cases = [
+        ("emissions factors", legacy_emissions, new_emissions, [(c[0],) for c in corpus]),
+        ("analyst + auditor", legacy_audit, new_audit, [(c[1], c[2]) for c in corpus]),
+        ("official CF records", legacy_records, new_records, [(c[3],) for c in corpus]),
+    ]
+
+    # Agreement check (legacy records are untyped strings, so compare loosely)
+    for name, old, new, items in cases:
+        for item in items[:20]:
+            a, b = old(*item), new(*item)
+            if name == "official CF records":
+                # The old regex kept the _N suffix on keys (product_name_1); compare without it
+                a = [{re.sub(r'_\d+$', '', k): str(v) for k, v in r.items()} for r in a]
+                b = [{k: str(v) for k, v in r.items()} for r in b]
+            assert a == b, f"{name}: parsers disagree"
+
+    print(f"=== Response parser benchmark ({args.responses} responses, ~{args.kb} KB each, best of {args.repeat}) ===")
+    print(f"{'case':<22}{'legacy ms/resp':>16}{'new ms/resp':>14}{'speed-up':>10}")
+    for name, old, new, items in cases:
+        t_old = timed(old, items, args.repeat)
+        t_new = timed(new, items, args.repeat)
+        n = len(items)
+        print(f"{name:<22}{t_old / n * 1000:>16.3f}{t_new / n * 1000:>14.3f}{t_old / t_new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
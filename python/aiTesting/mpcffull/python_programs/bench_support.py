@@ -0,0 +1,34 @@
+"""
+Helpers shared by the bench_*.py scripts here and the suite in
+python/benchmarks: loading the numbered scripts as modules, and synthetic text.
+"""
+import importlib.util
+import os
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = ("carbon footprint steel aluminium transport lifecycle grid mix supplier "
+         "kgCO2e spend based activity emission factor methodology source dataset").split()
+
+_scripts = {}
+
+
+def load_script(filename):
+    """A numbered script (e.g. "4-ecozeai_calculations.py") as a module; its name is not importable. Loaded once per process."""
+    if filename not in _scripts:
+        name = "bench_" + os.path.splitext(filename)[0].replace("-", "_")
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _scripts[filename] = module
+    return _scripts[filename]
+
+
+def prose(rng, n_chars):
+    """Roughly n_chars of multi-line filler text."""
+    lines, size = [], 0
+    while size < n_chars:
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
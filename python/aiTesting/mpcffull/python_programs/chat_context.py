@@ -0,0 +1,138 @@
+"""
+Analyst conversation state with configurable compaction.
+
+The analyst refinement loop used to resend the whole chat on every turn: the
+guidance-laden first message, both analyst answers and every earlier
+refinement prompt and answer. ChatContext keeps the full history but renders
+what is actually sent according to a policy:
+
+  - full:    everything (the original behaviour)
+  - latest:  first user message + the current answer + the new prompt
+  - summary: as latest, with earlier auditor feedback condensed into a short
+             list in front of the new prompt
+
+    context = ChatContext(user_msg, policy="latest")
+    answer = yield ("analyst", MODEL_MAIN, context.contents("analyst"), config)
+    context.add_answer(answer)
+    contents = context.ask(refine_prompt, "refinement")
+
+Every render records estimated input tokens for the full history and for
+what was sent, per step; print_context_stats() summarises the saving.
+"""
+import threading
+
+from google.genai import types
+
+from rate_limiter import estimate_tokens
+
+# --- CONFIGURATION ---
+POLICIES = ["full", "latest", "summary"]
+FEEDBACK_SUMMARY_CHARS = 400    # Per earlier auditor feedback kept by the summary policy
+
+
+def _content(role, text):
+    return types.Content(role=role, parts=[types.Part.from_text(text=text)])
+
+
+def summarise_feedback(feedback, limit=FEEDBACK_SUMMARY_CHARS):
+    """First `limit` characters of a feedback text, cut at a sentence or word boundary."""
+    text = " ".join((feedback or "").split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind("; "))
+    return (cut[:end + 1] if end > limit // 2 else cut.rsplit(" ", 1)[0]) + " ..."
+
+
+class ChatContext:
+    """One product's analyst chat: full history plus the policy used to render it."""
+
+    def __init__(self, first_message, policy="full"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown context policy '{policy}' (expected one of {POLICIES})")
+        self.policy = policy
+        self.first_message = first_message
+        self.history = [("user", first_message)]
+        self.current_answer = None
+        self.feedback = []          # auditor feedback, oldest first
+        self.turns = []             # (step, full_tokens, sent_tokens)
+
+    def add_answer(self, text):
+        """Appends a model answer; it becomes the current answer."""
+        self.history.append(("model", text))
+        self.current_answer = text
+
+    def set_current(self, text):
+        """Marks which answer later turns build on (e.g. the one that has a cf_value)."""
+        self.current_answer = text
+
+    def add_feedback(self, text):
+        """Records auditor feedback (the summary policy condenses earlier ones)."""
+        if text:
+            self.feedback.append(text)
+
+    def ask(self, prompt, step):
+        """Appends a user prompt and returns the contents to send for it."""
+        self.history.append(("user", prompt))
+        return self.contents(step)
+
+    def _compact(self):
+        if self.current_answer is None:
+            return [("user", self.first_message)]
+        prompt = self.history[-1][1]
+        earlier = self.feedback[:-1]
+        if self.policy == "summary" and earlier:
+            summary = "\n".join(f"- {summarise_feedback(text)}" for text in earlier)
+            prompt = f"Earlier auditor feedback (already addressed):\n{summary}\n\n{prompt}"
+        return [("user", self.first_message), ("model", self.current_answer), ("user", prompt)]
+
+    def contents(self, step):
+        """The contents for the next call under this context's policy; records token estimates."""
+        full = [_content(role, text) for role, text in self.history]
+        sent = full if self.policy == "full" else [_content(role, text) for role, text in self._compact()]
+        full_tokens, sent_tokens = estimate_tokens(full), estimate_tokens(sent)
+        self.turns.append((step, full_tokens, sent_tokens))
+        record(step, full_tokens, sent_tokens)
+        return sent
+
+
+# --- Run-wide metrics ---
+
+_lock = threading.Lock()
+_stats = {}     # step -> [calls, full_tokens, sent_tokens]
+
+
+def record(step, full_tokens, sent_tokens):
+    with _lock:
+        entry = _stats.setdefault(step, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += full_tokens
+        entry[2] += sent_tokens
+
+
+def context_stats():
+    """{step: (calls, full_tokens, sent_tokens)} so far."""
+    with _lock:
+        return {step: tuple(entry) for step, entry in _stats.items()}
+
+
+def reset_context_stats():
+    with _lock:
+        _stats.clear()
+
+
+def print_context_stats(policy=None):
+    """Prints estimated input tokens per turn with the full history vs what was sent, per step."""
+    stats = context_stats()
+    if not stats:
+        return
+    print(f"\n--- Analyst Context{f' ({policy})' if policy else ''}: est. input tokens per turn ---")
+    print(f"{'step':<20}{'calls':>7}{'full':>10}{'sent':>10}{'saved':>8}")
+    total_full = total_sent = 0
+    for step, (calls, full_tokens, sent_tokens) in stats.items():
+        total_full += full_tokens
+        total_sent += sent_tokens
+        saved = 1 - sent_tokens / full_tokens if full_tokens else 0
+        print(f"{step:<20}{calls:>7}{full_tokens / calls:>10.0f}{sent_tokens / calls:>10.0f}{saved:>8.0%}")
+    if total_full:
+        print(f"Total: {total_sent} of {total_full} est. tokens sent ({1 - total_sent / total_full:.0%} saved)")
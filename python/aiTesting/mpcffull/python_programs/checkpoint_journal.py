@@ -0,0 +1,117 @@
+"""
+Append-only checkpoint journal for the mpcffull spreadsheet scripts.
+
+Rewriting the whole workbook every few rows costs O(rows) per checkpoint and
+O(rows^2) over a run, because every rewrite includes all the long history
+text written so far. Instead, each completed row is appended as one JSON line
+keyed by its DataFrame index:
+
+    {"idx": 12, "fields": {"cf_ecozeAI": "...", "cf_value_extracted": 4.2}}
+
+Excel is written once at the end (or on request), and a restarted run reads
+the journal back to resume where it stopped.
+
+Usage:
+    journal = CheckpointJournal(journal_path_for(OUTPUT_FILE))
+    journal.apply(df)                 # resume: fill in rows finished earlier
+    journal.append(idx, {...})        # per completed row
+    journal.materialise(df, OUTPUT_FILE)
+"""
+import json
+import math
+import os
+import threading
+
+
+def journal_path_for(excel_path):
+    """Default journal location next to the workbook it checkpoints."""
+    return os.path.expanduser(excel_path) + ".journal.jsonl"
+
+
+def _jsonable(value):
+    """NaN/NA -> None and numpy scalars -> Python scalars, so every line is valid JSON."""
+    if value is None:
+        return None
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class CheckpointJournal:
+    """Thread-safe JSONL journal of completed rows."""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self._repair_tail()
+
+    def _repair_tail(self):
+        """Terminates a torn last line so the next append starts on a fresh line."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def append(self, idx, fields):
+        """Durably records the fields of one completed row."""
+        line = json.dumps(
+            {"idx": _jsonable(idx), "fields": {k: _jsonable(v) for k, v in fields.items()}},
+            ensure_ascii=False,
+        )
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.rows_written += 1
+
+    def load(self):
+        """
+        Returns {idx: fields} with later entries winning. A torn last line
+        (e.g. from a crash mid-write) is ignored.
+        """
+        rows = {}
+        if not os.path.exists(self.path):
+            return rows
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                rows.setdefault(entry["idx"], {}).update(entry["fields"])
+        return rows
+
+    def apply(self, df):
+        """Writes journaled values into df. Returns the number of rows restored."""
+        rows = self.load()
+        restored = 0
+        for idx, fields in rows.items():
+            if idx not in df.index:
+                continue
+            for col, value in fields.items():
+                if col not in df.columns:
+                    df[col] = None
+                df.at[idx, col] = value
+            restored += 1
+        return restored
+
+    def materialise(self, df, excel_path, clear=True):
+        """
+        Writes df (with the journal applied) to Excel in one go. With clear,
+        the journal is removed afterwards since the workbook now holds it all.
+        """
+        self.apply(df)
+        df.to_excel(excel_path, index=False)
+        if clear:
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
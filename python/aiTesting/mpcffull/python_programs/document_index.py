@@ -0,0 +1,193 @@
+"""
+Persistent index of the PDFs 1-get_official_cfs.py has already extracted.
+
+Each document is keyed by the SHA-256 of its content and records the
+extraction status and the parsed rows, so a rerun only sends new or changed
+PDFs. The last known (path, size, mtime) of every file is kept as well, which
+lets an unchanged file be recognised from os.stat() alone without re-hashing.
+
+Usage:
+    index = DocumentIndex(index_path_for(OUTPUT_FILE))
+    digest = index.digest(path)            # cached by (size, mtime)
+    if index.is_done(digest): skip
+    index.record(digest, path, "done", rows)   # supersedes older versions of the file
+    index.prune()                          # forgets PDFs deleted since the last run
+    workbook_rows = index.done_rows()      # every extracted row, across runs
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def index_path_for(excel_path):
+    """Default index location next to the workbook it feeds."""
+    return os.path.expanduser(excel_path) + ".index.sqlite"
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks so large PDFs are never fully in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentIndex:
+    """Thread-safe SQLite store of per-document extraction results."""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                sha256 TEXT PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                rows TEXT,
+                error TEXT,
+                updated REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def digest(self, path):
+        """
+        Content hash of path. Reuses the stored hash when size and mtime are
+        unchanged since it was last computed.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime, sha256 FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime:
+            return row[2]
+
+        sha = file_sha256(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime, sha),
+            )
+            self._conn.commit()
+        return sha
+
+    def status(self, sha):
+        """Returns "done", "failed", "superseded", "removed" or None if the document has never been seen."""
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM documents WHERE sha256 = ?", (sha,)).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, sha):
+        return self.status(sha) == "done"
+
+    def record(self, sha, file_name, status, rows=None, error=None):
+        """
+        Stores the outcome of one document ("done" with its rows, or "failed"
+        with an error). A failed re-extraction (--force) keeps the rows and
+        status of an earlier successful one and only notes the error. A done
+        document supersedes the earlier versions of the same file name, so an
+        edited PDF only contributes its current rows.
+        """
+        with self._lock:
+            if status != "done":
+                cur = self._conn.execute(
+                    "UPDATE documents SET error = ?, updated = ? WHERE sha256 = ? AND status = 'done'",
+                    (error, time.time(), sha),
+                )
+                if cur.rowcount:
+                    self._conn.commit()
+                    return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (sha256, file_name, status, rows, error, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (sha, file_name, status, json.dumps(rows or [], ensure_ascii=False), error, time.time()),
+            )
+            if status == "done":
+                self._conn.execute(
+                    "UPDATE documents SET status = 'superseded', updated = ? WHERE file_name = ? AND sha256 != ? AND status = 'done'",
+                    (time.time(), file_name, sha),
+                )
+            self._conn.commit()
+
+    def prune(self):
+        """
+        Forgets files whose path no longer exists. Their documents are marked
+        "removed" (unless the same content still exists under another path),
+        so done_rows() drops them while file_names() still knows the name.
+        Returns the number of documents removed.
+        """
+        with self._lock:
+            known = self._conn.execute("SELECT path, sha256 FROM files").fetchall()
+            gone = [(path, sha) for path, sha in known if not os.path.exists(path)]
+            if not gone:
+                return 0
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path, _ in gone])
+            removed = 0
+            for sha in {sha for _, sha in gone}:
+                cur = self._conn.execute(
+                    "UPDATE documents SET status = 'removed', updated = ? WHERE sha256 = ? AND status != 'removed' "
+                    "AND NOT EXISTS (SELECT 1 FROM files WHERE files.sha256 = documents.sha256)",
+                    (time.time(), sha),
+                )
+                removed += cur.rowcount
+            self._conn.commit()
+            return removed
+
+    def rows(self, sha):
+        """Parsed rows stored for a document (empty if none)."""
+        with self._lock:
+            row = self._conn.execute("SELECT rows FROM documents WHERE sha256 = ?", (sha,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else []
+
+    def done_rows(self):
+        """Rows of the current version of every extracted document, in file name order."""
+        with self._lock:
+            stored = self._conn.execute(
+                "SELECT rows FROM documents WHERE status = 'done' ORDER BY file_name"
+            ).fetchall()
+        return [row for (rows,) in stored if rows for row in json.loads(rows)]
+
+    def file_names(self):
+        """Names of all documents the index has seen."""
+        with self._lock:
+            return {name for (name,) in self._conn.execute("SELECT file_name FROM documents").fetchall()}
+
+    def last_scan(self):
+        """Start time (epoch seconds) of the last completed scan, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'last_scan'").fetchone()
+        return float(row[0]) if row else None
+
+    def set_last_scan(self, started):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_scan', ?)", (str(started),))
+            self._conn.commit()
+
+    def counts(self):
+        """Number of indexed documents per status."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,197 @@
+"""
+Local fake Gemini endpoint for benchmarking the mpcffull scripts offline.
+
+Speaks just enough of the generativelanguage REST API for the scripts:
+  POST /v1beta/models/{model}:generateContent
+  POST /v1beta/models/{model}:streamGenerateContent?alt=sse
+  POST/PATCH/DELETE /v1beta/cachedContents[/{id}]  (explicit context caches)
+
+Calls that reference a cachedContent report its size as cachedContentTokenCount.
+
+With max_rpm set, calls above that rate (sliding 60s window) get a 429
+RESOURCE_EXHAUSTED, like the real API, to exercise rate_limiter.py.
+
+Run it standalone:
+    python fake_genai_server.py --port 8765 --latency 0.2 --max-rpm 120
+    GENAI_BASE_URL=http://127.0.0.1:8765 python 4-ecozeai_calculations.py
+
+or start it in-process from a benchmark with start_server().
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE_TEXT = """*rating: Pass
+*rating_reasoning: The answer is well grounded.
+*cf_value: 12.5
+*sb_cf: 1.23
+*sb_methodology_used: Spend based.
+*ab_cf: 4.56
+*ab_methodology_used: Activity based.
+*pass_or_fail: Pass
+*description: ...
+/product_name_1 (String) = Fake Product
+/total_cf_kg (Double) = 10.5
+/url (String) = https://example.com/epd.pdf
+"""
+
+
+class FakeGenAIHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between calls
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _response_payload(self, text, cached_tokens=0):
+        usage = {
+            "promptTokenCount": 100 + cached_tokens,
+            "candidatesTokenCount": max(len(text) // 4, 1),
+            "totalTokenCount": 100 + cached_tokens + max(len(text) // 4, 1),
+        }
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP",
+            }],
+            "usageMetadata": usage,
+        }
+
+    def _cache_payload(self, name):
+        return {"name": name, "usageMetadata": {"totalTokenCount": self.server.cached_contents.get(name, 0)}}
+
+    def do_PATCH(self):
+        self._read_body()
+        name = self.path.split("?")[0].split("/v1beta/")[-1]
+        self._send(200, json.dumps(self._cache_payload(name)).encode())
+
+    def do_DELETE(self):
+        name = self.path.split("?")[0].split("/v1beta/")[-1]
+        self.server.cached_contents.pop(name, None)
+        self._send(200, b"{}")
+
+    def do_POST(self):
+        raw = self._read_body()
+        if self.path.split("?")[0].endswith("/cachedContents"):
+            # Cached prefix size ~ its request size (4 characters per token)
+            name = self.server.add_cached_content(len(raw) // 4)
+            self._send(200, json.dumps(self._cache_payload(name)).encode())
+            return
+        if not self.server.record_request():
+            self._send(429, json.dumps({"error": {
+                "code": 429,
+                "message": "Resource has been exhausted (e.g. check quota).",
+                "status": "RESOURCE_EXHAUSTED",
+            }}).encode())
+            return
+        time.sleep(self.server.latency)
+
+        try:
+            cached_tokens = self.server.cached_contents.get(json.loads(raw or b"{}").get("cachedContent"), 0)
+        except ValueError:
+            cached_tokens = 0
+        text = self.server.response_text
+        if ":streamGenerateContent" in self.path:
+            # Split the answer into a few SSE chunks, like the real API
+            chunk_size = max(len(text) // self.server.stream_chunks, 1)
+            pieces = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+            body = b"".join(
+                b"data: " + json.dumps(self._response_payload(piece, cached_tokens)).encode() + b"\r\n\r\n"
+                for piece in pieces
+            )
+            self._send(200, body, "text/event-stream")
+        elif ":generateContent" in self.path:
+            self._send(200, json.dumps(self._response_payload(text, cached_tokens)).encode())
+        else:
+            self._send(404, b'{"error": {"code": 404, "message": "Not found"}}')
+
+
+class FakeGenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, response_text=DEFAULT_RESPONSE_TEXT, stream_chunks=4, max_rpm=None):
+        super().__init__(address, FakeGenAIHandler)
+        self.latency = latency
+        self.response_text = response_text
+        self.stream_chunks = stream_chunks
+        self.max_rpm = max_rpm
+        self.request_count = 0
+        self.rejected_count = 0
+        self.cached_contents = {}   # name -> tokens
+        self._cache_ids = 0
+        self._accepted_times = deque()
+        self._count_lock = threading.Lock()
+
+    def add_cached_content(self, tokens):
+        with self._count_lock:
+            self._cache_ids += 1
+            name = f"cachedContents/fake-{self._cache_ids}"
+            self.cached_contents[name] = tokens
+            return name
+
+    def record_request(self):
+        """Counts a request. Returns False if it is over max_rpm and should get a 429."""
+        with self._count_lock:
+            self.request_count += 1
+            if self.max_rpm is None:
+                return True
+            now = time.monotonic()
+            while self._accepted_times and now - self._accepted_times[0] > 60:
+                self._accepted_times.popleft()
+            if len(self._accepted_times) >= self.max_rpm:
+                self.rejected_count += 1
+                return False
+            self._accepted_times.append(now)
+            return True
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_server(port=0, **kwargs):
+    """
+    Starts a FakeGenAIServer on a background thread and returns it.
+    Port 0 picks a free port; read server.base_url for the address.
+    Call server.shutdown() when done.
+    """
+    server = FakeGenAIServer(("127.0.0.1", port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Gemini endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--max-rpm", type=int, default=None, help="Reject calls above this rate with 429")
+    args = parser.parse_args()
+
+    server = FakeGenAIServer(("127.0.0.1", args.port), latency=args.latency, max_rpm=args.max_rpm)
+    print(f"Fake Gemini endpoint listening on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Shared, thread-safe Gemini clients for the mpcffull scripts.
+
+Creating a new genai.Client per row opens a fresh HTTP connection pool (and
+TLS handshake) every time. This module keeps ONE client (and one requests
+Session for the REST-based script) alive for the whole run, with a bounded
+connection pool, and counts how often connections are actually reused.
+
+Usage:
+    from genai_pool import get_client, print_connection_stats
+
+    client = get_client(API_KEY)
+    ...
+    print_connection_stats()
+
+Set GENAI_BASE_URL (e.g. http://127.0.0.1:8765) to point every script at the
+local fake endpoint in fake_genai_server.py, or GENAI_RECORD / GENAI_REPLAY to
+record model traffic to a fixture archive or serve it back from one (see
+record_replay.py).
+"""
+import os
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from google import genai
+from google.genai import types
+
+from record_replay import print_archive_stats, wrap_client, wrap_session
+
+# --- CONFIGURATION ---
+POOL_MAX_CONNECTIONS = 32       # Hard cap on open sockets (keep >= rate_limiter.DEFAULT_MAX_CONCURRENCY)
+POOL_MAX_KEEPALIVE = 32         # Idle sockets kept warm between calls
+ASYNC_POOL_MAX_CONNECTIONS = 256  # client.aio: one streaming call holds one socket
+POOL_KEEPALIVE_EXPIRY = 120     # Seconds an idle socket is kept
+BASE_URL = os.getenv("GENAI_BASE_URL", "https://generativelanguage.googleapis.com")
+
+_lock = threading.Lock()
+_client = None
+_client_key = None
+_session = None
+_session_view = None    # _session, or its record/replay wrapper
+_stats = {"requests": 0, "new_connections": 0, "tls_handshakes": 0}
+
+
+def _trace(event_name, info):
+    """httpcore trace callback: counts new TCP connections and TLS handshakes."""
+    if event_name == "connection.connect_tcp.complete":
+        with _lock:
+            _stats["new_connections"] += 1
+    elif event_name == "connection.start_tls.complete":
+        with _lock:
+            _stats["tls_handshakes"] += 1
+
+
+def _on_request(request):
+    """httpx request hook: counts requests and attaches the trace callback."""
+    with _lock:
+        _stats["requests"] += 1
+    request.extensions["trace"] = _trace
+
+
+async def _atrace(event_name, info):
+    """Async twin of _trace() for client.aio calls (httpcore awaits it)."""
+    _trace(event_name, info)
+
+
+async def _on_request_async(request):
+    """Async twin of _on_request() for client.aio calls."""
+    with _lock:
+        _stats["requests"] += 1
+    request.extensions["trace"] = _atrace
+
+
+def _limits(max_connections):
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(POOL_MAX_KEEPALIVE, max_connections),
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client(api_key):
+    """
+    Returns the shared genai.Client, creating it on first use.
+    Safe to call from any worker thread. client.aio shares the same pool
+    bounds and stats (an explicit httpx transport keeps it on httpx).
+    """
+    global _client, _client_key
+    with _lock:
+        if _client is not None and _client_key == api_key:
+            return _client
+
+    http_options = types.HttpOptions(
+        base_url=os.getenv("GENAI_BASE_URL"),
+        client_args={
+            "limits": _limits(POOL_MAX_CONNECTIONS),
+            "event_hooks": {"request": [_on_request]},
+        },
+        async_client_args={
+            "transport": httpx.AsyncHTTPTransport(limits=_limits(ASYNC_POOL_MAX_CONNECTIONS)),
+            "event_hooks": {"request": [_on_request_async]},
+        },
+    )
+    client = wrap_client(genai.Client(api_key=api_key, http_options=http_options))
+
+    with _lock:
+        # Another thread may have won the race; keep the first client.
+        if _client is None or _client_key != api_key:
+            _client = client
+            _client_key = api_key
+        return _client
+
+
+def get_session():
+    """
+    Returns the shared requests.Session used for raw REST calls
+    (3-product_descriptions.py), with the same pool bounds as get_client().
+    """
+    global _session, _session_view
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=POOL_MAX_CONNECTIONS,
+                pool_block=True,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+            _session_view = wrap_session(session)
+        return _session_view
+
+
+def _session_stats():
+    """Reads request/connection counters straight from the urllib3 pools."""
+    if _session is None:
+        return 0, 0, 0
+    total_requests = 0
+    total_connections = 0
+    total_tls = 0
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+            if pool.scheme == "https":
+                total_tls += pool.num_connections
+    return total_requests, total_connections, total_tls
+
+
+def connection_stats():
+    """
+    Returns a snapshot of this run's connection usage:
+    requests sent, new connections opened, TLS handshakes and reuse ratio.
+    """
+    with _lock:
+        stats = dict(_stats)
+    session_requests, session_connections, session_tls = _session_stats()
+    stats["requests"] += session_requests
+    stats["new_connections"] += session_connections
+    stats["tls_handshakes"] += session_tls
+
+    stats["reused"] = max(stats["requests"] - stats["new_connections"], 0)
+    stats["reuse_ratio"] = stats["reused"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
+
+
+def reset_connection_stats():
+    """Zeroes the genai client counters (e.g. between benchmark runs)."""
+    with _lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def print_connection_stats():
+    """Prints the per-run connection reuse summary (and the fixture archive's, when recording or replaying)."""
+    stats = connection_stats()
+    print("\n--- Connection Pool Stats ---")
+    print(f"Requests sent:       {stats['requests']}")
+    print(f"New connections:     {stats['new_connections']}")
+    print(f"TLS handshakes:      {stats['tls_handshakes']}")
+    print(f"Reused connections:  {stats['reused']} ({stats['reuse_ratio']:.1%})")
+    print_archive_stats()
+
+
+def close():
+    """Closes the shared client/session. Mostly useful in benchmarks."""
+    global _client, _client_key, _session, _session_view
+    with _lock:
+        client, session = _client, _session
+        _client = None
+        _client_key = None
+        _session = None
+        _session_view = None
+    if client is not None:
+        try:
+            client.close()
+        except AttributeError:
+            pass
+    if session is not None:
+        session.close()
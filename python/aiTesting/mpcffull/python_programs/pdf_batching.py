@@ -0,0 +1,107 @@
+"""
+Size-aware scheduling of PDF documents for 1-get_official_cfs.py.
+
+Reading every PDF fully into memory and inlining it multiplies peak RSS by
+the number of workers. Instead the document set is planned into jobs:
+
+  - "upload": files above INLINE_MAX_BYTES go through the Files API and are
+    referenced by URI, so they are streamed from disk rather than inlined
+  - "inline": everything else is sent inline; files below SMALL_FILE_BYTES
+    are packed together (up to PACK_MAX_BYTES / PACK_MAX_DOCS per request)
+
+ByteBudget caps the total bytes held by in-flight jobs across all workers.
+"""
+import os
+import resource
+import sys
+import threading
+
+# --- CONFIGURATION ---
+INLINE_MAX_BYTES = 8 * 1024 * 1024      # Larger files are uploaded, not inlined
+SMALL_FILE_BYTES = 2 * 1024 * 1024      # Files below this are packed together
+PACK_MAX_BYTES = 12 * 1024 * 1024       # Inline payload per packed request (base64 adds ~33%)
+PACK_MAX_DOCS = 5                       # Documents per packed request
+MAX_IN_FLIGHT_BYTES = 64 * 1024 * 1024  # Bytes held by running jobs at once
+
+
+class Job:
+    """One model request: either a single uploaded file or one/more inline files."""
+
+    def __init__(self, mode, paths):
+        self.mode = mode  # "upload" or "inline"
+        self.paths = paths
+        self.sizes = {path: os.path.getsize(path) for path in paths}
+
+    @property
+    def total_bytes(self):
+        return sum(self.sizes.values())
+
+    @property
+    def names(self):
+        return [os.path.basename(path) for path in self.paths]
+
+    def __repr__(self):
+        return f"Job({self.mode}, {self.names}, {self.total_bytes} bytes)"
+
+
+def plan_jobs(paths):
+    """
+    Splits the documents into upload, single inline and packed inline jobs.
+    Small files are packed first-fit in ascending size order.
+    """
+    jobs = []
+    small = []
+    for path in sorted(paths, key=os.path.getsize):
+        size = os.path.getsize(path)
+        if size > INLINE_MAX_BYTES:
+            jobs.append(Job("upload", [path]))
+        elif size >= SMALL_FILE_BYTES:
+            jobs.append(Job("inline", [path]))
+        else:
+            small.append((path, size))
+
+    pack, pack_bytes = [], 0
+    for path, size in small:
+        if pack and (pack_bytes + size > PACK_MAX_BYTES or len(pack) >= PACK_MAX_DOCS):
+            jobs.append(Job("inline", pack))
+            pack, pack_bytes = [], 0
+        pack.append(path)
+        pack_bytes += size
+    if pack:
+        jobs.append(Job("inline", pack))
+
+    # Biggest jobs first so the long uploads don't end up as stragglers
+    jobs.sort(key=lambda job: job.total_bytes, reverse=True)
+    return jobs
+
+
+class ByteBudget:
+    """
+    Blocks job starts while the bytes held by running jobs would exceed
+    max_bytes. A job bigger than the whole budget runs alone.
+    """
+
+    def __init__(self, max_bytes=MAX_IN_FLIGHT_BYTES):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.peak = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, amount):
+        with self.cond:
+            while self.in_flight and self.in_flight + amount > self.max_bytes:
+                self.cond.wait()
+            self.in_flight += amount
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self, amount):
+        with self.cond:
+            self.in_flight -= amount
+            self.cond.notify_all()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return peak / divisor
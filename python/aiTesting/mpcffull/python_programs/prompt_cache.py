@@ -0,0 +1,214 @@
+"""
+Run-wide caching of large, stable prompt prefixes for the mpcffull scripts.
+
+Every analyst call resends the same system instruction and tools, and every
+auditor call the same SYS_MSG_MPCFFULL_CORE text. A prefix cache registers
+each distinct prefix once per run and lets later calls reference it:
+
+    AUDITOR_PREFIX = stable_prefix("System Instructions given to the AI:\\n" + SYS_MSG)
+
+    contents = AUDITOR_PREFIX + [per_call_content]
+    contents, config = get_prefix_cache().prepare(client, model, contents, config)
+
+A call's prefix is its config's system instruction and tools plus the leading
+contents that came from stable_prefix(). Two implementations:
+
+  - local:  no-op stand-in. Counts the prefixes and how often they recur but
+            sends everything inline (the provider's implicit caching may still
+            apply; telemetry shows it as cached tokens).
+  - gemini: creates one explicit CachedContent per prefix (client.caches) and
+            sends only the rest of the call with config.cached_content. A
+            prefix the provider rejects (too small, unsupported model) is
+            sent inline from then on.
+
+Select with enable_prompt_cache("gemini"), the --prompt-cache flag, or
+GENAI_PROMPT_CACHE=gemini; call release_prompt_caches(client) at the end of
+the run so the explicit caches stop accruing storage.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from google.genai import types
+
+from rate_limiter import estimate_tokens
+from response_cache import cache_key
+
+# --- CONFIGURATION ---
+PROMPT_CACHE_KINDS = ["local", "gemini"]
+PROMPT_CACHE_TTL_SECONDS = 6 * 3600   # Extended once half of it has passed, so long runs keep their caches
+MIN_CACHE_TOKENS = 2048               # Est. tokens; smaller prefixes are always sent inline
+
+_stable_ids = set()
+_stable_refs = []     # Keeps registered Contents alive so their ids stay unique
+
+
+def stable_prefix(*texts):
+    """User Contents to put at the start of `contents`; they are cached with the system instruction."""
+    contents = [types.Content(role="user", parts=[types.Part.from_text(text=text)]) for text in texts]
+    _stable_refs.extend(contents)
+    _stable_ids.update(id(content) for content in contents)
+    return contents
+
+
+def _split(model, contents, config):
+    """(n_leading_stable_contents, prefix_key, est_prefix_tokens); key is None if there is no prefix."""
+    n = 0
+    while n < len(contents) and id(contents[n]) in _stable_ids:
+        n += 1
+    system = getattr(config, "system_instruction", None)
+    tools = getattr(config, "tools", None)
+    if not n and not system:
+        return 0, None, 0
+    key = cache_key(model, contents[:n], {"system_instruction": system, "tools": tools})
+    return n, key, estimate_tokens(system) + estimate_tokens(contents[:n])
+
+
+class LocalPrefixCache:
+    """No-op stand-in: registers prefixes and counts their reuse; everything is sent inline."""
+
+    kind = "local"
+
+    def __init__(self):
+        self.prefixes = {}      # key -> {"tokens", "calls", "name"}
+        self._lock = threading.Lock()
+
+    def _use(self, key, tokens):
+        with self._lock:
+            entry = self.prefixes.setdefault(key, {"tokens": tokens, "calls": 0, "name": None})
+            entry["calls"] += 1
+            return entry
+
+    def prepare(self, client, model, contents, config):
+        """Returns the (contents, config) to send."""
+        _, key, tokens = _split(model, contents, config)
+        if key is not None:
+            self._use(key, tokens)
+        return contents, config
+
+    async def prepare_async(self, client, model, contents, config):
+        return self.prepare(client, model, contents, config)
+
+    def release(self, client):
+        pass
+
+    def print_stats(self):
+        if not self.prefixes:
+            return
+        calls = sum(entry["calls"] for entry in self.prefixes.values())
+        reused = sum(entry["tokens"] * (entry["calls"] - 1) for entry in self.prefixes.values())
+        served = sum(entry["tokens"] * entry["calls"] for entry in self.prefixes.values() if entry["name"])
+        print(f"\n--- Prompt Prefix Cache ({self.kind}) ---")
+        print(f"Prefixes:            {len(self.prefixes)} ({sum(1 for e in self.prefixes.values() if e['name'])} cached provider-side)")
+        print(f"Calls with a prefix: {calls}")
+        print(f"Repeated prefix:     ~{reused} est. tokens across the run")
+        if self.kind != "local":
+            print(f"Sent by reference:   ~{served} est. tokens")
+
+
+class GeminiPrefixCache(LocalPrefixCache):
+    """Explicit Gemini context caches, one per distinct prefix."""
+
+    kind = "gemini"
+
+    def __init__(self, ttl_seconds=PROMPT_CACHE_TTL_SECONDS, min_tokens=MIN_CACHE_TOKENS):
+        super().__init__()
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self._create_lock = threading.Lock()
+
+    def _create(self, client, model, contents, config, tokens):
+        """Cache name for the prefix, or None to send it inline."""
+        if tokens < self.min_tokens:
+            return None
+        try:
+            cached = client.caches.create(model=model, config=types.CreateCachedContentConfig(
+                contents=contents or None,
+                system_instruction=config.system_instruction,
+                tools=config.tools,
+                tool_config=config.tool_config,
+                ttl=f"{self.ttl_seconds}s",
+            ))
+            return cached.name
+        except Exception as e:
+            print(f"⚠️ Could not cache a {tokens}-token prefix for {model} ({e}); sending it inline.")
+            return None
+
+    def _extend(self, client, entry):
+        """Pushes the expiry out again once half the TTL has passed."""
+        if time.time() - entry["created"] < self.ttl_seconds / 2:
+            return
+        with self._create_lock:
+            if time.time() - entry["created"] < self.ttl_seconds / 2:
+                return
+            try:
+                client.caches.update(name=entry["name"], config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"))
+            except Exception as e:
+                print(f"⚠️ Could not extend prompt cache {entry['name']} ({e}).")
+            entry["created"] = time.time()
+
+    def prepare(self, client, model, contents, config):
+        n, key, tokens = _split(model, contents, config)
+        if key is None:
+            return contents, config
+        entry = self._use(key, tokens)
+        if "created" not in entry:
+            # One creation per prefix, however many threads reach it first
+            with self._create_lock:
+                if "created" not in entry:
+                    entry["name"] = self._create(client, model, contents[:n], config, tokens)
+                    entry["created"] = time.time()
+        if not entry["name"]:
+            return contents, config
+        self._extend(client, entry)
+        return contents[n:], config.model_copy(update={
+            "system_instruction": None, "tools": None, "tool_config": None, "cached_content": entry["name"],
+        })
+
+    async def prepare_async(self, client, model, contents, config):
+        # Cache creation and renewal are rare blocking calls; keep them off the event loop
+        return await asyncio.to_thread(self.prepare, client, model, contents, config)
+
+    def release(self, client):
+        """Deletes this run's caches."""
+        for entry in self.prefixes.values():
+            if entry.get("name"):
+                try:
+                    client.caches.delete(name=entry["name"])
+                except Exception as e:
+                    print(f"⚠️ Could not delete prompt cache {entry['name']} ({e}).")
+
+
+_prefix_cache = None
+_prefix_cache_lock = threading.Lock()
+
+
+def enable_prompt_cache(kind="gemini"):
+    """Selects the prefix cache for this process and returns it."""
+    global _prefix_cache
+    if kind not in PROMPT_CACHE_KINDS:
+        raise ValueError(f"Unknown prompt cache '{kind}' (expected one of {PROMPT_CACHE_KINDS})")
+    with _prefix_cache_lock:
+        if _prefix_cache is None or _prefix_cache.kind != kind:
+            _prefix_cache = GeminiPrefixCache() if kind == "gemini" else LocalPrefixCache()
+        return _prefix_cache
+
+
+def get_prefix_cache():
+    """Returns the process prefix cache (local unless GENAI_PROMPT_CACHE or enable_prompt_cache() says otherwise)."""
+    if _prefix_cache is None:
+        return enable_prompt_cache(os.getenv("GENAI_PROMPT_CACHE", "local").lower())
+    return _prefix_cache
+
+
+def release_prompt_caches(client):
+    """Deletes any provider-side caches created this run."""
+    if _prefix_cache is not None:
+        _prefix_cache.release(client)
+
+
+def print_prompt_cache_stats():
+    """Prints prefix registrations and reuse if any call had a prefix."""
+    if _prefix_cache is not None:
+        _prefix_cache.print_stats()
@@ -0,0 +1,437 @@
+"""
+Adaptive rate limiting and concurrency control shared by the mpcffull scripts.
+
+Every model call goes through one Governor per process, which combines:
+  - per-model token buckets for requests-per-minute and tokens-per-minute,
+    only where a limit is configured (see below)
+  - an AIMD (additive-increase / multiplicative-decrease) concurrency limit:
+    429s and 5xx errors halve the number of in-flight calls, successes
+    slowly ramp it back up
+  - exponential backoff with jitter on retryable errors
+
+RPM/TPM limits are off unless configured, as the scripts never had any:
+    GENAI_RPM=60 GENAI_TPM=1000000                  # every model
+    GENAI_MODEL_LIMITS="model-a=60:1000000,model-b=300"   # per model (rpm[:tpm])
+or from code (e.g. a --rpm flag) with set_limits() before the first call.
+
+Usage:
+    from rate_limiter import get_governor, estimate_tokens
+
+    GOVERNOR = get_governor()
+    text = GOVERNOR.call(MODEL, fn, *args, est_tokens=estimate_tokens(prompt), **kwargs)
+
+Thread pools should be sized with GOVERNOR.max_concurrency; the governor
+decides how many of those threads may actually be talking to the API.
+Asyncio code uses get_async_governor() and `await GOVERNOR.call(...)` with a
+coroutine function instead.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+# --- CONFIGURATION ---
+DEFAULT_MAX_CONCURRENCY = 32     # Upper bound on in-flight calls (thread pool size)
+DEFAULT_INITIAL_CONCURRENCY = 10 # Where AIMD starts (the old hard-coded worker count)
+DEFAULT_MIN_CONCURRENCY = 1
+MAX_RETRIES = 5
+UNKNOWN_ERROR_ATTEMPTS = 3       # Attempts for errors with no HTTP status (the old fixed retry count)
+BASE_BACKOFF_SECONDS = 2
+MAX_BACKOFF_SECONDS = 60
+
+
+def _env_int(name):
+    value = os.getenv(name, "").strip()
+    return int(value) if value else None
+
+
+def parse_model_limits(text):
+    """'model-a=60:1000000,model-b=300' -> {model: {"rpm": 60, "tpm": 1000000}, ...}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition(":")
+        limits[model.strip()] = {"rpm": int(rpm) if rpm.strip() else None, "tpm": int(tpm) if tpm.strip() else None}
+    return limits
+
+
+DEFAULT_RPM = _env_int("GENAI_RPM")     # Requests per minute, per model (None = no limit)
+DEFAULT_TPM = _env_int("GENAI_TPM")     # Tokens per minute, per model (None = no limit)
+
+# Per-model overrides: model name -> {"rpm": int or None, "tpm": int or None}
+MODEL_LIMITS = parse_model_limits(os.getenv("GENAI_MODEL_LIMITS"))
+
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableStatus(Exception):
+    """Raised by callers that get an HTTP status back instead of an exception (e.g. requests)."""
+
+    def __init__(self, status_code, message=""):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+
+
+def status_of(exc):
+    """
+    Best-effort HTTP status for an exception from google-genai, requests or httpx.
+    Returns None if no status can be found.
+    """
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    if isinstance(value, int):
+        return value
+    match = re.match(r"\s*(\d{3})\b", str(exc))
+    return int(match.group(1)) if match else None
+
+
+def is_transport_error(exc):
+    """True for network-level failures (connection reset, timeout, ...) worth retrying."""
+    if isinstance(exc, (OSError, TimeoutError)):
+        return True
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    return bool(names & {"TransportError", "ClientConnectionError", "ClientPayloadError"})
+
+
+def estimate_tokens(value):
+    """Rough token estimate (~4 characters per token) for strings, Parts and Contents."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value) // 4 + 1
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_tokens(v) for v in value)
+    text = getattr(value, "text", None)
+    if isinstance(text, str):
+        return estimate_tokens(text)
+    parts = getattr(value, "parts", None)
+    if parts:
+        return estimate_tokens(parts)
+    return 0
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount=1):
+        """Takes `amount` units and returns 0 if available, else returns the seconds to wait."""
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount=1):
+        """Blocks until `amount` units are available, then takes them."""
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return
+            time.sleep(min(wait, 1.0))
+
+    async def acquire_async(self, amount=1):
+        """Asyncio version of acquire()."""
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def debit(self, amount):
+        """Takes `amount` units without blocking (may go negative, delaying later callers)."""
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class UnlimitedBucket:
+    """TokenBucket stand-in for a limit that is not configured."""
+
+    def try_acquire(self, amount=1):
+        return 0.0
+
+    def acquire(self, amount=1):
+        pass
+
+    async def acquire_async(self, amount=1):
+        pass
+
+    def debit(self, amount):
+        pass
+
+
+def make_bucket(per_minute):
+    return TokenBucket(per_minute) if per_minute else UnlimitedBucket()
+
+
+def set_limits(rpm=None, tpm=None, model=None):
+    """
+    Configures RPM/TPM limits for one model, or the default for all models.
+    Only affects models that have not been called yet.
+    """
+    global DEFAULT_RPM, DEFAULT_TPM
+    if model is not None:
+        limits = MODEL_LIMITS.setdefault(model, {})
+        limits.update({key: value for key, value in (("rpm", rpm), ("tpm", tpm)) if value is not None})
+        return
+    if rpm is not None:
+        DEFAULT_RPM = rpm
+    if tpm is not None:
+        DEFAULT_TPM = tpm
+
+
+def limits_for(model):
+    """(rpm, tpm) configured for a model; None where there is no limit."""
+    limits = MODEL_LIMITS.get(model, {})
+    rpm = limits.get("rpm")
+    tpm = limits.get("tpm")
+    return (rpm if rpm is not None else DEFAULT_RPM), (tpm if tpm is not None else DEFAULT_TPM)
+
+
+class AIMDController:
+    """
+    Concurrency limit that adapts to backpressure.
+    on_success() adds ~1 slot per `limit` successes; on_throttle() halves the
+    limit, at most once per cooldown so a burst of 429s counts as one signal.
+    """
+
+    def __init__(self, initial, min_limit, max_limit, decrease_factor=0.5, cooldown=5.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.last_decrease = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def _increase(self):
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_success(self):
+        with self.cond:
+            self._increase()
+            self.cond.notify_all()
+
+    def on_throttle(self):
+        with self.cond:
+            now = time.monotonic()
+            if now - self.last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.last_decrease = now
+
+
+class Governor:
+    """Process-wide gate every model call goes through."""
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 initial_concurrency=DEFAULT_INITIAL_CONCURRENCY,
+                 min_concurrency=DEFAULT_MIN_CONCURRENCY,
+                 max_retries=MAX_RETRIES):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.aimd = AIMDController(min(initial_concurrency, max_concurrency), min_concurrency, max_concurrency)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "succeeded": 0, "failed": 0, "throttled": 0, "retries": 0}
+
+    def _bump(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def buckets_for(self, model):
+        """Returns the (rpm, tpm) buckets for a model, creating them on first use."""
+        with self._lock:
+            if model not in self._buckets:
+                rpm, tpm = limits_for(model)
+                self._buckets[model] = (make_bucket(rpm), make_bucket(tpm))
+            return self._buckets[model]
+
+    def _on_error(self, e, attempt, model_name):
+        """
+        Records a failed attempt. Re-raises if it should not be retried, else
+        returns the backoff delay. HTTP errors other than 429/5xx are not
+        retried; errors without a status (other than transport errors) get
+        UNKNOWN_ERROR_ATTEMPTS attempts.
+        """
+        status = status_of(e)
+        if status is not None:
+            retryable = status in THROTTLE_STATUSES
+            max_attempts = self.max_retries
+        else:
+            retryable = True
+            max_attempts = self.max_retries if is_transport_error(e) else min(UNKNOWN_ERROR_ATTEMPTS, self.max_retries)
+        if not retryable:
+            self._bump("failed")
+            raise e
+        if status is not None:
+            self._bump("throttled")
+            self.aimd.on_throttle()
+        if attempt >= max_attempts:
+            self._bump("failed")
+            raise e
+        self._bump("retries")
+        delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        print(f"\n[Attempt {attempt} - {model_name} returned {status or type(e).__name__}] retrying in ~{delay}s")
+        return delay * random.uniform(0.5, 1.0)
+
+    def _on_success(self, result, tpm_bucket, est_tokens):
+        """Charges the TPM bucket for a successful call (the AIMD limit is raised by the caller)."""
+        usage = getattr(result, "usage_metadata", None)
+        if usage is not None and getattr(usage, "total_token_count", None):
+            tpm_bucket.debit(max(usage.total_token_count - est_tokens, 0))
+        elif isinstance(result, str):
+            tpm_bucket.debit(estimate_tokens(result))
+        self._bump("succeeded")
+
+    def call(self, model_name, fn, *args, est_tokens=0, **kwargs):
+        """
+        Runs fn(*args, **kwargs) under the model's budgets and the AIMD limit.
+        Retries 429/5xx and transport errors with exponential backoff, and
+        other errors without an HTTP status a few times; other HTTP errors
+        are raised immediately. Tokens beyond est_tokens (from
+        usage_metadata, or the length of a returned string) are charged to
+        the TPM bucket afterwards.
+        """
+        rpm_bucket, tpm_bucket = self.buckets_for(model_name)
+        self._bump("calls")
+
+        for attempt in range(1, self.max_retries + 1):
+            self.aimd.acquire()
+            try:
+                rpm_bucket.acquire(1)
+                tpm_bucket.acquire(est_tokens)
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(e, attempt, model_name)
+            else:
+                self.aimd.on_success()
+                self._on_success(result, tpm_bucket, est_tokens)
+                return result
+            finally:
+                self.aimd.release()
+            time.sleep(delay)
+
+    def print_stats(self):
+        """Prints a summary of this run's throttling behaviour."""
+        print("\n--- Rate Limiter Stats ---")
+        print(f"Calls:               {self.stats['calls']}")
+        print(f"Succeeded / failed:  {self.stats['succeeded']} / {self.stats['failed']}")
+        print(f"Throttled (429/5xx): {self.stats['throttled']}")
+        print(f"Retries:             {self.stats['retries']}")
+        print(f"Concurrency limit:   {self.aimd.limit:.1f} (peak in-flight {self.aimd.peak_in_flight})")
+
+
+class AsyncAIMDController(AIMDController):
+    """AIMDController whose slots are awaited instead of blocking a thread."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_cond = asyncio.Condition()
+
+    async def acquire_async(self):
+        async with self.async_cond:
+            await self.async_cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def release_async(self):
+        async with self.async_cond:
+            self.in_flight -= 1
+            self.async_cond.notify_all()
+
+    async def on_success_async(self):
+        """on_success() for awaiting callers: a raised limit wakes acquire_async(), not threads."""
+        async with self.async_cond:
+            self._increase()
+            self.async_cond.notify_all()
+
+
+class AsyncGovernor(Governor):
+    """Governor for asyncio code: `await GOVERNOR.call(model, coro_fn, ...)`."""
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, *args, **kwargs):
+        super().__init__(max_concurrency, *args, **kwargs)
+        old = self.aimd
+        self.aimd = AsyncAIMDController(old.limit, old.min_limit, old.max_limit)
+
+    async def call(self, model_name, fn, *args, est_tokens=0, **kwargs):
+        """Same contract as Governor.call(), but fn must be a coroutine function."""
+        rpm_bucket, tpm_bucket = self.buckets_for(model_name)
+        self._bump("calls")
+
+        for attempt in range(1, self.max_retries + 1):
+            await self.aimd.acquire_async()
+            try:
+                await rpm_bucket.acquire_async(1)
+                await tpm_bucket.acquire_async(est_tokens)
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(e, attempt, model_name)
+            else:
+                await self.aimd.on_success_async()
+                self._on_success(result, tpm_bucket, est_tokens)
+                return result
+            finally:
+                await self.aimd.release_async()
+            await asyncio.sleep(delay)
+
+
+_governor = None
+_async_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Returns the process-wide Governor, creating it on first use."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = Governor()
+        return _governor
+
+
+def get_async_governor(max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Returns the process-wide AsyncGovernor, creating it on first use.
+    max_concurrency only applies to the first call.
+    """
+    global _async_governor
+    with _governor_lock:
+        if _async_governor is None:
+            # The caller picked the limit explicitly, so start there and only back off on 429/5xx
+            _async_governor = AsyncGovernor(max_concurrency, initial_concurrency=max_concurrency)
+        return _async_governor
@@ -0,0 +1,503 @@
+"""
+Record / replay of model traffic for the mpcffull scripts.
+
+Record mode wraps the shared genai.Client (and the REST session of
+3-product_descriptions.py) and appends every successful request's response -
+streamed chunks with their arrival times, file uploads and context caches -
+to a JSON Lines fixture archive. Replay mode swaps in a local fake client that
+serves those responses without any network, with the original chunk timings
+or scaled ones, so the orchestration (parsing, DataFrame updates,
+checkpointing) can be profiled and regression-tested offline:
+
+    GENAI_RECORD=~/fixtures/ecozeai.jsonl python 4-ecozeai_calculations.py
+    GENAI_REPLAY=~/fixtures/ecozeai.jsonl GENAI_REPLAY_SPEED=0 python 4-ecozeai_calculations.py
+
+genai_pool.get_client() / get_session() apply the mode, so every script
+supports it unchanged (start_recording() / start_replay() do the same from
+code, before the first get_client()). The Gemini Batch API (client.batches,
+files.download) is neither recorded nor faked, so batch mode is refused with
+the gemini backend while recording or replaying; --backend local sends its
+requests through the REST session, which is.
+
+Requests are matched on a hash of (model, contents, config), as in
+response_cache.py. Identical requests are served their recordings in turn,
+cycling when they run out. With match="loose" (GENAI_REPLAY_MATCH=loose) a
+request without an exact recording gets one with the same model, system
+instruction and number of contents, so a fixture recorded on a few products
+can drive a sheet of thousands. Failed calls are not recorded; a request with
+no recording raises ReplayMiss.
+
+Speed: 1 replays the recorded latencies, 10 ten times faster, 0 without waiting.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+
+from google.genai import types
+
+from response_cache import cache_key
+
+# --- CONFIGURATION ---
+MATCH_MODES = ["exact", "loose"]
+REST_MODEL_PATTERN = re.compile(r"/models/([^/:?]+):")
+
+
+class ReplayMiss(LookupError):
+    """A replayed request has no recording in the fixture archive."""
+
+
+def _config_value(config, name, rest_name=None):
+    if isinstance(config, dict):
+        return config.get(name, config.get(rest_name or name))
+    return getattr(config, name, None)
+
+
+def request_keys(model, contents, config):
+    """(exact, loose) keys of a generateContent request."""
+    contents = contents if isinstance(contents, list) else [contents]
+    system = _config_value(config, "system_instruction", "systemInstruction")
+    return (
+        cache_key(model, contents, config),
+        cache_key(model, [len(contents)], {"system_instruction": system}),
+    )
+
+
+def _file_key(path):
+    path = os.fspath(path)
+    return f"{os.path.basename(path)}:{os.path.getsize(path)}"
+
+
+def _dump(value):
+    return value.model_dump(mode="json", exclude_none=True) if hasattr(value, "model_dump") else value
+
+
+class FixtureArchive:
+    """Append-only JSON Lines file of recorded calls; one entry per call."""
+
+    def __init__(self, path, mode="replay", speed=1.0, match="exact"):
+        if match not in MATCH_MODES:
+            raise ValueError(f"Unknown replay match '{match}' (expected one of {MATCH_MODES})")
+        self.path = os.path.expanduser(path)
+        self.mode = mode
+        self.speed = speed
+        self.match = match
+        self.stats = {"recorded": 0, "exact": 0, "loose": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._exact = {}    # (kind, key) -> [entry]
+        self._loose = {}
+        self._next = {}     # (kind, key) -> index of the next entry to serve
+        if mode == "record":
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # A run stopped mid-write leaves a partial last line
+                self._exact.setdefault((entry["kind"], entry["key"]), []).append(entry)
+                if entry.get("loose"):
+                    self._loose.setdefault((entry["kind"], entry["loose"]), []).append(entry)
+
+    def models(self):
+        """Models that have recordings."""
+        return {entry["model"] for entries in self._exact.values() for entry in entries if entry.get("model")}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._exact.values())
+
+    def close(self):
+        if self.mode == "record":
+            self._file.close()
+
+    # --- Recording ---
+
+    def add(self, kind, key, loose=None, model=None, chunks=(), latency=None, **extra):
+        """chunks: [(seconds since the call started, JSON data)]."""
+        entry = {"kind": kind, "key": key, "loose": loose, "model": model,
+                 "latency": latency if latency is not None else (chunks[-1][0] if chunks else 0.0),
+                 "chunks": [[round(t, 4), data] for t, data in chunks], **extra}
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.stats["recorded"] += 1
+
+    # --- Replaying ---
+
+    def take(self, kind, key, loose=None):
+        """The next recorded entry for a request, or ReplayMiss."""
+        with self._lock:
+            for table, match_key, stat in ((self._exact, key, "exact"), (self._loose, loose, "loose")):
+                if stat == "loose" and (self.match != "loose" or loose is None):
+                    break
+                entries = table.get((kind, match_key))
+                if entries:
+                    index = self._next.get((stat, kind, match_key), 0)
+                    self._next[(stat, kind, match_key)] = index + 1
+                    self.stats[stat] += 1
+                    return entries[index % len(entries)]
+            self.stats["misses"] += 1
+        raise ReplayMiss(f"No recorded {kind} response for request {key[:12]} in {self.path}")
+
+    def delay(self, seconds):
+        return seconds / self.speed if self.speed else 0.0
+
+    def print_stats(self):
+        print(f"\n--- Fixture Archive ({self.mode}) ---")
+        print(f"File:                {self.path}")
+        if self.mode == "record":
+            print(f"Calls recorded:      {self.stats['recorded']}")
+        else:
+            print(f"Served exact/loose:  {self.stats['exact']} / {self.stats['loose']} "
+                  f"(speed {self.speed:g}x{', no waits' if not self.speed else ''})")
+            print(f"Misses:              {self.stats['misses']}")
+
+
+# --- Recording wrappers ---
+
+class _RecordingModels:
+    def __init__(self, models, archive):
+        self._models = models
+        self._archive = archive
+
+    def generate_content(self, *, model, contents, config=None, **kwargs):
+        started = time.perf_counter()
+        response = self._models.generate_content(model=model, contents=contents, config=config, **kwargs)
+        key, loose = request_keys(model, contents, config)
+        self._archive.add("generate", key, loose, model, [(time.perf_counter() - started, _dump(response))])
+        return response
+
+    def generate_content_stream(self, *, model, contents, config=None, **kwargs):
+        started = time.perf_counter()
+        stream = self._models.generate_content_stream(model=model, contents=contents, config=config, **kwargs)
+        key, loose = request_keys(model, contents, config)
+        chunks = []
+        try:
+            for chunk in stream:
+                chunks.append((time.perf_counter() - started, _dump(chunk)))
+                yield chunk
+        finally:
+            stream.close()
+            # Also when the caller stops early: a replay of the same request stops at the same point
+            if chunks:
+                self._archive.add("stream", key, loose, model, chunks)
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _RecordingAsyncModels:
+    def __init__(self, models, archive):
+        self._models = models
+        self._archive = archive
+
+    async def generate_content(self, *, model, contents, config=None, **kwargs):
+        started = time.perf_counter()
+        response = await self._models.generate_content(model=model, contents=contents, config=config, **kwargs)
+        key, loose = request_keys(model, contents, config)
+        self._archive.add("generate", key, loose, model, [(time.perf_counter() - started, _dump(response))])
+        return response
+
+    async def generate_content_stream(self, *, model, contents, config=None, **kwargs):
+        started = time.perf_counter()
+        stream = await self._models.generate_content_stream(model=model, contents=contents, config=config, **kwargs)
+        key, loose = request_keys(model, contents, config)
+
+        async def _chunks():
+            chunks = []
+            try:
+                async for chunk in stream:
+                    chunks.append((time.perf_counter() - started, _dump(chunk)))
+                    yield chunk
+            finally:
+                await stream.aclose()
+                if chunks:
+                    self._archive.add("stream", key, loose, model, chunks)
+        return _chunks()
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _RecordingFiles:
+    def __init__(self, files, archive):
+        self._files = files
+        self._archive = archive
+
+    def upload(self, *, file, **kwargs):
+        started = time.perf_counter()
+        uploaded = self._files.upload(file=file, **kwargs)
+        self._archive.add("upload", _file_key(file), chunks=[(time.perf_counter() - started, _dump(uploaded))])
+        return uploaded
+
+    def __getattr__(self, name):
+        return getattr(self._files, name)
+
+
+class _RecordingCaches:
+    def __init__(self, caches, archive):
+        self._caches = caches
+        self._archive = archive
+
+    def create(self, *, model, config=None, **kwargs):
+        started = time.perf_counter()
+        cached = self._caches.create(model=model, config=config, **kwargs)
+        key = cache_key(model, _config_value(config, "contents") or [], config)
+        self._archive.add("cache", key, model=model, chunks=[(time.perf_counter() - started, _dump(cached))])
+        return cached
+
+    def __getattr__(self, name):
+        return getattr(self._caches, name)
+
+
+class _RecordingAio:
+    def __init__(self, aio, archive):
+        self._aio = aio
+        self.models = _RecordingAsyncModels(aio.models, archive)
+
+    def __getattr__(self, name):
+        return getattr(self._aio, name)
+
+
+class RecordingClient:
+    """A genai.Client whose successful calls are also written to the archive."""
+
+    def __init__(self, client, archive):
+        self._client = client
+        self.models = _RecordingModels(client.models, archive)
+        self.aio = _RecordingAio(client.aio, archive)
+        self.files = _RecordingFiles(client.files, archive)
+        self.caches = _RecordingCaches(client.caches, archive)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class RecordingSession:
+    """A requests.Session whose 200 generateContent responses are also written to the archive."""
+
+    def __init__(self, session, archive):
+        self._session = session
+        self._archive = archive
+
+    def post(self, url, json=None, **kwargs):
+        started = time.perf_counter()
+        response = self._session.post(url, json=json, **kwargs)
+        match = REST_MODEL_PATTERN.search(url)
+        if response.status_code == 200 and match and json is not None:
+            key, loose = rest_keys(match.group(1), json)
+            self._archive.add("rest", key, loose, match.group(1), [(time.perf_counter() - started, response.json())])
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+def rest_keys(model, payload):
+    """(exact, loose) keys of a REST generateContent body."""
+    contents = payload.get("contents") or []
+    return (
+        cache_key(model, contents, {k: v for k, v in payload.items() if k != "contents"}),
+        cache_key(model, [len(contents)], {"system_instruction": payload.get("systemInstruction")}),
+    )
+
+
+# --- Replay fakes ---
+
+def _responses(entry):
+    """The entry's chunks as (offset, GenerateContentResponse), parsed once and reused (callers only read them)."""
+    parsed = entry.get("_parsed")
+    if parsed is None:
+        parsed = entry["_parsed"] = [
+            (offset, types.GenerateContentResponse.model_validate(data)) for offset, data in entry["chunks"]
+        ]
+    return parsed
+
+
+class _ReplayModels:
+    def __init__(self, archive):
+        self._archive = archive
+
+    def generate_content(self, *, model, contents, config=None, **kwargs):
+        entry = self._archive.take("generate", *request_keys(model, contents, config))
+        time.sleep(self._archive.delay(entry["latency"]))
+        return _responses(entry)[-1][1]
+
+    def generate_content_stream(self, *, model, contents, config=None, **kwargs):
+        entry = self._archive.take("stream", *request_keys(model, contents, config))
+        started = time.perf_counter()
+        for offset, chunk in _responses(entry):
+            wait = self._archive.delay(offset) - (time.perf_counter() - started)
+            if wait > 0:
+                time.sleep(wait)
+            yield chunk
+
+
+class _ReplayAsyncModels:
+    def __init__(self, archive):
+        self._archive = archive
+
+    async def generate_content(self, *, model, contents, config=None, **kwargs):
+        entry = self._archive.take("generate", *request_keys(model, contents, config))
+        await asyncio.sleep(self._archive.delay(entry["latency"]))
+        return _responses(entry)[-1][1]
+
+    async def generate_content_stream(self, *, model, contents, config=None, **kwargs):
+        entry = self._archive.take("stream", *request_keys(model, contents, config))
+
+        async def _chunks():
+            started = time.perf_counter()
+            for offset, chunk in _responses(entry):
+                wait = self._archive.delay(offset) - (time.perf_counter() - started)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                yield chunk
+        return _chunks()
+
+
+class _ReplayFiles:
+    def __init__(self, archive):
+        self._archive = archive
+
+    def upload(self, *, file, **kwargs):
+        entry = self._archive.take("upload", _file_key(file))
+        time.sleep(self._archive.delay(entry["latency"]))
+        # Recorded uploads may still have been processing; replayed ones are ready
+        return types.File.model_validate({**entry["chunks"][-1][1], "state": "ACTIVE"})
+
+    def get(self, *, name, **kwargs):
+        return types.File(name=name, state="ACTIVE")
+
+    def delete(self, *, name, **kwargs):
+        return None
+
+
+class _ReplayCaches:
+    def __init__(self, archive):
+        self._archive = archive
+
+    def create(self, *, model, config=None, **kwargs):
+        key = cache_key(model, _config_value(config, "contents") or [], config)
+        return types.CachedContent.model_validate(self._archive.take("cache", key)["chunks"][-1][1])
+
+    def update(self, *, name, **kwargs):
+        return types.CachedContent(name=name)
+
+    def delete(self, *, name, **kwargs):
+        return None
+
+
+class _ReplayAio:
+    def __init__(self, archive):
+        self.models = _ReplayAsyncModels(archive)
+
+
+class ReplayClient:
+    """Local stand-in for genai.Client that serves recorded responses."""
+
+    def __init__(self, archive):
+        self.models = _ReplayModels(archive)
+        self.aio = _ReplayAio(archive)
+        self.files = _ReplayFiles(archive)
+        self.caches = _ReplayCaches(archive)
+
+
+class ReplayResponse:
+    """The parts of requests.Response that the scripts read."""
+
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = json.dumps(data)
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        pass
+
+
+class ReplaySession:
+    """Local stand-in for the REST session: serves recorded generateContent responses."""
+
+    def __init__(self, archive):
+        self._archive = archive
+
+    def post(self, url, json=None, **kwargs):
+        match = REST_MODEL_PATTERN.search(url)
+        if not match or json is None:
+            raise ReplayMiss(f"Only generateContent calls can be replayed, not {url.split('?')[0]}")
+        entry = self._archive.take("rest", *rest_keys(match.group(1), json))
+        time.sleep(self._archive.delay(entry["latency"]))
+        return ReplayResponse(entry["chunks"][-1][1])
+
+
+# --- Process-wide mode ---
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def start_recording(path):
+    """Records this process's model calls to path (appending)."""
+    global _archive
+    with _archive_lock:
+        _archive = FixtureArchive(path, "record")
+        return _archive
+
+
+def start_replay(path, speed=1.0, match="exact"):
+    """Serves this process's model calls from the archive at path."""
+    global _archive
+    with _archive_lock:
+        _archive = FixtureArchive(path, "replay", speed, match)
+        return _archive
+
+
+def get_archive():
+    """The active archive (set up from GENAI_RECORD / GENAI_REPLAY on first use), or None."""
+    global _archive
+    if _archive is None and (os.getenv("GENAI_REPLAY") or os.getenv("GENAI_RECORD")):
+        # Worker threads may all reach their first get_client() at once
+        with _archive_lock:
+            if _archive is None:
+                if os.getenv("GENAI_REPLAY"):
+                    _archive = FixtureArchive(os.environ["GENAI_REPLAY"], "replay",
+                                              float(os.getenv("GENAI_REPLAY_SPEED", "1")),
+                                              os.getenv("GENAI_REPLAY_MATCH", "exact").lower())
+                else:
+                    _archive = FixtureArchive(os.environ["GENAI_RECORD"], "record")
+    return _archive
+
+
+def wrap_client(client):
+    """client as recorded, replaced by a ReplayClient, or unchanged."""
+    archive = get_archive()
+    if archive is None:
+        return client
+    return RecordingClient(client, archive) if archive.mode == "record" else ReplayClient(archive)
+
+
+def wrap_session(session):
+    """wrap_client() for the REST session."""
+    archive = get_archive()
+    if archive is None:
+        return session
+    return RecordingSession(session, archive) if archive.mode == "record" else ReplaySession(archive)
+
+
+def print_archive_stats():
+    """Prints what was recorded or replayed this run, if either was on."""
+    if _archive is not None:
+        _archive.print_stats()
@@ -0,0 +1,188 @@
+"""
+Opt-in, content-addressed cache of model responses for the mpcffull scripts.
+
+A response is keyed by a SHA-256 of (model, contents, generation config) -
+the config carries the system instruction, tools and thinking level - so a
+rerun over the same spreadsheet only pays for prompts that actually changed.
+Entries live in a local SQLite file with a TTL and size-based LRU eviction.
+
+Enable with GENAI_CACHE=1 (or enable_cache() / the --cache flag), then:
+
+    key, cached = lookup(model, contents, config)
+    if cached is not None:
+        return cached
+    text = ...call the model...
+    store(key, model, text)
+
+Note the analyst/auditor calls run at temperature 1, so a cache hit replays
+one sample rather than drawing a new one. That is the point for reruns and
+debugging, but leave the cache off when you want fresh answers.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- CONFIGURATION ---
+CACHE_PATH = os.getenv("GENAI_CACHE_PATH", os.path.expanduser("~/.cache/ecozeai/genai_responses.sqlite"))
+CACHE_MAX_BYTES = 512 * 1024 * 1024   # Evict least recently used entries above this
+CACHE_TTL_SECONDS = 7 * 24 * 3600     # Entries older than this are treated as misses
+
+
+def _canonical(value):
+    """Turns Contents/Parts/configs (pydantic models), dicts and lists into plain JSON data."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, bytes):
+        return hashlib.sha256(value).hexdigest()
+    return value
+
+
+def cache_key(model, contents, config=None):
+    """SHA-256 over the canonical JSON of (model, contents, config)."""
+    payload = json.dumps(
+        {"model": model, "contents": _canonical(contents), "config": _canonical(config)},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe SQLite store with TTL and LRU eviction by total response size."""
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "stores": 0}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns the cached text for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            response, created = row
+            if now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return response
+
+    def put(self, key, model, response):
+        """Stores a response and evicts least recently used entries if over max_bytes."""
+        if not response:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self.stats["stores"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def print_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        print("\n--- Response Cache Stats ---")
+        print(f"Cache file:          {self.path}")
+        print(f"Hits / misses:       {self.stats['hits']} / {self.stats['misses']} ({hit_rate:.1%} hit rate)")
+        print(f"Expired / evicted:   {self.stats['expired']} / {self.stats['evictions']}")
+        print(f"Stored:              {self.stats['stores']}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def enable_cache(path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+    """Turns the cache on for this process and returns it."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(path, max_bytes, ttl_seconds)
+        return _cache
+
+
+def get_cache():
+    """Returns the process cache, or None if caching is off (set GENAI_CACHE=1 to turn it on)."""
+    if _cache is None and os.getenv("GENAI_CACHE", "").lower() in ("1", "true", "yes"):
+        return enable_cache()
+    return _cache
+
+
+def lookup(model, contents, config=None):
+    """
+    Returns (key, cached_text). key is None when caching is off;
+    cached_text is None on a miss.
+    """
+    cache = get_cache()
+    if cache is None:
+        return None, None
+    key = cache_key(model, contents, config)
+    return key, cache.get(key)
+
+
+def store(key, model, response):
+    """Saves a response under a key from lookup(). No-op when caching is off."""
+    cache = get_cache()
+    if cache is not None and key is not None:
+        cache.put(key, model, response)
+
+
+def print_cache_stats():
+    """Prints hit/miss counters if the cache was used this run."""
+    if _cache is not None:
+        _cache.print_stats()
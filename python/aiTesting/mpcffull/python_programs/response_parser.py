@@ -0,0 +1,208 @@
+"""
+Shared parser for the structured text formats the mpcffull prompts ask for.
+
+Two line-oriented formats are in use:
+
+    *sb_cf: 1.23                          <- "star" fields (scripts 2 and 4)
+    *sb_methodology_used: free text that
+    may run over several lines
+
+    /product_name_1 (String) = Acme X     <- "slash" fields (script 1)
+    /total_cf_kg (Double) = 10.5
+
+Instead of one regex search (often DOTALL) per field over the whole response,
+tokenize() finds every field marker with a single precompiled pattern in one
+pass. A star field's value runs from its marker to the next marker (or the
+end of the text), so multi-line values need no look-ahead; numeric star
+fields and slash fields are the rest of their line.
+
+Free text often contains bullets of the same shape ("* source: https://..."),
+so callers pass the star keys they expect; other `* word:` lines are then
+part of the preceding value rather than fields of their own.
+
+Usage:
+    result = parse(text, numeric={"sb_cf", "ab_cf"}, keys=EF_KEYS)
+    result.get("sb_cf")             # 1.23 (float) or None
+    result.errors                   # [ParseError(key, raw, message), ...]
+
+    records, errors = parse_records(text)   # slash fields grouped per product
+"""
+import re
+from typing import NamedTuple, Optional
+
+# One alternation for both formats, anchored at line starts (the text is
+# prefixed with a newline, and a literal "\n" prefix lets the regex engine skip
+# straight between lines instead of testing ^ at every offset). Star keys are
+# lower-case identifiers so bullet points in free text ("* Note: ...") are not
+# mistaken for fields; "**key:**" markdown bold is tolerated.
+_MARKER = re.compile(
+    r"\n[ \t]*(?:"
+    r"\*{1,2}[ \t]*(?P<star>[a-z_][a-z0-9_]*)[ \t]*\**[ \t]*[:=]\**"
+    r"|"
+    r"/(?P<slash>[A-Za-z_]\w*?)(?:_(?P<n>\d+))?[ \t]*(?:\((?P<type>[^)\n]*)\))?[ \t]*="
+    r")[ \t]*"
+)
+_NUMBER = re.compile(r"[-+]?(?:\d[\d,]*(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?")
+# A number leading a value, after optional markup ("**2.5**", "~2.5", "≈ 2.5") but no words
+_LEADING_NUMBER = re.compile(r"[^\w.+\-\n]*(" + _NUMBER.pattern + ")")
+
+_FLOAT_TYPES = {"double", "float", "number"}
+_INT_TYPES = {"int", "integer", "long"}
+
+
+class Field(NamedTuple):
+    """One `*key:` or `/key (Type) =` field. value is typed; raw is the text as written."""
+    key: str
+    value: object
+    raw: str
+    style: str = "star"          # "star" or "slash"
+    type: Optional[str] = None   # declared type of a slash field, e.g. "Double"
+    index: Optional[int] = None  # N of a /key_N slash field
+    start: int = 0               # offset of the marker in the text
+
+
+class ParseError(NamedTuple):
+    key: str
+    raw: str
+    message: str
+
+
+def parse_number(raw, leading=False):
+    """
+    First number in raw ("1,234.5 kgCO2e" -> 1234.5), or None. With
+    leading=True the number must start the value ("unknown, ~2.5" -> None).
+    """
+    if leading:
+        match = _LEADING_NUMBER.match(raw or "")
+    else:
+        match = _NUMBER.search(raw or "")
+    if not match:
+        return None
+    try:
+        return float(match.group(match.lastindex or 0).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _strip_quotes(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].strip()
+    return value
+
+
+def _is_field(match, keys):
+    return keys is None or not match.group("star") or match.group("star") in keys
+
+
+def tokenize(text, keys=None):
+    """
+    Yields (key, raw_value, style, type, index, start) for every field, in one
+    pass over text. With keys given, only those star keys start a field.
+    """
+    if not text:
+        return
+    text = "\n" + text.replace("\u00A0", " ")
+    matches = [match for match in _MARKER.finditer(text) if _is_field(match, keys)]
+    for match, following in zip(matches, matches[1:] + [None]):
+        raw = text[match.end():following.start() if following else len(text)]
+        if match.group("star"):
+            yield match.group("star"), raw.strip(), "star", None, None, match.start()
+        else:
+            # Slash values are one line; anything after it is free text
+            n = match.group("n")
+            raw = raw.split("\n", 1)[0].strip()
+            yield match.group("slash"), raw, "slash", match.group("type"), int(n) if n else None, match.start()
+
+
+class ParseResult:
+    """Fields in the order they appear, plus the values that failed to convert."""
+
+    def __init__(self, fields, errors):
+        self.fields = fields
+        self.errors = errors
+        self._first = {}
+        for field in fields:
+            self._first.setdefault(field.key, field)
+
+    def get(self, key, default=None):
+        """Value of the first field called key."""
+        field = self._first.get(key)
+        return field.value if field is not None else default
+
+    def __contains__(self, key):
+        return key in self._first
+
+    def as_dict(self):
+        """{key: value} using the first occurrence of each key."""
+        return {key: field.value for key, field in self._first.items()}
+
+
+def convert(key, raw, type_name=None, numeric=()):
+    """
+    Typed value of one field: numbers for Double/Int slash fields and for star
+    keys in `numeric`, else the text without surrounding quotes. A number is
+    read from the start of the field's first line only.
+    Returns (value, ParseError or None).
+    """
+    kind = (type_name or "").strip().lower()
+    if key in numeric or kind in _FLOAT_TYPES or kind in _INT_TYPES:
+        value = _strip_quotes(raw.split("\n", 1)[0].strip())
+        number = parse_number(value, leading=True)
+        if number is None and value:
+            return None, ParseError(key, raw, "not a number")
+        if number is not None and kind in _INT_TYPES:
+            number = int(number)
+        return number, None
+    return _strip_quotes(raw), None
+
+
+def match_marker(line, keys=None):
+    """
+    Field marker at the start of one line, for callers that see text line by
+    line (e.g. while streaming). Returns (key, style, type, index, rest_of_line)
+    or None.
+    """
+    match = _MARKER.match("\n" + line)
+    if not match or not _is_field(match, keys):
+        return None
+    rest = line[match.end() - 1:]
+    if match.group("star"):
+        return match.group("star"), "star", None, None, rest
+    n = match.group("n")
+    return match.group("slash"), "slash", match.group("type"), int(n) if n else None, rest
+
+
+def parse(text, numeric=(), keys=None):
+    """
+    Parses every field in text. Slash fields are converted by their declared
+    type (Double/Int); star fields named in `numeric` are converted to float.
+    With keys given, only those star keys are fields (see the module docstring).
+    Values that fail to convert become None and are reported in .errors.
+    """
+    fields, errors = [], []
+    for key, raw, style, type_name, index, start in tokenize(text, keys):
+        value, error = convert(key, raw, type_name, numeric)
+        if error:
+            errors.append(error)
+        fields.append(Field(key, value, raw, style, type_name, index, start))
+    return ParseResult(fields, errors)
+
+
+def parse_records(text, start_key="product_name"):
+    """
+    Groups slash fields into records, starting a new record at every
+    start_key field. Returns (list of {key: value}, errors).
+    """
+    result = parse(text)
+    records, current = [], {}
+    for field in result.fields:
+        if field.style != "slash":
+            continue
+        if field.key == start_key and current:
+            records.append(current)
+            current = {}
+        current[field.key] = field.value
+    if current:
+        records.append(current)
+    return records, result.errors
+
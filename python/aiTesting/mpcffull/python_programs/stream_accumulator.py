@@ -0,0 +1,165 @@
+"""
+Incremental accumulation of streamed model responses.
+
+`response_text += chunk.text` copies the whole response on every chunk, which
+is quadratic for long (65k token) outputs, and nothing looks at the answer
+until the stream has ended. StreamAccumulator keeps the chunks in a list,
+scans only the newly completed lines of each chunk for `*key:` / `/key =`
+fields (see response_parser.py), and records timings as it goes:
+
+    acc = StreamAccumulator(required={"rating"})
+    for chunk in stream:
+        if acc.feed(chunk.text) and stop_when(acc.fields):
+            break                      # e.g. stop once the verdict is known
+    text = acc.finish()
+
+A star field is complete once the next field marker (or the end of the
+stream) arrives; numeric fields and slash fields are complete at the end of
+their line.
+
+Per-model time-to-first-token and time-to-field figures are collected with
+record() and printed by print_stream_stats().
+"""
+import threading
+import time
+
+from response_parser import convert, match_marker
+
+# Fields whose time-to-field is worth reporting
+TRACKED_FIELDS = ("cf_value", "rating")
+
+
+class StreamAccumulator:
+    """Collects one streamed response and extracts its fields as lines complete."""
+
+    def __init__(self, required=(), numeric=(), keys=None, started=None):
+        self.required = set(required)
+        self.numeric = set(numeric)
+        self.keys = set(keys) if keys is not None else None
+        self.started = started if started is not None else time.perf_counter()
+        self.chunks = []
+        self.fields = {}            # completed fields: key -> typed value (first occurrence wins)
+        self.field_times = {}       # key -> seconds from start until the field was complete
+        self.first_token = None     # seconds from start until the first non-empty chunk
+        self.elapsed = None
+        self.stopped_early = False
+        self.usage = None           # usage_metadata of the stream (sent with the last chunks)
+        self.search_queries = 0     # web searches the model ran (grounding metadata)
+        self._partial = ""          # current unterminated line
+        self._open = None           # (key, type, value lines) of the field being read
+
+    @property
+    def complete(self):
+        """True once every required field has been seen in full."""
+        return self.required.issubset(self.fields)
+
+    def observe(self, chunk):
+        """Keeps the non-text parts of a chunk that telemetry needs (usage, grounding)."""
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage is not None:
+            self.usage = usage
+        for candidate in getattr(chunk, "candidates", None) or []:
+            grounding = getattr(candidate, "grounding_metadata", None)
+            queries = getattr(grounding, "web_search_queries", None)
+            if queries:
+                self.search_queries = max(self.search_queries, len(queries))
+
+    def feed(self, text):
+        """Adds one chunk. Returns True if a field was completed by it."""
+        if not text:
+            return False
+        now = time.perf_counter() - self.started
+        if self.first_token is None:
+            self.first_token = now
+        self.chunks.append(text)
+
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        before = len(self.fields)
+        for line in lines:
+            self._line(line, now)
+        return len(self.fields) > before
+
+    def _line(self, line, now):
+        marker = match_marker(line, self.keys)
+        if marker is None:
+            if self._open is not None:
+                self._open[2].append(line)
+            return
+
+        self._close(now)
+        key, style, type_name, _, rest = marker
+        if style == "slash" or key in self.numeric:
+            # One-line values are complete as soon as their line ends
+            self._complete(key, rest, type_name, now)
+        else:
+            self._open = (key, type_name, [rest])
+
+    def _close(self, now):
+        if self._open is not None:
+            key, type_name, lines = self._open
+            self._complete(key, "\n".join(lines).strip(), type_name, now)
+            self._open = None
+
+    def _complete(self, key, raw, type_name, now):
+        if key in self.fields:
+            return
+        value, _ = convert(key, raw.strip(), type_name, self.numeric)
+        self.fields[key] = value
+        self.field_times[key] = now
+
+    def finish(self, stopped_early=False):
+        """Ends the stream (closing any open field) and returns the full text."""
+        now = time.perf_counter() - self.started
+        if self._partial:
+            self._line(self._partial, now)
+            self._partial = ""
+        self._close(now)
+        self.elapsed = now
+        self.stopped_early = stopped_early
+        return "".join(self.chunks)
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+
+# --- Run-wide metrics ---
+
+_lock = threading.Lock()
+_samples = {}   # model -> list of (first_token, elapsed, {field: seconds}, stopped_early)
+
+
+def record(model, acc):
+    """Adds one finished stream's timings to the run-wide stats."""
+    with _lock:
+        _samples.setdefault(model, []).append((acc.first_token, acc.elapsed, dict(acc.field_times), acc.stopped_early))
+
+
+def _pct(values, q):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _fmt(value):
+    return f"{value:6.2f}s" if value is not None else "     - "
+
+
+def print_stream_stats():
+    """Prints p50/p90 time-to-first-token, time-to-field and stream time per model."""
+    with _lock:
+        samples = {model: list(rows) for model, rows in _samples.items()}
+    if not samples:
+        return
+    print("\n--- Streaming Stats (p50 / p90) ---")
+    for model, rows in samples.items():
+        early = sum(1 for row in rows if row[3])
+        print(f"{model} ({len(rows)} streams, {early} stopped early)")
+        print(f"  time to first token: {_fmt(_pct([r[0] for r in rows], 0.5))} / {_fmt(_pct([r[0] for r in rows], 0.9))}")
+        for field in TRACKED_FIELDS:
+            times = [r[2].get(field) for r in rows]
+            if any(t is not None for t in times):
+                print(f"  time to {field + ':':<12} {_fmt(_pct(times, 0.5))} / {_fmt(_pct(times, 0.9))}")
+        print(f"  full stream:         {_fmt(_pct([r[1] for r in rows], 0.5))} / {_fmt(_pct([r[1] for r in rows], 0.9))}")
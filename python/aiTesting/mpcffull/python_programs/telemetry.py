@@ -0,0 +1,263 @@
+"""
+Per-call token, latency and cost telemetry for the mpcffull scripts.
+
+Every model call is wrapped in a CallRecord that captures input, output,
+thinking and tool-use tokens, the part of the input served from a context
+cache (explicit or implicit), search queries, latency (including time spent
+queued or retrying in the governor), time to first token, retries and the
+computed cost. Pricing is ported from getModelPricing / calculateCost in
+ecozeAI-functions-v2/src/services/ai/costs.js - keep the two in sync.
+
+Usage:
+    call = track(MODEL_NAME, "analyst")
+    try:
+        response = GOVERNOR.call(MODEL_NAME, call.wrap(fn), ...)
+        call.finish(usage=response.usage_metadata)
+    except Exception:
+        call.finish(ok=False)
+        raise
+    ...
+    print_telemetry_summary()      # per-step p50/p90/p99 + cost, flushes the log
+
+Records are buffered and written as Parquet part files under TELEMETRY_DIR
+(CSV if no Parquet engine such as pyarrow is installed), one set per run.
+The current product can be attached to every record with set_product().
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+# --- CONFIGURATION ---
+TELEMETRY_DIR = os.getenv("GENAI_TELEMETRY_DIR", os.path.expanduser("~/.cache/ecozeai/telemetry"))
+FLUSH_EVERY = 500    # Records per part file
+
+_product = contextvars.ContextVar("telemetry_product", default=None)
+
+
+def get_model_pricing(model="", input_tokens=0):
+    """(input_rate, output_rate, tool_rate) in USD per token, as in costs.js getModelPricing()."""
+    normalized = model or ""
+
+    if "aiModel" in normalized or "deep-research" in normalized:
+        tier_two = input_tokens > 200000
+        input_rate = (4.00 if tier_two else 2.00) / 1000000
+        output_rate = (18.00 if tier_two else 12.00) / 1000000
+        return input_rate, output_rate, output_rate
+
+    if "aiModel" in normalized:
+        tier_two = input_tokens > 200000
+        input_rate = (2.5 if tier_two else 1.25) / 1000000
+        output_rate = (15 if tier_two else 10) / 1000000
+        return input_rate, output_rate, output_rate
+
+    if "aiModel-lite" in normalized:
+        return 0.1 / 1000000, 0.4 / 1000000, 0.4 / 1000000
+
+    if "aiModel" in normalized:
+        return 0.3 / 1000000, 2.5 / 1000000, 2.5 / 1000000
+
+    if "aiModel" in normalized:
+        # Gemini 3 Flash Preview has flat pricing regardless of input token count
+        return 0.5 / 1000000, 3.0 / 1000000, 3.0 / 1000000
+
+    if "gpt-oss-120b" in normalized:
+        return 0.15 / 1000000, 0.60 / 1000000, 0
+
+    return 0, 0, 0
+
+
+def calculate_cost(model, input_tokens=0, output_tokens=0, tool_calls=0):
+    """USD cost of one call, as in costs.js calculateCost()."""
+    input_rate, output_rate, tool_rate = get_model_pricing(model, input_tokens)
+    return input_tokens * input_rate + output_tokens * output_rate + tool_calls * tool_rate
+
+
+def _count(usage, *names):
+    """First non-empty token count in usage (SDK object, or REST dict with camelCase keys)."""
+    for name in names:
+        if isinstance(usage, dict):
+            camel = name.split("_")[0] + "".join(part.title() for part in name.split("_")[1:])
+            value = usage.get(name, usage.get(camel))
+        else:
+            value = getattr(usage, name, None)
+        if value:
+            return int(value)
+    return 0
+
+
+def search_queries_of(response):
+    """Number of web search queries the model ran (grounding metadata), for SDK objects or REST dicts."""
+    if isinstance(response, dict):
+        candidates = response.get("candidates") or []
+        grounding = (candidates[0].get("groundingMetadata") or {}) if candidates else {}
+        return len(grounding.get("webSearchQueries") or [])
+    candidates = getattr(response, "candidates", None) or []
+    grounding = getattr(candidates[0], "grounding_metadata", None) if candidates else None
+    return len(getattr(grounding, "web_search_queries", None) or [])
+
+
+class CallRecord:
+    """One model call in flight; finish() turns it into a log row."""
+
+    def __init__(self, log, model, step):
+        self.log = log
+        self.model = model
+        self.step = step
+        self.product = _product.get()
+        self.attempts = 0
+        self.started = time.perf_counter()
+
+    def wrap(self, fn):
+        """Wraps the function the governor retries, so attempts can be counted."""
+        def _counted(*args, **kwargs):
+            self.attempts += 1
+            return fn(*args, **kwargs)
+        return _counted
+
+    def wrap_async(self, fn):
+        """wrap() for coroutine functions."""
+        async def _counted(*args, **kwargs):
+            self.attempts += 1
+            return await fn(*args, **kwargs)
+        return _counted
+
+    def finish(self, usage=None, ttft=None, search_queries=0, ok=True, cached=False):
+        """Records the call. usage is a usage_metadata object or a REST usageMetadata dict."""
+        prompt = _count(usage, "prompt_token_count")
+        tool_use = _count(usage, "tool_use_prompt_token_count")
+        output = _count(usage, "candidates_token_count")
+        cached_input = _count(usage, "cached_content_token_count")
+        thinking = _count(usage, "thoughts_token_count")
+        # Same split as logAITransactionI: tool-use prompt tokens bill as input, thoughts as output
+        input_tokens = prompt + tool_use
+        output_tokens = output + thinking
+        self.log.add({
+            "ts": time.time(),
+            "script": self.log.script,
+            "product": self.product,
+            "step": self.step,
+            "model": self.model,
+            "ok": ok,
+            "cached": cached,
+            "input_tokens": prompt,
+            "cached_input_tokens": cached_input,
+            "tool_use_tokens": tool_use,
+            "output_tokens": output,
+            "thinking_tokens": thinking,
+            "total_tokens": _count(usage, "total_token_count") or input_tokens + output_tokens,
+            "search_queries": search_queries,
+            "latency_s": time.perf_counter() - self.started,
+            "ttft_s": ttft,
+            "retries": max(self.attempts - 1, 0),
+            "cost_usd": 0.0 if cached else calculate_cost(self.model, input_tokens, output_tokens, search_queries),
+        })
+
+
+class TelemetryLog:
+    """Thread-safe buffer of call records, flushed to columnar part files."""
+
+    def __init__(self, script, directory=TELEMETRY_DIR, flush_every=FLUSH_EVERY):
+        self.script = script
+        self.directory = directory
+        self.flush_every = flush_every
+        self.run_id = f"{script}-{time.strftime('%Y%m%d-%H%M%S')}"
+        self.rows = []       # everything this run (for the summary)
+        self._pending = []   # not yet written
+        self._parts = 0
+        self._lock = threading.Lock()
+
+    def add(self, row):
+        with self._lock:
+            self.rows.append(row)
+            self._pending.append(row)
+            if len(self._pending) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        df = pd.DataFrame(self._pending)
+        base = os.path.join(self.directory, f"{self.run_id}-part{self._parts:04d}")
+        try:
+            df.to_parquet(base + ".parquet", index=False)
+        except ImportError:
+            df.to_csv(base + ".csv", index=False)
+        self._parts += 1
+        self._pending = []
+
+    def summary(self):
+        """Per-step DataFrame: calls, latency/TTFT percentiles, mean tokens, retries and cost."""
+        with self._lock:
+            df = pd.DataFrame(self.rows)
+        if df.empty:
+            return df
+        # Non-streaming calls have no TTFT; unlabelled calls are grouped as "call"
+        df["ttft_s"] = pd.to_numeric(df["ttft_s"], errors="coerce")
+        df["step"] = df["step"].fillna("call")
+        grouped = df.groupby(["step", "model"])
+        return pd.DataFrame({
+            "calls": grouped.size(),
+            "errors": grouped["ok"].apply(lambda s: int((~s.astype(bool)).sum())),
+            "cached": grouped["cached"].sum(),
+            "p50_s": grouped["latency_s"].quantile(0.5),
+            "p90_s": grouped["latency_s"].quantile(0.9),
+            "p99_s": grouped["latency_s"].quantile(0.99),
+            "ttft_p50_s": grouped["ttft_s"].quantile(0.5),
+            "in_tok": grouped["input_tokens"].mean(),
+            "cached_in_tok": grouped["cached_input_tokens"].mean(),
+            "out_tok": grouped["output_tokens"].mean(),
+            "think_tok": grouped["thinking_tokens"].mean(),
+            "retries": grouped["retries"].sum(),
+            "cost_usd": grouped["cost_usd"].sum(),
+        })
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    """Returns this process's TelemetryLog, named after the running script."""
+    global _log
+    with _log_lock:
+        if _log is None:
+            script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+            _log = TelemetryLog(script)
+        return _log
+
+
+def track(model, step):
+    """Starts a CallRecord for one model call of the given pipeline step."""
+    return CallRecord(get_log(), model, step)
+
+
+def set_product(name):
+    """Tags calls made from the current thread / asyncio task with a product name."""
+    _product.set(name)
+
+
+def print_telemetry_summary():
+    """Flushes the log and prints the per-step percentile and cost summary for this run."""
+    log = get_log()
+    log.flush()
+    summary = log.summary()
+    if summary.empty:
+        return
+    print("\n--- Model Call Telemetry ---")
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.3f}".format):
+        print(summary)
+    print(f"Total cost: ${summary['cost_usd'].sum():.4f} over {int(summary['calls'].sum())} calls")
+    input_tokens = (summary["in_tok"] * summary["calls"]).sum()
+    cached_input = (summary["cached_in_tok"] * summary["calls"]).sum()
+    if cached_input:
+        print(f"Cached input tokens: {cached_input:.0f} of {input_tokens:.0f} ({cached_input / input_tokens:.1%})")
+    print(f"Log: {os.path.join(log.directory, log.run_id)}-part*.")
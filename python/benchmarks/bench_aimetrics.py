@@ -0,0 +1,172 @@
+"""
+aiMetrics aggregation over synthetic Firestore data, served by an in-memory
+fake with just the query surface metrics_data.py uses (projections, count()
+aggregations, collection-group streams). It measures the client-side work -
+Doc conversion, counters, the fan-out thread pool - not Firestore latency.
+"""
+from benchutil import rng
+
+MATERIALS = 5000
+TRANSPORTS_PER_MATERIAL = 4
+TOKENS = 200000
+CF_NAMES = ["cf2", "cf3", "cf5", "apcfSupplierFinder", "apcfMPCF", "apcfSDCF"]
+
+
+class _Value:
+    def __init__(self, value):
+        self.value = value
+
+
+class _Snapshot:
+    exists = True
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeDb:
+    """Documents by path, plus the child paths of every collection."""
+
+    def __init__(self):
+        self.docs = {}
+        self.children = {}      # collection path -> [document path]
+
+    def add(self, path, data):
+        self.docs[path] = data
+        self.children.setdefault(path.rsplit("/", 1)[0], []).append(path)
+        return FakeRef(self, path)
+
+    def collection(self, name):
+        return FakeQuery(self, [name])
+
+    def collection_group(self, name):
+        return FakeQuery(self, [p for p in self.children if p.rsplit("/", 1)[-1] == name])
+
+
+class FakeRef:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionRef(self._db, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name):
+        return FakeQuery(self._db, [f"{self.path}/{name}"])
+
+    def get(self, field_paths=None):
+        return _Snapshot(self, self._db.docs.get(self.path, {}))
+
+
+class FakeCollectionRef:
+    def __init__(self, db, path):
+        self.path = path
+        self.parent = FakeRef(db, path.rsplit("/", 1)[0]) if "/" in path else None
+
+
+class FakeQuery:
+    def __init__(self, db, collections, filters=(), fields=None):
+        self._db = db
+        self._collections = collections
+        self._filters = filters
+        self._fields = fields
+
+    def select(self, fields):
+        return FakeQuery(self._db, self._collections, self._filters, list(fields))
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return FakeQuery(self._db, self._collections, self._filters + ((field, op, value),), self._fields)
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            current = data.get(field)
+            if op == "==" and current != value:
+                return False
+            if op == "!=" and (field not in data or current == value):
+                return False
+        return True
+
+    def stream(self):
+        for collection in self._collections:
+            for path in self._db.children.get(collection, ()):
+                data = self._db.docs[path]
+                if self._matches(data):
+                    if self._fields is not None:
+                        data = {k: data[k] for k in self._fields if k in data}
+                    yield _Snapshot(FakeRef(self._db, path), data)
+
+    def count(self):
+        return self
+
+    def get(self):
+        return [[_Value(sum(1 for _ in self.stream()))]]
+
+
+def _materials_db(r):
+    db = FakeDb()
+    product = db.add("products_new/p0", {"name": "Product 0"})
+    for i in range(MATERIALS):
+        material = db.add(f"materials/m{i:05d}", {
+            "name": f"Material {i}",
+            "linked_product": product.path,
+            "supplier_name": r.choice(["Acme", "Unknown", "", "Globex"]),
+            "supplier_address": r.choice(["1 High St", "unknown", None]),
+            "estimated_cf": r.choice([None, r.uniform(0.1, 50)]),
+            "bom": "x" * 2000,
+        })
+        for j in range(TRANSPORTS_PER_MATERIAL):
+            db.add(f"{material.path}/materials_transport/t{j}", {
+                "emissions_kgco2e": r.choice([None, r.uniform(0.01, 5)]),
+            })
+    return db, product
+
+
+class ProductStats:
+    """pcf-stats.py: projected material Docs, transport counts and the per-product counters."""
+
+    def setup(self):
+        import metrics_data
+
+        self.md = metrics_data
+        self.db, self.product = _materials_db(rng(4))
+        self.fields = ["name", "supplier_name", "supplier_address", "estimated_cf"]
+        self.materials = list(metrics_data.stream_docs(self.db.collection("materials"), self.fields))
+        self.counts = metrics_data.transport_counts_fanout(self.materials)
+
+    def time_doc_conversion(self):
+        list(self.md.stream_docs(self.db.collection("materials"), self.fields))
+
+    def time_product_stats(self):
+        self.md.product_stats(self.materials, self.counts)
+
+    def time_transport_counts_fanout(self):
+        self.md.transport_counts_fanout(self.materials)
+
+
+class CostAggregation:
+    """eai_cost_analysis.py: the per-cfName count/sum over streamed token records."""
+
+    def setup(self):
+        from firestore_fetch import CostAggregator
+
+        r = rng(5)
+        self.aggregator_class = CostAggregator
+        self.tokens = [
+            (r.choice(CF_NAMES + [None]), r.choice([round(r.uniform(0.0001, 0.5), 6), None, "0.01"]))
+            for _ in range(TOKENS)
+        ]
+
+    def time_cost_aggregator(self):
+        aggregator = self.aggregator_class()
+        for cf_name, cost in self.tokens:
+            aggregator.add(cf_name, cost)
+        aggregator.averages()
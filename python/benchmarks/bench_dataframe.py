@@ -0,0 +1,86 @@
+"""
+Result bookkeeping in 4-ecozeai_calculations.py: DataFrame row updates under
+concurrent completion, and the checkpoint journal / final Excel write.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from benchutil import load_script, prose, rng
+
+ROWS = 2000
+EXCEL_ROWS = 300
+HISTORY_KB = 8
+WORKERS = 32
+
+
+class _NullJournal:
+    def append(self, idx, fields):
+        pass
+
+
+def _sheet(rows):
+    return pd.DataFrame({
+        "product_name": [f"Product {i}" for i in range(rows)],
+        "product_description": "",
+        "cf_ecozeAI": "",
+        "cf_value_extracted": None,
+    })
+
+
+class RowUpdates:
+    """_store_result() from worker-thread completions, as run_threads() does."""
+
+    def setup(self):
+        r = rng(2)
+        self.script = load_script("4-ecozeai_calculations.py")
+        self.outcomes = [(prose(r, HISTORY_KB * 1024), r.uniform(1, 500)) for _ in range(ROWS)]
+
+    def time_df_at_concurrent(self):
+        df = _sheet(ROWS)
+        journal = _NullJournal()
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            futures = {executor.submit(lambda i=i: self.outcomes[i]): i for i in range(ROWS)}
+            for future in as_completed(futures):
+                self.script._store_result(df, journal, futures[future], future.result())
+
+
+class ExcelCheckpoint:
+    """Checkpoint journal appends per row, then the single Excel write at the end."""
+
+    def setup(self):
+        r = rng(3)
+        self.script = load_script("4-ecozeai_calculations.py")
+        self.journal_class = self.script.CheckpointJournal
+        self.outcomes = [(prose(r, HISTORY_KB * 1024), r.uniform(1, 500)) for _ in range(EXCEL_ROWS)]
+        self.workdir = tempfile.mkdtemp(prefix="bench-checkpoint-")
+
+    def teardown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _paths(self):
+        excel = os.path.join(self.workdir, "results.xlsx")
+        journal = excel + ".journal.jsonl"
+        for path in (excel, journal):
+            if os.path.exists(path):
+                os.remove(path)
+        return excel, journal
+
+    def time_journal_append(self):
+        _, journal_path = self._paths()
+        df, journal = _sheet(EXCEL_ROWS), self.journal_class(journal_path)
+        for idx, outcome in enumerate(self.outcomes):
+            self.script._store_result(df, journal, idx, outcome)
+
+    def time_journal_materialise(self):
+        excel, journal_path = self._paths()
+        df, journal = _sheet(EXCEL_ROWS), self.journal_class(journal_path)
+        for idx, outcome in enumerate(self.outcomes):
+            self.script._store_result(df, journal, idx, outcome)
+        # A resumed run: restore from the journal, then write the workbook once
+        restored = _sheet(EXCEL_ROWS)
+        journal.apply(restored)
+        journal.materialise(restored, excel)
@@ -0,0 +1,70 @@
+"""
+Response parsing in the mpcffull scripts, on large synthetic model responses.
+"""
+from benchutil import load_script, prose, rng
+
+RESPONSES = 50
+RESPONSE_KB = 40
+
+
+class ExtractCfValue:
+    """4-ecozeai_calculations.extract_cf_value on analyst answers."""
+
+    def setup(self):
+        r = rng()
+        self.extract = load_script("4-ecozeai_calculations.py").extract_cf_value
+        body = [prose(r, RESPONSE_KB * 512) for _ in range(RESPONSES)]
+        # *cf_value: field line (single-pass parse) vs a mention mid-line (regex fallback)
+        self.field = [f"{text}\n*cf_value: {r.uniform(1, 500):.2f}\n{text}" for text in body]
+        self.inline = [f"{text}\nThe final cf_value = {r.uniform(1, 500):.2f} kgCO2e.\n{text}" for text in body]
+
+    def time_field(self):
+        for text in self.field:
+            self.extract(text)
+
+    def time_fallback(self):
+        for text in self.inline:
+            self.extract(text)
+
+
+class ParseAiResponse:
+    """The parse_ai_response / parse_step_* variants of scripts 1-3."""
+
+    def setup(self):
+        r = rng(1)
+        self.official = load_script("1-get_official_cfs.py").parse_ai_response
+        self.emissions = load_script("2-emissions_factors.py").parse_ai_response
+        descriptions = load_script("3-product_descriptions.py")
+        self.step_1, self.step_2 = descriptions.parse_step_1_output, descriptions.parse_step_2_output
+
+        self.records = [
+            "\n".join(
+                f"/product_name_{i} (String) = Product {i}\n/total_cf_kg (Double) = {r.uniform(1, 900):.1f}\n"
+                f"/url (String) = https://example.com/{i}.pdf\n/cradle_to_gate_cf = {r.uniform(1, 500):.1f}"
+                for i in range(1, 11)
+            ) + "\n" + prose(r, RESPONSE_KB * 256).replace("\n", "\n ")
+            for _ in range(RESPONSES)
+        ]
+        self.factors = [
+            f"*sb_cf: {r.uniform(0.1, 99):.3f}\n*sb_methodology_used: {prose(r, RESPONSE_KB * 512)}\n"
+            f"*ab_cf: {r.uniform(0.1, 99):.3f}\n*ab_methodology_used: {prose(r, RESPONSE_KB * 512)}"
+            for _ in range(RESPONSES)
+        ]
+        self.research = [f"Description: \"{prose(r, RESPONSE_KB * 1024)}\"" for _ in range(RESPONSES)]
+        self.fact_checks = [
+            f"{prose(r, RESPONSE_KB * 512)}\n*pass_or_fail: Pass\n*description: {prose(r, 400).replace(chr(10), ' ')}"
+            for _ in range(RESPONSES)
+        ]
+
+    def time_official_cf_records(self):
+        for text in self.records:
+            self.official(text)
+
+    def time_emission_factors(self):
+        for text in self.factors:
+            self.emissions(text)
+
+    def time_description_steps(self):
+        for research, fact_check in zip(self.research, self.fact_checks):
+            self.step_1(research)
+            self.step_2(fact_check)
@@ -0,0 +1,22 @@
+"""
+Shared helpers for the benchmark modules: import paths, loading the
+numbered mpcffull scripts as modules, and synthetic text.
+"""
+import os
+import random
+import sys
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MPCFFULL_DIR = os.path.join(PYTHON_DIR, "aiTesting", "mpcffull", "python_programs")
+AIMETRICS_DIR = os.path.join(PYTHON_DIR, "aiMetrics")
+
+for _path in (MPCFFULL_DIR, AIMETRICS_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# The mpcffull bench scripts share these; re-exported for the benchmark modules
+from bench_support import load_script, prose  # noqa: E402,F401
+
+
+def rng(seed=0):
+    return random.Random(seed)
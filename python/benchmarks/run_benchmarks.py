@@ -0,0 +1,239 @@
+"""
+Benchmark suite runner for the Python pipeline hot paths.
+
+Benchmarks live next to this file in bench_*.py modules, asv-style: classes
+with an optional setup() (run once per class) and time_* methods, each timed
+as one call:
+
+    class Parsing:
+        def setup(self):
+            self.texts = make_texts()
+
+        def time_extract_cf_value(self):
+            for text in self.texts:
+                extract_cf_value(text)
+
+Every run appends its results to a history file (BENCH_HISTORY, by default
+~/.cache/ecozeai/benchmarks/history.jsonl) with the git commit, and compares
+each benchmark with the median of its last --window runs on the same machine
+and Python version. Anything slower than the baseline by more than
+--threshold is flagged as a regression, and the exit status is 1.
+
+    python run_benchmarks.py                      # all benchmarks
+    python run_benchmarks.py -k parsing --no-save
+    python run_benchmarks.py --threshold 0.1 --window 10
+
+A class whose imports or setup fail (e.g. no google-cloud-firestore) is
+reported as skipped. If every benchmark is skipped nothing was measured, and
+the exit status is 1 as well.
+"""
+import argparse
+import contextlib
+import glob
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+# --- CONFIGURATION ---
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_PATH = os.getenv("BENCH_HISTORY", os.path.expanduser("~/.cache/ecozeai/benchmarks/history.jsonl"))
+REPEAT = 5                  # Timed samples per benchmark
+MIN_SAMPLE_SECONDS = 0.05   # Calls per sample are increased until a sample takes at least this long
+DEFAULT_THRESHOLD = 0.20    # Slower than baseline * (1 + threshold) is a regression
+DEFAULT_WINDOW = 5          # Previous runs the baseline is the median of
+
+
+def discover(pattern=None):
+    """[(name, class or import error)] for every benchmark class, optionally filtered by substring."""
+    sys.path.insert(0, BENCH_DIR)
+    found = []
+    for path in sorted(glob.glob(os.path.join(BENCH_DIR, "bench_*.py"))):
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            module = importlib.import_module(module_name)
+        except Exception as e:
+            found.append((module_name, e))
+            continue
+        for attr in dir(module):
+            cls = getattr(module, attr)
+            if isinstance(cls, type) and cls.__module__ == module_name and any(
+                name.startswith("time_") for name in dir(cls)
+            ):
+                found.append((f"{module_name}.{attr}", cls))
+    if pattern:
+        found = [(name, cls) for name, cls in found if pattern.lower() in name.lower()
+                 or (isinstance(cls, type) and any(pattern.lower() in m.lower() for m in dir(cls)))]
+    return found
+
+
+def time_call(fn, repeat=REPEAT):
+    """(median, min) seconds per call over `repeat` samples of auto-sized batches."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS or number >= 1000:
+            break
+        number *= 10 if elapsed < MIN_SAMPLE_SECONDS / 10 else 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return statistics.median(samples), min(samples)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hides what the code under test prints (progress bars, warnings)."""
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+        yield
+
+
+def run(benchmarks, pattern=None, repeat=REPEAT):
+    """{benchmark: {"median": s, "min": s}} plus {benchmark_or_class: skip reason}."""
+    results, skipped = {}, {}
+    for name, cls in benchmarks:
+        if isinstance(cls, Exception):
+            skipped[name] = f"{type(cls).__name__}: {cls}"
+            continue
+        methods = [m for m in sorted(dir(cls)) if m.startswith("time_")]
+        if pattern and pattern.lower() not in name.lower():
+            methods = [m for m in methods if pattern.lower() in m.lower()]
+        instance = cls()
+        try:
+            with quiet():
+                if hasattr(instance, "setup"):
+                    instance.setup()
+        except Exception as e:
+            skipped[name] = f"setup failed: {type(e).__name__}: {e}"
+            continue
+        for method in methods:
+            key = f"{name}.{method}"
+            print(f"  {key} ...", end="", flush=True)
+            try:
+                with quiet():
+                    median, best = time_call(getattr(instance, method), repeat)
+            except Exception as e:
+                skipped[key] = f"{type(e).__name__}: {e}"
+                print(" failed")
+                continue
+            results[key] = {"median": median, "min": best}
+            print(f" {_fmt(median)}")
+        if hasattr(instance, "teardown"):
+            instance.teardown()
+    return results, skipped
+
+
+# --- History ---
+
+def environment():
+    commit = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return {"machine": platform.node(), "python": platform.python_version(), "commit": commit}
+
+
+def load_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_run(results, env, path=HISTORY_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    entry = {"ts": datetime.now(timezone.utc).isoformat(), **env, "results": results}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def baselines(history, env, window=DEFAULT_WINDOW):
+    """{benchmark: median of its medians over the last `window` comparable runs}."""
+    series = {}
+    for entry in history:
+        if entry.get("machine") != env["machine"] or entry.get("python") != env["python"]:
+            continue
+        for name, result in entry["results"].items():
+            series.setdefault(name, []).append(result["median"])
+    return {name: statistics.median(values[-window:]) for name, values in series.items()}
+
+
+# --- Report ---
+
+def _fmt(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def report(results, skipped, base, threshold):
+    """Prints the comparison table; returns the names of regressed benchmarks."""
+    regressions = []
+    width = max([len(name) for name in results] + [10])
+    print(f"\n{'benchmark':<{width}}  {'median':>10}  {'baseline':>10}  {'change':>8}")
+    for name, result in results.items():
+        median = result["median"]
+        previous = base.get(name)
+        if previous is None:
+            print(f"{name:<{width}}  {_fmt(median):>10}  {'-':>10}  {'new':>8}")
+            continue
+        change = median / previous - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold / (1 + threshold):
+            flag = "  faster"
+        print(f"{name:<{width}}  {_fmt(median):>10}  {_fmt(previous):>10}  {change:>+7.1%}{flag}")
+    for name, reason in skipped.items():
+        print(f"{name:<{width}}  skipped ({reason})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline benchmarks and compare with earlier runs.")
+    parser.add_argument("-k", dest="pattern", help="Only benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Timed samples per benchmark")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Flag benchmarks slower than baseline by more than this fraction")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Earlier runs the baseline is the median of")
+    parser.add_argument("--history", default=HISTORY_PATH, help="Results history file (JSON lines)")
+    parser.add_argument("--no-save", action="store_true", help="Compare only; do not add this run to the history")
+    args = parser.parse_args()
+
+    env = environment()
+    print(f"=== Benchmarks ({env['machine']}, Python {env['python']}, commit {env['commit'] or 'n/a'}) ===")
+    results, skipped = run(discover(args.pattern), args.pattern, args.repeat)
+    base = baselines(load_history(args.history), env, args.window)
+    regressions = report(results, skipped, base, args.threshold)
+    if not results:
+        print(f"\n⚠️ No benchmark ran: nothing was measured ({len(skipped)} skipped).")
+        sys.exit(1)
+
+    if results and not args.no_save:
+        save_run(results, env, args.history)
+        print(f"\nSaved to {args.history}")
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()